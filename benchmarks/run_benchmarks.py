@@ -0,0 +1,348 @@
+"""
+Micro and macro benchmarks for the processing stages.
+
+    python -m benchmarks.run_benchmarks                          # stub tier, all resolutions
+    python -m benchmarks.run_benchmarks --save-baseline base.json
+    python -m benchmarks.run_benchmarks --compare base.json --threshold 0.25
+    python -m benchmarks.run_benchmarks --real-mediapipe         # also time the real model
+    python -m benchmarks.run_benchmarks --allocations            # per-frame allocations too
+
+Exits with status 1 when --compare finds a stage whose p50 latency regressed
+past the threshold.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from benchmarks.synthetic import RESOLUTIONS, make_frame, make_mask, make_stub_segmenter
+
+FRAME_COUNT = 8
+
+
+def _frames(resolution):
+    return [make_frame(resolution, index) for index in range(FRAME_COUNT)]
+
+
+def _masks(resolution):
+    return [make_mask(resolution, index) for index in range(FRAME_COUNT)]
+
+
+def _cycle(items):
+    state = {"i": 0}
+
+    def next_item():
+        item = items[state["i"] % len(items)]
+        state["i"] += 1
+        return item
+
+    return next_item
+
+
+# --- Micro benchmarks: one function each, fed synthetic frames and masks ---
+
+def bench_blend(resolution):
+    from processing.blend import blend
+
+    frames, masks = _frames(resolution), _masks(resolution)
+    bg = frames[-1]
+    out = np.empty_like(frames[0])
+    i = _cycle(list(zip(frames, masks)))
+
+    def run():
+        frame, mask = i()
+        blend(frame, bg, mask, out)
+    return run
+
+
+def bench_blur(motion_score):
+    def factory(resolution):
+        from processing.background_apply import apply_blur_background
+
+        i = _cycle(list(zip(_frames(resolution), _masks(resolution))))
+        out = np.empty_like(_frames(resolution)[0])
+
+        def run():
+            frame, mask = i()
+            apply_blur_background(frame, mask, motion_score, out)
+        return run
+    return factory
+
+
+def bench_pattern(resolution):
+    from processing.background_apply import apply_pattern_background
+    from processing.background_assets import BackgroundAssetManager
+
+    w, h = RESOLUTIONS[resolution]
+    assets = BackgroundAssetManager()
+    assets.register("bench", make_frame("1080p", seed=1))
+    i = _cycle(list(zip(_frames(resolution), _masks(resolution))))
+    out = np.empty_like(_frames(resolution)[0])
+
+    def run():
+        frame, mask = i()
+        apply_pattern_background(frame, mask, assets.get("bench", w, h), out)
+    return run
+
+
+def bench_glitch(resolution):
+    from processing.effects import apply_glitch
+
+    i = _cycle(list(zip(_frames(resolution), _masks(resolution))))
+    out = np.empty_like(_frames(resolution)[0])
+
+    def run():
+        frame, mask = i()
+        apply_glitch(frame, mask, out=out)
+    return run
+
+
+def bench_pixelate(resolution):
+    from processing.effects import apply_pixelation
+
+    i = _cycle(list(zip(_frames(resolution), _masks(resolution))))
+    out = np.empty_like(_frames(resolution)[0])
+
+    def run():
+        frame, mask = i()
+        apply_pixelation(frame, mask, out=out)
+    return run
+
+
+def bench_cameraman(resolution):
+    from processing.cameraman import SmartCameraman
+
+    cameraman = SmartCameraman()
+    i = _cycle(list(zip(_frames(resolution), _masks(resolution))))
+    out = np.empty_like(_frames(resolution)[0])
+
+    def run():
+        frame, mask = i()
+        cameraman.crop(frame, cameraman.compute_rect(frame.shape, mask), out=out)
+    return run
+
+
+def bench_tracking(tracking):
+    # Just the crop rectangle, without the crop itself
+    def factory(resolution):
+        from processing.cameraman import SmartCameraman
+
+        cameraman = SmartCameraman(tracking=tracking)
+        i = _cycle(list(zip(_frames(resolution), _masks(resolution))))
+
+        def run():
+            frame, mask = i()
+            cameraman.compute_rect(frame.shape, mask)
+        return run
+    return factory
+
+
+def bench_segmenter(segmenter_factory):
+    def factory(resolution):
+        segmenter = segmenter_factory()
+        i = _cycle(_frames(resolution))
+
+        def run():
+            segmenter.get_mask(i())
+        return run
+    return factory
+
+
+def bench_skin_rule(resolution):
+    from processing.skin import skin_rule
+
+    frames = _frames(resolution)
+    dst = np.empty(frames[0].shape[:2], dtype=np.uint8)
+    ycrcb = np.empty_like(frames[0])
+    i = _cycle(frames)
+
+    def run():
+        skin_rule(i(), dst, ycrcb)
+    return run
+
+
+# --- Macro benchmark: the whole LiveFeed processing chain ---
+
+def bench_chain(effect_mode, segmenter_factory):
+    def factory(resolution):
+        from processing.frame_processor import FrameProcessor
+
+        processor = FrameProcessor(segmenter=segmenter_factory())
+        processor.backgrounds.register("bench", make_frame("1080p", seed=1))
+        processor.set_effect_mode(effect_mode)
+        processor.set_selected_pattern("bench")
+
+        # LiveFeed resamples the cameraman crop straight to the widget size
+        display_size = (1280, 720)
+        display_frame = np.empty((display_size[1], display_size[0], 3), dtype=np.uint8)
+        i = _cycle(_frames(resolution))
+
+        def run():
+            processed_frame, _, rect = processor.process_uncropped(i())
+            processor.crop(processed_frame, rect, display_size, out=display_frame)
+        return run
+    return factory
+
+
+def build_cases(real_mediapipe=False):
+    cases = {
+        "blend": bench_blend,
+        "blur_static": bench_blur(0.0),
+        "blur_moving": bench_blur(0.08),
+        "pattern": bench_pattern,
+        "glitch": bench_glitch,
+        "pixelate": bench_pixelate,
+        "cameraman": bench_cameraman,
+        "tracking_contours": bench_tracking("contours"),
+        "tracking_moments": bench_tracking("moments"),
+        "segmenter_stub": bench_segmenter(make_stub_segmenter),
+        "segmenter_stub_half": bench_segmenter(lambda: make_stub_segmenter(processing_scale=0.5)),
+        "skin_rule": bench_skin_rule,
+    }
+    for mode in ("none", "blur", "pattern", "glitch", "pixelate", "blur+glitch"):
+        cases[f"chain_{mode}_stub"] = bench_chain(mode, make_stub_segmenter)
+
+    if real_mediapipe:
+        from processing.segmenter import PersonSegmenter
+
+        cases["segmenter_mediapipe"] = bench_segmenter(PersonSegmenter)
+        cases["chain_blur_mediapipe"] = bench_chain("blur", PersonSegmenter)
+
+    return cases
+
+
+def measure(run, iterations, warmup):
+    for _ in range(warmup):
+        run()
+
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - start) * 1000.0)
+
+    timings = np.array(timings)
+    mean = float(timings.mean())
+    return {
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p99_ms": float(np.percentile(timings, 99)),
+        "mean_ms": mean,
+        "fps": 1000.0 / mean if mean > 0 else 0.0,
+        "iterations": iterations,
+    }
+
+
+def measure_allocations(run, iterations, warmup):
+    """
+    Steady-state allocations per call, from tracemalloc: the peak of memory
+    allocated on top of what was live before the call. Only numpy's allocator
+    is traced, which covers the arrays cv2 hands back to Python but not
+    OpenCV's internal scratch buffers (cv::Mat temporaries inside a call).
+    """
+    for _ in range(warmup):
+        run()
+
+    tracemalloc.start()
+    peaks = []
+    try:
+        for _ in range(iterations):
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            run()
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+    finally:
+        tracemalloc.stop()
+
+    peaks = np.array(peaks) / 1024.0
+    return {"alloc_peak_p50_kb": float(np.percentile(peaks, 50)), "alloc_peak_max_kb": float(peaks.max())}
+
+
+def run_benchmarks(resolutions, iterations=50, warmup=5, name_filter=None, real_mediapipe=False, allocations=False):
+    results = {}
+    for name, factory in build_cases(real_mediapipe).items():
+        if name_filter and name_filter not in name:
+            continue
+        for resolution in resolutions:
+            key = f"{name}@{resolution}"
+            run = factory(resolution)
+            results[key] = measure(run, iterations, warmup)
+            row = results[key]
+            line = f"{key:<32} p50 {row['p50_ms']:8.2f} ms   p99 {row['p99_ms']:8.2f} ms   {row['fps']:8.1f} fps"
+            if allocations:
+                # Separate pass, tracing slows every allocation down
+                row.update(measure_allocations(run, min(iterations, 20), 0))
+                line += f"   alloc {row['alloc_peak_p50_kb']:9.1f} KB/frame"
+            print(line)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns [(key, baseline_p50, current_p50)] for every stage whose p50
+    grew by more than `threshold` (0.25 = 25%).
+    """
+    regressions = []
+    for key, row in results.items():
+        base = baseline.get("results", {}).get(key)
+        if base is None:
+            continue
+        if row["p50_ms"] > base["p50_ms"] * (1.0 + threshold):
+            regressions.append((key, base["p50_ms"], row["p50_ms"]))
+    return regressions
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "opencv_threads": cv2.getNumThreads(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the processing stages")
+    parser.add_argument("--resolutions", nargs="+", default=list(RESOLUTIONS), choices=list(RESOLUTIONS))
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--filter", default=None, help="Only run benchmarks whose name contains this")
+    parser.add_argument("--real-mediapipe", action="store_true", help="Also benchmark the real MediaPipe model")
+    parser.add_argument("--allocations", action="store_true",
+                        help="Also report the memory each call allocates on top of its reused buffers")
+    parser.add_argument("--save-baseline", default=None, help="Write results as a JSON baseline")
+    parser.add_argument("--compare", default=None, help="Baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed p50 slowdown (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.resolutions, args.iterations, args.warmup, args.filter, args.real_mediapipe,
+                             args.allocations)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump({"environment": environment(), "results": results}, f, indent=2)
+        print(f"[INFO] Baseline written to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for key, before, after in regressions:
+            print(f"[REGRESSION] {key}: p50 {before:.2f} ms -> {after:.2f} ms (+{(after / before - 1) * 100:.0f}%)")
+        if regressions:
+            return 1
+        print(f"[INFO] No stage regressed more than {args.threshold * 100:.0f}%")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
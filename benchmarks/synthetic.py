@@ -0,0 +1,86 @@
+import cv2
+import numpy as np
+
+RESOLUTIONS = {
+    "480p": (640, 480),
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+}
+
+
+def _person(w, h, index):
+    # (centre, axes) of the person ellipse and (centre, radius) of the hand in frame `index`
+    cx = w // 2 + int(20 * np.sin(index / 10.0))
+    return ((cx, int(h * 0.65)), (w // 6, h // 3)), ((cx + w // 5, int(h * 0.4)), h // 16)
+
+
+def make_frame(resolution, index=0, seed=0):
+    """
+    Synthetic RGB webcam frame: textured background, a skin-toned "person"
+    ellipse that drifts a little every frame and a raised "hand".
+    """
+    w, h = RESOLUTIONS[resolution]
+    rng = np.random.default_rng(seed)
+
+    # Smooth noise background, upscaled so it has edges but is not pure noise
+    small = rng.integers(0, 255, size=(h // 16 + 1, w // 16 + 1, 3), dtype=np.uint8)
+    frame = cv2.resize(small, (w, h), interpolation=cv2.INTER_LINEAR)
+
+    (centre, axes), (hand, radius) = _person(w, h, index)
+    cv2.ellipse(frame, centre, axes, 0, 0, 360, (205, 150, 125), -1)
+    cv2.circle(frame, hand, radius, (215, 160, 135), -1)
+    return frame
+
+
+def make_mask(resolution, index=0):
+    # uint8 0/255 mask matching make_frame's person
+    w, h = RESOLUTIONS[resolution]
+    mask = np.zeros((h, w), dtype=np.uint8)
+    (centre, axes), _ = _person(w, h, index)
+    cv2.ellipse(mask, centre, axes, 0, 0, 360, 255, -1)
+    return mask
+
+
+def make_skin_mask(resolution, index=0):
+    # uint8 0/255 mask of every skin-toned pixel make_frame draws: the person and the hand
+    w, h = RESOLUTIONS[resolution]
+    mask = make_mask(resolution, index)
+    _, (hand, radius) = _person(w, h, index)
+    cv2.circle(mask, hand, radius, 255, -1)
+    return mask
+
+
+class _StubResult:
+    def __init__(self, segmentation_mask):
+        self.segmentation_mask = segmentation_mask
+
+
+class StubModel:
+    """
+    Stands in for MediaPipe SelfieSegmentation: returns a float confidence map
+    for the synthetic person, so PersonSegmenter's own mask pipeline
+    (skin recovery, morphology, smoothing) still does all its work.
+    """
+
+    def __init__(self):
+        # One confidence map per input size, so the stub itself costs ~nothing
+        self.cache = {}
+
+    def process(self, frame_rgb):
+        h, w = frame_rgb.shape[:2]
+        confidence = self.cache.get((w, h))
+        if confidence is None:
+            confidence = np.zeros((h, w), dtype=np.float32)
+            cv2.ellipse(confidence, (w // 2, int(h * 0.65)), (w // 6, h // 3), 0, 0, 360, 1.0, -1)
+            confidence = cv2.GaussianBlur(confidence, (0, 0), 3)
+            self.cache[(w, h)] = confidence
+        return _StubResult(confidence)
+
+    def close(self):
+        pass
+
+
+def make_stub_segmenter(**kwargs):
+    from processing.segmenter import PersonSegmenter
+
+    return PersonSegmenter(backend=StubModel(), **kwargs)
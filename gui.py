@@ -1,13 +1,20 @@
+import queue
+import threading
+import tkinter as tk
 import customtkinter as ctk
-from utils.input_output import load_icon_images, save_image, save_video
+from utils.input_output import iter_icon_images, save_image, save_video, save_replay, save_trace
 from utils.live_feed import LiveFeed
-from PIL import Image
-import cv2
+from utils.pipeline import open_camera
+from processing.background_assets import BackgroundAssetManager, list_background_files
 import time
-import numpy as np
+
+# Sidebar buttons that are effects, every other button is a pattern
+EFFECT_BUTTONS = {"BLUR": "blur", "GLITCH": "glitch", "PIXELATE": "pixelate"}
+
 
 class AppWindow:
-    def __init__(self, root):
+    def __init__(self, root, segmenter_backend=None, target_fps=30, replay_budget_mb=256, started=None,
+                 segmentation_process=False, capture_size=(1920, 1080), preview_width=960, keyframe_mode=False):
         self.root = root
         self.root.title("Background Removal App")
         self.root.geometry("1500x700")
@@ -17,10 +24,12 @@ class AppWindow:
 
         # Captured image
         self.captured_image = None
+        # Full-resolution photo the worker is rendering, and when it was asked for
+        self.photo_request = None
+        self.photo_requested_at = None
 
         # Video capturing related
         self.captured_video = None
-        self.actual_fps = 30
         self.timer_label = None
         self.record_start_time = None
 
@@ -34,16 +43,29 @@ class AppWindow:
         self.left_frame = ctk.CTkFrame(self.root, fg_color="white", corner_radius=15)
         self.left_frame.grid(row=0, column=0, sticky="nsew", padx=5, pady=5)
 
-        self.video_label = ctk.CTkLabel(self.left_frame, text="")
+        # Plain Tk label: the live view reuses one PhotoImage instead of a new CTkImage per frame
+        self.video_label = tk.Label(self.left_frame, bg="white", bd=0, highlightthickness=0)
         self.video_label.place(relx=0, rely=0, relwidth=1, relheight=1)
 
-        self.cap = cv2.VideoCapture(0)
+        # Full-resolution patterns, resized once per output size
+        self.backgrounds = BackgroundAssetManager()
+        self.backgrounds.register_directory("assets/backgrounds")
 
         self.live_feed = LiveFeed(
             root=self.root,
-            cap=self.cap,
+            # Opened on the capture thread, opening a camera can take a second.
+            # Full camera resolution for photos/recordings, the live view processes preview_width
+            cap=lambda: open_camera(0, capture_size),
             video_label=self.video_label,
-            get_frame_size_callback=lambda: (self.left_frame.winfo_width(), self.left_frame.winfo_height())
+            get_frame_size_callback=lambda: (self.video_label.winfo_width(), self.video_label.winfo_height()),
+            backgrounds=self.backgrounds,
+            segmenter_backend=segmenter_backend,
+            target_fps=target_fps,
+            replay_budget_mb=replay_budget_mb,
+            started=started,
+            segmentation_process=segmentation_process,
+            preview_width=preview_width,
+            keyframe_mode=keyframe_mode,
         )
 
         # Sidebar (filters)
@@ -57,10 +79,18 @@ class AppWindow:
 
         self.pattern_buttons = []
         self.selected_button = None
+        # Buttons whose effects are stacked (shift-click adds/removes one)
+        self.effect_stack = []
+        self.shift_click = False
 
-        self.icon_images = load_icon_images("assets/backgrounds")
+        # Buttons show the names right away, thumbnails are decoded (or read from the
+        # on-disk cache) on a background thread and filled in as they arrive
+        self.background_files = list_background_files("assets/backgrounds")
+        self.thumbnail_queue = queue.Queue()
 
         self.add_sidebar_buttons()
+        threading.Thread(target=self.load_thumbnails, name="thumbnails", daemon=True).start()
+        self.root.after(50, self.poll_thumbnails)
 
         # Bottom bar (controls)
         self.bottom_bar = ctk.CTkFrame(self.root, fg_color="#1a1a1a", corner_radius=15)
@@ -84,8 +114,29 @@ class AppWindow:
         )
         self.record_video_btn.pack(side="left", padx=20, pady=20)
 
+        # Writes the always-on replay buffer out while the live feed keeps running
+        self.replay_btn = ctk.CTkButton(
+            self.bottom_bar, text="SAVE LAST 30 S", **self.action_btn_style, command=self.save_replay
+        )
+        self.replay_btn.pack(side="left", padx=20, pady=20)
+        self.replay_export = None
+
+        # Record raw frames + masks, so the background can be changed after the fact
+        self.capture_raw_switch = ctk.CTkSwitch(
+            self.bottom_bar, text="RAW + MASK", font=ctk.CTkFont(size=14, weight="bold"),
+            command=lambda: self.live_feed.set_capture_raw(bool(self.capture_raw_switch.get())),
+        )
+        self.capture_raw_switch.pack(side="left", padx=20, pady=20)
+
         self.action_buttons = []
 
+        # Diagnostics: F9 toggles the FPS/latency overlay, F10 exports a Chrome trace
+        self.root.bind("<F9>", lambda event: self.live_feed.toggle_overlay())
+        self.root.bind("<F10>", lambda event: save_trace(self.live_feed))
+
+        # Runs once the main loop is up, i.e. the window is on screen
+        self.root.after_idle(lambda: self.live_feed.tracer.mark_startup("window"))
+
     # Sidebar buttons
     def add_sidebar_buttons(self):
         label = ctk.CTkLabel(self.sidebar, text="PATTERNS", font=ctk.CTkFont(size=20, weight="bold"))
@@ -95,20 +146,47 @@ class AppWindow:
         self.add_pattern_button("BLUR")
         self.add_pattern_button("GLITCH")
         self.add_pattern_button("PIXELATE")
-        for name, pil_img in self.icon_images:
-            self.add_pattern_button(name, pil_img)
-
-    def add_pattern_button(self, name, image=None):
+        for name, _ in self.background_files:
+            self.add_pattern_button(name, thumbnail=True)
+
+    def load_thumbnails(self):
+        # Background thread: PIL images only, the CTkImages are made on the Tk thread
+        for name, pil_img in iter_icon_images(self.background_files):
+            self.thumbnail_queue.put((name, pil_img))
+        self.thumbnail_queue.put(None)
+
+    def poll_thumbnails(self):
+        while True:
+            try:
+                item = self.thumbnail_queue.get_nowait()
+            except queue.Empty:
+                self.root.after(50, self.poll_thumbnails)
+                return
+            if item is None:
+                self.live_feed.tracer.mark_startup("thumbnails")
+                return
+            self.set_pattern_image(*item)
+
+    def thumbnail_photo(self, image, button_width=280, button_height=150):
+        max_width = button_width - 20
+        max_height = button_height - 20
+        img_w, img_h = image.size
+        scale = min(max_width / img_w, max_height / img_h)
+        new_size = (int(img_w * scale), int(img_h * scale))
+        resized_image = image.resize(new_size)
+        return ctk.CTkImage(light_image=resized_image, dark_image=resized_image, size=new_size)
+
+    def set_pattern_image(self, name, image):
+        for button in self.pattern_buttons:
+            if getattr(button, "_name", None) == name:
+                button.configure(image=self.thumbnail_photo(image), text=" ")
+
+    def add_pattern_button(self, name, image=None, thumbnail=False):
+        # thumbnail: a pattern whose image comes later, sized like one meanwhile
         button_width = 280
         button_height = 150
         if image:
-            max_width = button_width - 20
-            max_height = button_height - 20
-            img_w, img_h = image.size
-            scale = min(max_width / img_w, max_height / img_h)
-            new_size = (int(img_w * scale), int(img_h * scale))
-            resized_image = image.resize(new_size)
-            photo = ctk.CTkImage(light_image=resized_image, dark_image=resized_image, size=new_size)
+            photo = self.thumbnail_photo(image, button_width, button_height)
 
             button = ctk.CTkButton(
                 self.sidebar,
@@ -128,7 +206,7 @@ class AppWindow:
                 self.sidebar,
                 text=name,
                 width=280,
-                height=100,
+                height=button_height if thumbnail else 100,
                 corner_radius=20,
                 fg_color="#222",
                 hover_color="#333",
@@ -139,61 +217,99 @@ class AppWindow:
 
 
         button.pack(pady=10)
+        # Shift-click stacks the effect on the current ones, the press comes before the command
+        button.bind("<Shift-Button-1>", lambda event: self.mark_shift_click())
         button._name = name  # assign the identifier
         self.pattern_buttons.append(button)
 
+    def mark_shift_click(self):
+        self.shift_click = True
+
     def select_button(self, name):
-        # For UI Highlight
-        for btn in self.pattern_buttons:
-            btn.configure(border_width=0, border_color=btn.cget("fg_color"))
+        stack = self.shift_click and name != "DISCARD"
+        self.shift_click = False
+
+        if not stack:
+            self.effect_stack = [] if name == "DISCARD" else [name]
+        elif name in self.effect_stack:
+            self.effect_stack.remove(name)
+        else:
+            # Only one pattern at a time
+            if name not in EFFECT_BUTTONS:
+                self.effect_stack = [n for n in self.effect_stack if n in EFFECT_BUTTONS]
+            self.effect_stack.append(name)
 
+        # For UI Highlight
+        highlighted = self.effect_stack or ["DISCARD"]
         for btn in self.pattern_buttons:
-            if getattr(btn, "_name", None) == name:
+            if getattr(btn, "_name", None) in highlighted:
                 btn.configure(border_width=3, border_color="blue")
-                self.selected_button = name
-                break
+            else:
+                btn.configure(border_width=0, border_color=btn.cget("fg_color"))
+        self.selected_button = name
 
         #For Applying Effect To The Live Feed
-        if name == "DISCARD":
-            self.live_feed.set_effect_mode("none")
-            self.live_feed.set_selected_pattern(None)
-        elif name == "BLUR":
-            self.live_feed.set_effect_mode("blur")
-            self.live_feed.set_selected_pattern(None)
-        elif name == "GLITCH":
-            self.live_feed.set_effect_mode("glitch")
-        elif name == "PIXELATE":
-            self.live_feed.set_effect_mode("pixelate")
-        else:
-            self.live_feed.set_effect_mode("pattern")
-
-            for pat_name, pil_img in self.icon_images:
-                if pat_name == name:
-                    self.live_feed.set_selected_pattern(np.array(pil_img))
-                    break
+        modes = [EFFECT_BUTTONS.get(n, "pattern") for n in self.effect_stack]
+        pattern = next((n for n in self.effect_stack if n not in EFFECT_BUTTONS), None)
+        self.live_feed.set_selected_pattern(pattern)
+        self.live_feed.set_effect_mode("+".join(modes) or "none")
 
     def take_photo(self):
-        # get last processed frame from LiveFeed
-        processed = self.live_feed.last_processed_frame
-        if processed is None:
-            return  # camera not initialized yet
+        if self.live_feed.last_frame is None or self.photo_request is not None:
+            return  # camera not initialized yet, or a photo is on its way
+
+        # The worker renders its next frame at the camera's full resolution
+        self.take_photo_btn.configure(state="disabled")
+        self.photo_request = self.live_feed.request_full_frame()
+        self.photo_requested_at = time.time()
+        self.check_photo()
+
+    def check_photo(self):
+        # Polled from the Tk loop until the worker has rendered the photo
+        request = self.photo_request
+        if not request.done() and time.time() - self.photo_requested_at < 1.0:
+            self.root.after(15, self.check_photo)
+            return
+        self.photo_request = None
+
+        if request.done():
+            processed = request.result()
+        else:
+            # No frame came through in time (model still loading), keep the live view's last one;
+            # the worker still answers the abandoned request later, nobody reads it
+            processed = self.live_feed.get_last_processed_frame()
+            if processed is None:
+                self.take_photo_btn.configure(state="normal")
+                return
+            processed = processed.copy()
 
-        self.captured_image = processed.copy()
-        img = Image.fromarray(processed)
+        self.captured_image = processed
 
         self.live_feed.pause()
-        self.display_image(img)
+        self.display_image(self.captured_image)
 
-        self.take_photo_btn.configure(state="disabled")
         self.record_video_btn.configure(state="disabled")
         self.show_action_buttons(photo_mode=True)
 
-    def display_image(self, img):
-        img = img.resize((self.left_frame.winfo_width(), self.left_frame.winfo_height()))
-        imgtk = ctk.CTkImage(light_image=img, dark_image=img,
-                             size=(self.left_frame.winfo_width(), self.left_frame.winfo_height()))
-        self.video_label.configure(image=imgtk)
-        self.video_label.imgtk = imgtk
+    def save_replay(self):
+        self.replay_export = save_replay(self.live_feed, seconds=30)
+        if self.replay_export is not None:
+            self.replay_btn.configure(state="disabled", text="SAVING...")
+            self.check_replay_export()
+
+    def check_replay_export(self):
+        # Polled from the Tk loop, the export runs on its own thread
+        if not self.replay_export.is_done():
+            self.root.after(200, self.check_replay_export)
+            return
+        if self.replay_export.error is None:
+            print(f"[INFO] Saved replay to {self.replay_export.file_path} ({self.replay_export.frame_count} frames)")
+        self.replay_export = None
+        self.replay_btn.configure(state="normal", text="SAVE LAST 30 S")
+
+    def display_image(self, frame):
+        # RGB numpy frame, scaled once into the live view's Tk image
+        self.live_feed.show_still(frame)
 
     def start_recording(self):
         self.live_feed.resume()
@@ -214,6 +330,7 @@ class AppWindow:
 
         self.take_photo_btn.configure(state="disabled")
         self.record_video_btn.configure(state="disabled")
+        self.capture_raw_switch.configure(state="disabled")
         self.add_action_stop_recording()
 
         self.update_timer()
@@ -260,16 +377,18 @@ class AppWindow:
         self.show_action_buttons(photo_mode=False)
 
         self.live_feed.pause()
-        recorded_frames = self.live_feed.stop_recording()
-        elapsed_time = time.time() - self.record_start_time
-        frame_count = len(recorded_frames)
-        self.actual_fps = frame_count / elapsed_time if elapsed_time > 0 else 30
-
-        if recorded_frames:
-            self.captured_video = recorded_frames.copy()
-            last_frame = recorded_frames[-1]
-            img = Image.fromarray(last_frame)
-            self.display_image(img)
+        recording = self.live_feed.stop_recording()
+
+        if recording is not None and recording.dropped_frames:
+            print(f"[INFO] The encoder fell behind on {recording.dropped_frames} frames, "
+                  f"their slots repeat the previous frame")
+        if recording is not None and recording.frame_count > 0:
+            self.captured_video = recording
+            self.display_image(recording.last_frame)
+        elif recording is not None:
+            if recording.error:
+                print(f"[ERROR] Recording failed: {recording.error}")
+            recording.discard()
 
     def discard(self):
         for btn in getattr(self, "action_buttons", []):
@@ -282,8 +401,14 @@ class AppWindow:
 
         self.captured_image = None
 
+        # Drop the temporary recording if it was not saved
+        if self.captured_video is not None:
+            self.captured_video.discard()
+            self.captured_video = None
+
         self.take_photo_btn.configure(state="normal")
         self.record_video_btn.configure(state="normal")
+        self.capture_raw_switch.configure(state="normal")
 
         self.live_feed.resume()
 
@@ -293,14 +418,21 @@ class AppWindow:
     def save(self, photo_mode):
         if photo_mode and self.captured_image is not None:
             save_image(self.captured_image)
-        elif not photo_mode and self.captured_video:
-            save_video(self.captured_video, self.actual_fps)
+        elif not photo_mode and self.captured_video is not None:
+            if save_video(self.captured_video):
+                self.captured_video = None
 
         self.discard()
 
     def on_close(self):
-        if hasattr(self, "cap") and self.cap.isOpened():
-            self.cap.release()
+        # Stop the capture/processing threads before releasing the camera
+        # Also releases the camera
+        self.live_feed.stop()
+        # Let a replay export finish its file
+        if self.replay_export is not None:
+            self.replay_export.wait()
+        if self.captured_video is not None:
+            self.captured_video.discard()
         self.root.destroy()
 
 
@@ -1,8 +1,152 @@
-import tkinter as tk
-from gui import AppWindow
+import argparse
+import time
+
+# Startup time is measured from here (see PerfTracer.mark_startup)
+STARTED = time.perf_counter()
+
+
+def run_gui(backend=None, target_fps=30, replay_budget_mb=256, segmentation_process=False, capture_size=(1920, 1080),
+            preview_width=960, keyframe_mode=False):
+    import tkinter as tk
+    from gui import AppWindow
 
-if __name__ == "__main__":
     root = tk.Tk()
-    app = AppWindow(root)
+    app = AppWindow(root, segmenter_backend=backend, target_fps=target_fps, replay_budget_mb=replay_budget_mb,
+                    started=STARTED, segmentation_process=segmentation_process, capture_size=capture_size,
+                    preview_width=preview_width, keyframe_mode=keyframe_mode)
     root.protocol("WM_DELETE_WINDOW", app.on_close)
-    root.mainloop()
\ No newline at end of file
+    root.mainloop()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Background Removal App")
+    parser.add_argument("--backend", default=None,
+                        help="Segmentation backend: auto, mediapipe_general, mediapipe_landscape, tflite, "
+                             "classical_mog2, classical_knn (default: mediapipe_landscape)")
+    parser.add_argument("--frame-budget-ms", type=float, default=20.0,
+                        help="Segmentation budget used by --backend auto")
+    parser.add_argument("--target-fps", type=float, default=30.0,
+                        help="Frame rate the live view lowers quality to hold (default: 30)")
+    parser.add_argument("--replay-budget-mb", type=float, default=256.0,
+                        help="Memory for the compressed last-30-seconds replay, 0 turns it off (default: 256)")
+    parser.add_argument("--segmentation-process", action="store_true",
+                        help="Segment in a worker process, one frame ahead of compositing")
+    parser.add_argument("--keyframes", action="store_true",
+                        help="Run the model on keyframes only and carry the mask forward with optical flow "
+                             "in between (GUI, batch and serve)")
+    parser.add_argument("--capture-size", type=int, nargs=2, metavar=("W", "H"), default=None,
+                        help="Camera resolution to ask for, used for photos and recordings (default: 1920 1080 "
+                             "with a preview, the camera's own size with --preview-width 0)")
+    parser.add_argument("--preview-width", type=int, default=960,
+                        help="Width the live view processes at, 0 processes frames as captured (default: 960)")
+    subparsers = parser.add_subparsers(dest="command")
+
+    batch = subparsers.add_parser("batch", help="Process video files without the GUI")
+    batch.add_argument("inputs", nargs="+", help="Input video files")
+    batch.add_argument("--effect", default="blur",
+                       help="none, blur, glitch, pixelate or pattern:<image path>, stack with + "
+                            "e.g. blur+glitch (default: blur)")
+    batch.add_argument("--output-dir", default=None, help="Where to write <name>_processed.mp4")
+    batch.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    batch.add_argument("--chunk-frames", type=int, default=None, help="Frames per chunk")
+    batch.add_argument("--overlap", type=int, default=15, help="Warm-up frames before each chunk")
+    batch.add_argument("--no-cameraman", action="store_true", help="Disable the SmartCameraman crop")
+
+    rerender = subparsers.add_parser("rerender", help="Render a raw + mask capture with any effect, no segmentation")
+    rerender.add_argument("capture", help="Capture directory (.capture) recorded with RAW + MASK")
+    rerender.add_argument("output", help="Output video file")
+    rerender.add_argument("--effect", default="blur", help="Same format as batch --effect (default: blur)")
+    rerender.add_argument("--start", type=int, default=0, help="First frame")
+    rerender.add_argument("--end", type=int, default=None, help="Frame to stop before (default: the end)")
+    rerender.add_argument("--no-cameraman", action="store_true", help="Disable the SmartCameraman crop")
+
+    serve = subparsers.add_parser("serve", help="Process several cameras/files headless, served as MJPEG over HTTP")
+    serve.add_argument("sources", nargs="+", help="Camera indexes (0, 1, ...) or video files/URLs")
+    serve.add_argument("--effect", default="blur", help="Same format as batch --effect (default: blur)")
+    serve.add_argument("--port", type=int, default=8080, help="localhost port (default: 8080)")
+    serve.add_argument("--workers", type=int, default=None, help="Shared processing threads (default: one per "
+                                                                  "source, at most one per core)")
+    serve.add_argument("--output-size", type=int, nargs=2, metavar=("W", "H"), default=None,
+                       help="Resample the output to W H (default: the source size)")
+    serve.add_argument("--quality", type=int, default=80, help="JPEG quality (default: 80)")
+    serve.add_argument("--no-cameraman", action="store_true", help="Disable the SmartCameraman crop")
+
+    subparsers.add_parser("probe-backends", help="Time every segmentation backend on this machine")
+
+    compare = subparsers.add_parser("compare-scales", help="Compare mask quality and latency per processing scale")
+    compare.add_argument("source", help="Video file or camera index")
+    compare.add_argument("--scales", type=float, nargs="+", default=[1.0, 0.5, 0.25])
+    compare.add_argument("--refine", nargs="+", default=["bilinear", "guided"], choices=["bilinear", "guided"])
+    compare.add_argument("--frames", type=int, default=120, help="Number of frames to compare")
+
+    return parser
+
+
+def check_effect_spec(parser, effect_spec):
+    # A bad --effect is a usage error, reported before any worker starts
+    from utils.batch import parse_effect_spec
+
+    try:
+        parse_effect_spec(effect_spec)
+    except ValueError as e:
+        parser.error(str(e))
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command in ("batch", "serve", "rerender"):
+        check_effect_spec(parser, args.effect)
+
+    backend = args.backend
+    if backend is not None or args.command == "probe-backends":
+        from processing.seg_backends import resolve_backend
+
+        backend = resolve_backend("auto" if args.command == "probe-backends" else backend, args.frame_budget_ms)
+
+    if args.command == "probe-backends":
+        return
+    elif args.command == "batch":
+        from utils.batch import run_batch
+
+        run_batch(
+            args.inputs,
+            args.effect,
+            output_dir=args.output_dir,
+            workers=args.workers,
+            chunk_frames=args.chunk_frames,
+            overlap=args.overlap,
+            use_cameraman=not args.no_cameraman,
+            backend=backend,
+            keyframe_mode=args.keyframes,
+        )
+    elif args.command == "serve":
+        from utils.server import run_server
+
+        run_server(args.sources, args.effect, workers=args.workers, port=args.port,
+                   use_cameraman=not args.no_cameraman, backend=backend, output_size=args.output_size,
+                   jpeg_quality=args.quality, keyframe_mode=args.keyframes)
+    elif args.command == "rerender":
+        from utils.mask_capture import rerender_capture
+
+        rerender_capture(args.capture, args.effect, args.output, use_cameraman=not args.no_cameraman,
+                         start=args.start, end=args.end)
+    elif args.command == "compare-scales":
+        from utils.mask_quality import load_frames, compare_processing_scales, print_comparison
+
+        frames = load_frames(args.source, args.frames)
+        if not frames:
+            print(f"[ERROR] No frames read from {args.source}")
+            return
+        print_comparison(compare_processing_scales(frames, args.scales, args.refine))
+    else:
+        capture_size = args.capture_size
+        if capture_size is None and args.preview_width:
+            # The preview is what makes a large capture affordable
+            capture_size = (1920, 1080)
+        run_gui(backend, args.target_fps, args.replay_budget_mb, args.segmentation_process,
+                tuple(capture_size) if capture_size else None, args.preview_width or None, args.keyframes)
+
+
+if __name__ == "__main__":
+    main()
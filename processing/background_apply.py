@@ -1,8 +1,13 @@
 import cv2
 import numpy as np
 
+from processing.blend import blend
+from processing.blur import BlurEngine
 
-def apply_blur_background(frame_rgb, mask, motion_score=0.0):
+_default_blur_engine = BlurEngine()
+
+
+def blur_kernel_size(motion_score=0.0):
     # --- DOCUMENTATION ALIGNMENT: Adaptive Gaussian Kernel ---
     # The blur strength adapts based on the motion score.
     # Less motion = softer blur (e.g., 21).
@@ -17,24 +22,26 @@ def apply_blur_background(frame_rgb, mask, motion_score=0.0):
     total_k = base_k + adaptive_k
     if total_k % 2 == 0:
         total_k += 1
+    return total_k
 
-    # Apply the Adaptive Gaussian Kernel
-    blurred_bg = cv2.GaussianBlur(frame_rgb, (total_k, total_k), 0)
 
-    mask_3c = np.repeat(mask, 3, axis=2)
+def apply_blur_background(frame_rgb, mask, motion_score=0.0, out=None, engine=None):
+    total_k = blur_kernel_size(motion_score)
 
-    # Blend
-    out = frame_rgb * mask_3c + blurred_bg * (1.0 - mask_3c)
-    return out.astype(np.uint8)
+    # Apply the Adaptive Gaussian Kernel
+    # The engine runs big kernels on a pyramid level, so the cost stays flat as total_k grows
+    if engine is None:
+        engine = _default_blur_engine
+    return engine.composite(frame_rgb, mask, total_k, out)
 
 
-def apply_pattern_background(frame_rgb, mask, pattern_img):
+def apply_pattern_background(frame_rgb, mask, pattern_img, out=None):
     if isinstance(pattern_img, np.ndarray):
         bg = pattern_img
     else:
         bg = np.array(pattern_img)  # Fixed typo from ndarray to array
 
-    bg = cv2.resize(bg, (frame_rgb.shape[1], frame_rgb.shape[0]))
-    mask_3c = np.repeat(mask, 3, axis=2)
-    out = frame_rgb * mask_3c + bg * (1.0 - mask_3c)
-    return out.astype(np.uint8)
\ No newline at end of file
+    # Buffers from BackgroundAssetManager already match the frame size
+    if bg.shape[:2] != frame_rgb.shape[:2]:
+        bg = cv2.resize(bg, (frame_rgb.shape[1], frame_rgb.shape[0]))
+    return blend(frame_rgb, bg, mask, out)
@@ -0,0 +1,127 @@
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+from PIL import Image
+
+
+def list_background_files(directory_path, extensions=(".jpg",)):
+    """
+    Returns [(name, path)] for every background image in a directory, sorted by name.
+    """
+    if not os.path.exists(directory_path):
+        return []
+
+    files = []
+    for file in sorted(os.listdir(directory_path)):
+        if file.lower().endswith(extensions):
+            files.append((os.path.splitext(file)[0], os.path.join(directory_path, file)))
+    return files
+
+
+class BackgroundAssetManager:
+    """
+    Loads every pattern once at full resolution and keeps RGB copies resized
+    to the output size in an LRU cache (keyed by pattern, width, height) with a
+    memory cap. The compositor gets a buffer it can blend directly.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+
+        self.sources = {}
+        self.originals = {}
+        self.cache = OrderedDict()
+        self.cache_bytes = 0
+
+        # Patterns are selected on the Tk thread and read on the processing thread
+        self.lock = threading.Lock()
+
+    def register(self, name, source):
+        # source: image path, PIL image or RGB ndarray
+        with self.lock:
+            self.sources[name] = source
+            self.originals.pop(name, None)
+            self._evict_pattern(name)
+
+    def register_directory(self, directory_path):
+        for name, path in list_background_files(directory_path):
+            self.register(name, path)
+
+    def names(self):
+        return list(self.sources)
+
+    def _load(self, name):
+        source = self.sources[name]
+        if isinstance(source, np.ndarray):
+            img = source
+        elif isinstance(source, Image.Image):
+            img = np.array(source.convert("RGB"))
+        else:
+            img = np.array(Image.open(source).convert("RGB"))
+        return np.ascontiguousarray(img)
+
+    def get_original(self, name):
+        with self.lock:
+            if name not in self.sources:
+                return None
+            if name not in self.originals:
+                try:
+                    self.originals[name] = self._load(name)
+                except Exception as e:
+                    print(f"[ERROR] Could not load background '{name}': {e}")
+                    return None
+            return self.originals[name]
+
+    def get(self, name, width, height):
+        """
+        Returns the pattern as a uint8 RGB (height, width, 3) array, resized once
+        per output size.
+        """
+        key = (name, width, height)
+        with self.lock:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.cache.move_to_end(key)
+                return cached
+
+        original = self.get_original(name)
+        if original is None:
+            return None
+
+        if original.shape[:2] == (height, width):
+            # Already the right size: the original is kept anyway, caching it would count its bytes twice
+            return original
+
+        # INTER_AREA when shrinking, linear when the pattern is smaller than the frame
+        shrinking = original.shape[1] > width and original.shape[0] > height
+        interpolation = cv2.INTER_AREA if shrinking else cv2.INTER_LINEAR
+        resized = cv2.resize(original, (width, height), interpolation=interpolation)
+
+        with self.lock:
+            # Another thread may have resized the same key meanwhile, keep its copy
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.cache.move_to_end(key)
+                return cached
+            self.cache[key] = resized
+            self.cache_bytes += resized.nbytes
+            self._evict()
+        return resized
+
+    def _evict(self):
+        # Least recently used first, but never the entry that was just added
+        while self.cache_bytes > self.max_bytes and len(self.cache) > 1:
+            _, buffer = self.cache.popitem(last=False)
+            self.cache_bytes -= buffer.nbytes
+
+    def _evict_pattern(self, name):
+        for key in [key for key in self.cache if key[0] == name]:
+            self.cache_bytes -= self.cache.pop(key).nbytes
+
+    def clear(self):
+        with self.lock:
+            self.cache.clear()
+            self.cache_bytes = 0
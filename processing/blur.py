@@ -0,0 +1,197 @@
+import math
+
+import cv2
+import numpy as np
+
+from processing.blend import blend
+from processing.buffer_pool import get_buffer
+
+# Largest Gaussian kernel run at the reduced resolution, per quality level
+QUALITY_LEVELS = {
+    "high": 15,
+    "medium": 9,
+    "low": 5,
+}
+
+
+def kernel_to_sigma(ksize):
+    # Same rule OpenCV uses for GaussianBlur(..., sigma=0)
+    return 0.3 * ((ksize - 1) * 0.5 - 1) + 0.8
+
+
+class BlurEngine:
+    """
+    Gaussian background blur whose cost does not grow with the kernel size.
+
+    Large kernels are run as a pyramid: the frame is shrunk by 2^levels with
+    INTER_AREA, blurred with a small Gaussian carrying the remaining sigma and
+    upsampled again. The number of levels is picked so the small kernel never
+    exceeds the quality level's limit, so a 61x61 blur costs about the same as
+    a 21x21 one.
+
+    composite() works tile by tile: tiles the mask marks as fully foreground
+    are copied from the frame and never blurred (only the shrink step still
+    sees the whole frame), fully background tiles skip the blend.
+    """
+
+    def __init__(self, quality="medium", tile_size=160, skip_foreground=True):
+        self.quality = quality
+        self.tile_size = tile_size
+        self.skip_foreground = skip_foreground
+
+    def set_quality(self, quality):
+        if quality not in QUALITY_LEVELS:
+            raise ValueError(f"Unknown blur quality '{quality}'")
+        self.quality = quality
+
+    def plan(self, ksize):
+        """
+        Returns (levels, sigma_small): how many times to halve the frame and
+        the Gaussian sigma to apply at that size.
+        """
+        sigma = kernel_to_sigma(ksize)
+        max_kernel = QUALITY_LEVELS[self.quality]
+        if ksize <= max_kernel:
+            return 0, sigma
+
+        levels = max(1, math.ceil(math.log2(ksize / max_kernel)))
+        factor = 2 ** levels
+
+        # The box downsample already blurs by roughly (f^2 - 1) / 12 (in px^2),
+        # only the rest has to come from the small Gaussian
+        remaining = max(sigma ** 2 - (factor ** 2 - 1) / 12.0, 0.25 * factor ** 2)
+        return levels, math.sqrt(remaining) / factor
+
+    def footprint(self, ksize, frame_shape):
+        """
+        (margin_x, margin_y, align, wraps_x) for running composite() on part
+        of a frame: a region grown by the margins and snapped to multiples of
+        align gives exactly the full-frame result inside the original region.
+        None when the pyramid grid does not divide the frame, then only the
+        full frame is exact.
+        """
+        levels, sigma_small = self.plan(ksize)
+        if levels == 0:
+            return ksize // 2, ksize // 2, 1, False
+
+        factor = 2 ** levels
+        h, w = frame_shape[:2]
+        if w % factor or h % factor:
+            return None
+
+        # Radius OpenCV picks for a uint8 Gaussian with ksize (0, 0), plus one
+        # small pixel for the bilinear upsample
+        reach = (int(round(sigma_small * 6 + 1)) | 1) // 2
+        margin = factor * (reach + 1)
+        return margin, margin, factor, False
+
+    def blur_small(self, frame_rgb, ksize):
+        """
+        Returns (blurred, factor) where blurred is the background at 1/factor size.
+        """
+        levels, sigma_small = self.plan(ksize)
+        if levels == 0:
+            blurred = get_buffer("blur_full", frame_rgb.shape)
+            return cv2.GaussianBlur(frame_rgb, (ksize, ksize), 0, dst=blurred), 1
+
+        factor = 2 ** levels
+        h, w = frame_rgb.shape[:2]
+        small_size = (max(1, w // factor), max(1, h // factor))
+        small = get_buffer("blur_small", (small_size[1], small_size[0]) + frame_rgb.shape[2:])
+        small = cv2.resize(frame_rgb, small_size, dst=small, interpolation=cv2.INTER_AREA)
+        cv2.GaussianBlur(small, (0, 0), sigma_small, dst=small)
+        return small, factor
+
+    def blur(self, frame_rgb, ksize):
+        small, factor = self.blur_small(frame_rgb, ksize)
+        if factor == 1:
+            return small
+        h, w = frame_rgb.shape[:2]
+        blurred = get_buffer("blur_full", frame_rgb.shape)
+        return cv2.resize(small, (w, h), dst=blurred, interpolation=cv2.INTER_LINEAR)
+
+    def blur_region(self, frame_rgb, ksize, small, factor, region):
+        """
+        blur(frame_rgb, ksize)[y0:y1, x0:x1] for region (x0, y0, x1, y1) and
+        the blur_small() result of frame_rgb (None without pyramid levels),
+        computed from that region alone (plus the kernel's reach), with the
+        same values as the whole-frame blur.
+        """
+        x0, y0, x1, y1 = region
+        h, w = frame_rgb.shape[:2]
+        if factor == 1:
+            # Full-resolution Gaussian on the region grown by the kernel radius; at the
+            # frame edge the crop edge is the frame edge, so the border handling matches
+            reach = ksize // 2
+            rx0, ry0 = max(0, x0 - reach), max(0, y0 - reach)
+            rx1, ry1 = min(w, x1 + reach), min(h, y1 + reach)
+            grown = get_buffer("blur_tile", (ry1 - ry0, rx1 - rx0) + frame_rgb.shape[2:])
+            grown = cv2.GaussianBlur(frame_rgb[ry0:ry1, rx0:rx1], (ksize, ksize), 0, dst=grown)
+            return grown[y0 - ry0:y1 - ry0, x0 - rx0:x1 - rx0]
+
+        # Bilinear upsample of the small pixels under the region plus one on each
+        # side. The crop starts on a small pixel, so every output pixel samples the
+        # same small coordinates as in the whole-frame resize
+        small_h, small_w = small.shape[:2]
+        sx0, sy0 = max(0, x0 // factor - 1), max(0, y0 // factor - 1)
+        sx1 = min(small_w, -(-x1 // factor) + 1)
+        sy1 = min(small_h, -(-y1 // factor) + 1)
+        size = ((sx1 - sx0) * factor, (sy1 - sy0) * factor)
+        grown = get_buffer("blur_tile", (size[1], size[0]) + frame_rgb.shape[2:])
+        grown = cv2.resize(small[sy0:sy1, sx0:sx1], size, dst=grown, interpolation=cv2.INTER_LINEAR)
+        ox, oy = x0 - sx0 * factor, y0 - sy0 * factor
+        return grown[oy:oy + y1 - y0, ox:ox + x1 - x0]
+
+    def composite(self, frame_rgb, mask, ksize, out=None, source=None):
+        """
+        Blurred background behind the unblurred person. mask is uint8 (0-255).
+        source: the image to blur (default frame_rgb), e.g. an earlier effect's output.
+        """
+        if source is None:
+            source = frame_rgb
+        if not self.skip_foreground:
+            return blend(frame_rgb, self.blur(source, ksize), mask, out)
+
+        # Without pyramid levels the regions are blurred straight from the source
+        small, factor = self.blur_small(source, ksize) if self.plan(ksize)[0] else (None, 1)
+        h, w = frame_rgb.shape[:2]
+        blurred = None
+        if factor > 1 and (w % factor or h % factor):
+            # The upsample does not scale by exactly factor, only the whole frame is exact
+            blurred = self.blur(source, ksize)
+        if out is None:
+            out = np.empty_like(frame_rgb)
+
+        # Tile by tile: fully foreground tiles keep the frame and are never blurred,
+        # fully background tiles take the blur, only tiles on the person's edge are
+        # blended. The rest of a tile row is blurred as one region per run of tiles
+        tile_size = self.tile_size
+        for y0 in range(0, h, tile_size):
+            y1 = min(h, y0 + tile_size)
+            tiles = []
+            for x0 in range(0, w, tile_size):
+                x1 = min(w, x0 + tile_size)
+                tile_mask = mask[y0:y1, x0:x1]
+                if tile_mask.min() == 255:
+                    out[y0:y1, x0:x1] = frame_rgb[y0:y1, x0:x1]
+                else:
+                    tiles.append((x0, x1, tile_mask))
+
+            start = 0
+            while start < len(tiles):
+                end = start + 1
+                while end < len(tiles) and tiles[end][0] == tiles[end - 1][1]:
+                    end += 1
+                rx0, rx1 = tiles[start][0], tiles[end - 1][1]
+                if blurred is not None:
+                    row = blurred[y0:y1, rx0:rx1]
+                else:
+                    row = self.blur_region(source, ksize, small, factor, (rx0, y0, rx1, y1))
+                for x0, x1, tile_mask in tiles[start:end]:
+                    background = row[:, x0 - rx0:x1 - rx0]
+                    if tile_mask.max() == 0:
+                        out[y0:y1, x0:x1] = background
+                    else:
+                        blend(frame_rgb[y0:y1, x0:x1], background, tile_mask, out[y0:y1, x0:x1])
+                start = end
+        return out
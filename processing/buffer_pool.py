@@ -0,0 +1,86 @@
+import threading
+
+import numpy as np
+
+
+class BufferPool:
+    """
+    Reusable arrays for the per-frame hot path, so steady-state frames do not
+    go through the allocator.
+
+    get(name, shape, dtype) returns an array of exactly that shape and dtype,
+    carved out of a flat backing buffer kept per (name, dtype). The backing
+    buffer only grows, so the crop-first regions, whose size changes every
+    frame, reuse the same memory instead of allocating per shape.
+
+    A buffer is valid until its name is requested again: names are per call
+    site, values that must outlive a frame (previous gray/mask) alternate
+    between two names, outputs that leave the worker use ring_name().
+    Every thread gets its own buffers (live worker, capture, batch workers).
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def _state(self):
+        state = self.local
+        if not hasattr(state, "buffers"):
+            state.buffers = {}
+            state.allocations = 0
+            state.allocated_bytes = 0
+            state.counters = {}
+        return state
+
+    def get(self, name, shape, dtype=np.uint8):
+        state = self._state()
+        dtype = np.dtype(dtype)
+        size = 1
+        for dim in shape:
+            size *= dim
+
+        key = (name, dtype.str)
+        backing = state.buffers.get(key)
+        if backing is None or backing.size < size:
+            backing = np.empty(size, dtype=dtype)
+            state.buffers[key] = backing
+            state.allocations += 1
+            state.allocated_bytes += backing.nbytes
+        return backing[:size].reshape(shape)
+
+    def ring_name(self, name, slots=4):
+        """
+        name0, name1, ... in turn, for buffers handed to another thread:
+        the consumer has `slots - 1` frames before its buffer is reused.
+        """
+        state = self._state()
+        index = state.counters.get(name, 0)
+        state.counters[name] = index + 1
+        return f"{name}{index % slots}"
+
+    def stats(self):
+        # Current thread only
+        state = self._state()
+        return {
+            "buffers": len(state.buffers),
+            "bytes": sum(buffer.nbytes for buffer in state.buffers.values()),
+            "allocations": state.allocations,
+            "allocated_bytes": state.allocated_bytes,
+        }
+
+    def clear(self):
+        self._state().buffers.clear()
+
+
+_pool = BufferPool()
+
+
+def get_buffer(name, shape, dtype=np.uint8):
+    return _pool.get(name, shape, dtype)
+
+
+def ring_name(name, slots=4):
+    return _pool.ring_name(name, slots)
+
+
+def pool_stats():
+    return _pool.stats()
@@ -1,37 +1,111 @@
 import cv2
 import numpy as np
 
+from processing.blend import mask_to_uint8
+from processing.buffer_pool import BufferPool
+
+
+class BoxPredictor:
+    """
+    Constant-velocity (alpha-beta) filter over the crop box (x, y, w, h), i.e.
+    a steady-state Kalman filter: the box follows each measurement with gain
+    alpha and its velocity with gain beta, so a subject moving steadily is
+    followed without the lag of plain exponential smoothing.
+    """
+
+    def __init__(self, alpha=0.35, beta=0.05):
+        self.alpha = alpha
+        self.beta = beta
+        self.state = None
+        self.velocity = None
+        self.residual = np.inf
+
+    def predict(self):
+        # Coast one frame without a measurement
+        self.state = self.state + self.velocity
+        return self.state
+
+    def update(self, measured):
+        if self.state is None:
+            self.state = measured.astype(np.float32)
+            self.velocity = np.zeros(4, dtype=np.float32)
+            self.residual = np.inf
+            return self.state
+
+        predicted = self.state + self.velocity
+        residual = measured - predicted
+        self.state = predicted + self.alpha * residual
+        self.velocity = self.velocity + self.beta * residual
+        self.residual = float(np.abs(residual).max())
+        return self.state
+
+    def hold(self):
+        # Subject lost: stop drifting
+        if self.velocity is not None:
+            self.velocity[:] = 0
+            self.residual = np.inf
+
+    def is_stable(self, tolerance, max_speed):
+        return (self.state is not None and self.residual <= tolerance
+                and float(np.abs(self.velocity).max()) <= max_speed)
+
 
 class SmartCameraman:
-    def __init__(self):
+    def __init__(self, tracking="contours", track_width=160, update_interval=4):
         self.current_rect = None
         # Smoothing Factor: Lower = smoother.
         self.alpha = 0.1
 
+        # tracking: "contours" (largest contour on the full mask, exponential smoothing)
+        # or "moments" (projections on a small copy of the mask + BoxPredictor)
+        if tracking not in ("contours", "moments"):
+            raise ValueError(f"Unknown tracking mode '{tracking}'")
+        self.tracking = tracking
+        self.track_width = track_width
+        # While the predicted box is stable, measure only every Nth frame
+        self.update_interval = update_interval
+        self.stable_tolerance = 4.0  # px, largest box edge error
+        self.stable_speed = 0.5  # px per frame
+        self.predictor = BoxPredictor()
+        self.frames_since_measure = 0
+        self.measured_count = 0
+        self.predicted_count = 0
+        # Hard copies of the (possibly soft-edged) mask
+        self.buffers = BufferPool()
+
     def process(self, frame, mask):
-        h_img, w_img = frame.shape[:2]
+        # Crop + resize back to the frame size in one call
+        return self.crop(frame, self.compute_rect(frame.shape, mask))
 
-        # 1. Mask Preparation
-        if mask.dtype != np.uint8:
-            mask_uint8 = (mask * 255).astype(np.uint8)
-        else:
-            mask_uint8 = mask
+    def compute_rect(self, frame_shape, mask):
+        """
+        Updates the smoothed crop rectangle for this frame and returns it as
+        (x, y, w, h) in frame pixels, or None when no person is visible.
+        """
+        h_img, w_img = frame_shape[:2]
 
-        if len(mask_uint8.shape) == 3:
-            if mask_uint8.shape[2] == 1:
-                mask_uint8 = mask_uint8.squeeze(axis=2)
-            else:
-                mask_uint8 = cv2.cvtColor(mask_uint8, cv2.COLOR_BGR2GRAY)
+        # 1. Mask Preparation (the segmenter already hands us uint8, this is a no-op then)
+        mask_uint8 = mask_to_uint8(mask)
 
-        # 2. Find contours
-        contours, _ = cv2.findContours(mask_uint8, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        if self.tracking == "moments":
+            # Steady subject: coast on the prediction and skip the measurement
+            if (self.frames_since_measure + 1 < self.update_interval
+                    and self.predictor.is_stable(self.stable_tolerance, self.stable_speed)):
+                self.frames_since_measure += 1
+                self.predicted_count += 1
+                self.current_rect = self.predictor.predict()
+                return self._clip_rect(self.current_rect, w_img, h_img)
 
-        if not contours:
-            return frame
+            self.frames_since_measure = 0
+            self.measured_count += 1
+            box = self._find_box_moments(mask_uint8)
+        else:
+            box = self._find_box_contours(mask_uint8)
 
-            # 3. Find target bounding box
-        largest_c = max(contours, key=cv2.contourArea)
-        x, y, w, h = cv2.boundingRect(largest_c)
+        if box is None:
+            self.predictor.hold()
+            return None
+        x, y, w, h = box
 
         # --- FIX: TOP MAGNET LOGIC ---
         # When close, pixels are larger. We relax the threshold from 10 to 60.
@@ -97,13 +171,79 @@ class SmartCameraman:
         # 6. Smooth Transition
         target_rect = np.array([final_x, final_y, final_w, final_h], dtype=np.float32)
 
-        if self.current_rect is None:
+        if self.tracking == "moments":
+            self.current_rect = self.predictor.update(target_rect)
+        elif self.current_rect is None:
             self.current_rect = target_rect
         else:
             self.current_rect = (self.current_rect * (1 - self.alpha)) + (target_rect * self.alpha)
 
-        # 7. Crop and Resize
-        cx, cy, cw, ch = self.current_rect.astype(int)
+        return self._clip_rect(self.current_rect, w_img, h_img)
+
+    def _find_box_contours(self, mask_uint8):
+        # 2. Find contours, on a hard mask: the guided mask's faint edge values would count as person
+        binary = self.buffers.get("binary", mask_uint8.shape)
+        binary = cv2.threshold(mask_uint8, 127, 255, cv2.THRESH_BINARY, dst=binary)[1]
+        contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        if not contours:
+            return None
+
+        # 3. Find target bounding box
+        largest_c = max(contours, key=cv2.contourArea)
+        return cv2.boundingRect(largest_c)
+
+    def _find_box_moments(self, mask_uint8):
+        """
+        Subject box from a small copy of the mask: the centroid and spread from
+        image moments, the extent from row/column projections. Columns and rows
+        far from the centroid (other blobs, speckles) are ignored, which is what
+        picking the largest contour did.
+        """
+        h_img, w_img = mask_uint8.shape[:2]
+        scale = min(1.0, self.track_width / w_img)
+        small_w = max(1, int(round(w_img * scale)))
+        small_h = max(1, int(round(h_img * scale)))
+        # Point sampling costs ~nothing (INTER_AREA on a big mask costs more than
+        # findContours did); the threshold makes soft guided edges hard again
+        small = self.buffers.get("small", (small_h, small_w))
+        small = cv2.resize(mask_uint8, (small_w, small_h), dst=small, interpolation=cv2.INTER_NEAREST)
+        small = cv2.threshold(small, 127, 255, cv2.THRESH_BINARY, dst=small)[1]
+
+        m = cv2.moments(small)
+        if m["m00"] < 255.0 * 4:
+            return None
+
+        cx, cy = m["m10"] / m["m00"], m["m01"] / m["m00"]
+        sx = np.sqrt(m["mu20"] / m["m00"])
+        sy = np.sqrt(m["mu02"] / m["m00"])
+
+        # A column/row belongs to the subject when it holds at least one mask pixel
+        cols = cv2.reduce(small, 0, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel()
+        rows = cv2.reduce(small, 1, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel()
+
+        def extent(projection, center, spread, length):
+            # A uniform blob reaches 1.73 sigma from its center, 2.5 sigma leaves room for arms
+            lo = max(0, int(center - 2.5 * spread))
+            hi = min(length, int(np.ceil(center + 2.5 * spread)) + 1)
+            active = np.flatnonzero(projection[lo:hi] >= 255)
+            if active.size == 0:
+                return None
+            return lo + active[0], lo + active[-1] + 1
+
+        x_range = extent(cols, cx, sx, small_w)
+        y_range = extent(rows, cy, sy, small_h)
+        if x_range is None or y_range is None:
+            return None
+
+        fx, fy = w_img / small_w, h_img / small_h
+        x = int(x_range[0] * fx)
+        y = int(y_range[0] * fy)
+        return x, y, int(np.ceil(x_range[1] * fx)) - x, int(np.ceil(y_range[1] * fy)) - y
+
+    def _clip_rect(self, rect, w_img, h_img):
+        # 7. Final rectangle
+        cx, cy, cw, ch = rect.astype(int)
 
         # Safety bounds checks
         cx = max(0, cx);
@@ -117,11 +257,32 @@ class SmartCameraman:
         cw = max(1, cw);
         ch = max(1, ch)
 
-        cropped = frame[cy:cy + ch, cx:cx + cw]
+        return cx, cy, cw, ch
 
-        if cropped.size == 0:
-            return frame
+    def crop(self, frame, rect, size=None, out=None):
+        """
+        Cuts rect out of frame and resamples it straight to size (w, h),
+        the frame's own size by default. One resample, whatever the target is.
+        Writes into `out` (h, w, channels) when given.
+        """
+        h_img, w_img = frame.shape[:2]
+        if size is None:
+            size = (w_img, h_img)
+
+        if rect is not None:
+            cx, cy, cw, ch = rect
+            cropped = frame[cy:cy + ch, cx:cx + cw]
+            if cropped.size == 0:
+                cropped = frame
+        else:
+            cropped = frame
 
-        output = cv2.resize(cropped, (w_img, h_img), interpolation=cv2.INTER_LINEAR)
+        if (cropped.shape[1], cropped.shape[0]) == tuple(size):
+            return cropped
 
-        return output
\ No newline at end of file
+        # Area averaging when shrinking (e.g. 1080p into a small widget), bilinear when zooming in
+        if size[0] < cropped.shape[1] and size[1] < cropped.shape[0]:
+            interpolation = cv2.INTER_AREA
+        else:
+            interpolation = cv2.INTER_LINEAR
+        return cv2.resize(cropped, tuple(size), dst=out, interpolation=interpolation)
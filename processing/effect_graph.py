@@ -0,0 +1,178 @@
+import math
+
+from processing.background_apply import blur_kernel_size
+from processing.blend import blend_tiles
+from processing.effects import glitch_background, glitch_footprint, pixelate_background, pixelation_footprint
+
+
+class Effect:
+    """
+    One background transform. Effects never blend: they take the current
+    background (the frame itself at the start of a chain) and return a new
+    one, EffectChain blends the person over the result once at the end.
+
+    context is a dict with the per-frame inputs (see FrameProcessor.effect_context).
+    """
+
+    name = "base"
+
+    # Optional composite(frame_rgb, background, mask, context, out) for the last
+    # effect of a chain: transform and blend in one step, so the effect can skip
+    # the pixels the person covers. None = transform, then EffectChain blends
+    composite = None
+
+    def transform(self, background, context):
+        raise NotImplementedError
+
+    def footprint(self, frame_shape, context):
+        # (margin_x, margin_y, align, wraps_x) for crop-first processing, None = full frame only
+        return 0, 0, 1, False
+
+
+class BlurEffect(Effect):
+    name = "blur"
+
+    def transform(self, background, context):
+        ksize = blur_kernel_size(context["motion_score"])
+        return context["blur_engine"].blur(background, ksize)
+
+    def composite(self, frame_rgb, background, mask, context, out=None):
+        # Only the tiles the person does not fully cover are blurred
+        ksize = blur_kernel_size(context["motion_score"])
+        return context["blur_engine"].composite(frame_rgb, mask, ksize, out, source=background)
+
+    def footprint(self, frame_shape, context):
+        ksize = blur_kernel_size(context["motion_score"])
+        return context["blur_engine"].footprint(ksize, frame_shape)
+
+
+class GlitchEffect(Effect):
+    name = "glitch"
+
+    def __init__(self, shift=20):
+        self.shift = shift
+
+    def transform(self, background, context):
+        return glitch_background(background, self.shift)
+
+    def footprint(self, frame_shape, context):
+        return glitch_footprint(self.shift)
+
+
+class PixelateEffect(Effect):
+    name = "pixelate"
+
+    def __init__(self, blocks=20):
+        self.blocks = blocks
+
+    def transform(self, background, context):
+        return pixelate_background(background, self.blocks)
+
+    def footprint(self, frame_shape, context):
+        return pixelation_footprint(frame_shape, self.blocks)
+
+
+class PatternEffect(Effect):
+    """
+    Replaces the background with the selected pattern, so it goes first in a chain.
+    """
+
+    name = "pattern"
+
+    def transform(self, background, context):
+        name = context.get("pattern")
+        if name is None:
+            return background
+
+        frame_w, frame_h = context["frame_size"]
+        pattern = context["backgrounds"].get(name, frame_w, frame_h)
+        if pattern is None:
+            return background
+
+        roi = context.get("roi")
+        if roi is not None:
+            x0, y0, x1, y1 = roi
+            pattern = pattern[y0:y1, x0:x1]
+        return pattern
+
+
+EFFECTS = {
+    "blur": BlurEffect,
+    "glitch": GlitchEffect,
+    "pixelate": PixelateEffect,
+    "pattern": PatternEffect,
+}
+
+
+def register_effect(name, effect_class):
+    EFFECTS[name] = effect_class
+
+
+def parse_chain(spec):
+    # "blur+glitch" -> ["blur", "glitch"], "none" or "" -> []
+    names = [part.strip().lower() for part in spec.split("+") if part.strip()]
+    names = [name for name in names if name != "none"]
+    for name in names:
+        if name not in EFFECTS:
+            raise ValueError(f"Unknown effect '{name}', expected one of none, {', '.join(EFFECTS)}")
+    return names
+
+
+class EffectChain:
+    """
+    A compiled list of effects: every background transform runs in order,
+    then the person is blended over the final background a single time.
+    """
+
+    def __init__(self, effects, tile_size=160):
+        self.effects = effects
+        self.tile_size = tile_size
+
+    @property
+    def names(self):
+        return [effect.name for effect in self.effects]
+
+    def apply(self, frame_rgb, mask, context, out=None):
+        effects = self.effects
+        composite = effects[-1].composite if effects else None
+        if composite is not None:
+            effects = effects[:-1]
+
+        background = frame_rgb
+        for effect in effects:
+            background = effect.transform(background, context)
+
+        if composite is not None:
+            return composite(frame_rgb, background, mask, context, out)
+
+        # Empty chain, or nothing changed (pattern without a selection)
+        if background is frame_rgb:
+            return frame_rgb
+
+        return blend_tiles(frame_rgb, background, mask, out, self.tile_size)
+
+    def footprint(self, frame_shape, context):
+        """
+        Combined footprint: every effect reads around the pixels the next one
+        needs, so the margins add up and the region must sit on every grid.
+        """
+        margin_x, margin_y, align, wraps_x = 0, 0, 1, False
+        for effect in self.effects:
+            footprint = effect.footprint(frame_shape, context)
+            if footprint is None:
+                return None
+            margin_x += footprint[0]
+            margin_y += footprint[1]
+            align = align * footprint[2] // math.gcd(align, footprint[2])
+            wraps_x = wraps_x or footprint[3]
+        return margin_x, margin_y, align, wraps_x
+
+
+def compile_chain(spec, **kwargs):
+    """
+    Builds an EffectChain from "blur", "blur+glitch", "pattern+pixelate", ...
+    A pattern always goes first, effects after it transform the pattern.
+    """
+    names = parse_chain(spec) if isinstance(spec, str) else list(spec)
+    names.sort(key=lambda name: name != "pattern")
+    return EffectChain([EFFECTS[name]() for name in names], **kwargs)
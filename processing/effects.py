@@ -1,48 +1,71 @@
 import cv2
-import numpy as np
 
+from processing.blend import blend
+from processing.buffer_pool import get_buffer
 
-def apply_glitch(frame_rgb, mask, shift=20):
+
+def apply_glitch(frame_rgb, mask, shift=20, out=None):
     """
     Splits RGB channels and shifts them to create a Chromatic Aberration (Glitch) effect
     on the background, keeping the user normal.
     """
     # 1. Create the Glitched Background
-    r, g, b = cv2.split(frame_rgb)
+    glitched_bg = glitch_background(frame_rgb, shift)
 
-    # Shift Red channel to the left
-    r_shifted = np.roll(r, -shift, axis=1)
-    # Shift Blue channel to the right
-    b_shifted = np.roll(b, shift, axis=1)
-    # Green stays still
+    # 2. Blend: User (Normal) + Background (Glitched)
+    # Note: mask is uint8 (0-255), the blend stays in integers.
+    return blend(frame_rgb, glitched_bg, mask, out)
 
-    glitched_bg = cv2.merge([r_shifted, g, b_shifted])
 
-    # 2. Blend: User (Normal) + Background (Glitched)
-    mask_3c = np.repeat(mask, 3, axis=2)
+def glitch_background(frame_rgb, shift=20):
+    h, w = frame_rgb.shape[:2]
+    shift %= w
+    glitched = get_buffer("glitch", frame_rgb.shape)
 
-    # Note: mask is float (0.0-1.0), frame is uint8.
-    # We perform math in float, then cast back.
-    out = (frame_rgb * mask_3c) + (glitched_bg * (1.0 - mask_3c))
+    # Same as np.roll on the channels, written with slices straight into one buffer
+    # Shift Red channel to the left
+    glitched[:, :w - shift, 0] = frame_rgb[:, shift:, 0]
+    glitched[:, w - shift:, 0] = frame_rgb[:, :shift, 0]
+    # Green stays still
+    glitched[:, :, 1] = frame_rgb[:, :, 1]
+    # Shift Blue channel to the right
+    glitched[:, shift:, 2] = frame_rgb[:, :w - shift, 2]
+    glitched[:, :shift, 2] = frame_rgb[:, w - shift:, 2]
+    return glitched
 
-    return out.astype(np.uint8)
 
+def glitch_footprint(shift=20):
+    # (margin_x, margin_y, align, wraps_x): the shifted channels reach `shift`
+    # columns sideways, and np.roll wraps around the frame's left/right edges
+    return shift, 0, 1, True
 
 
-def apply_pixelation(frame_rgb, mask, blocks=20):
+def apply_pixelation(frame_rgb, mask, blocks=20, out=None):
     """
     Pixelates the background.
     """
+    pixelated = pixelate_background(frame_rgb, blocks)
+
+    # 3. Blend
+    return blend(frame_rgb, pixelated, mask, out)
+
+
+def pixelate_background(frame_rgb, blocks=20):
     h, w = frame_rgb.shape[:2]
 
     # 1. Downscale
-    small = cv2.resize(frame_rgb, (w // blocks, h // blocks), interpolation=cv2.INTER_LINEAR)
+    small = get_buffer("pixelate_small", (h // blocks, w // blocks) + frame_rgb.shape[2:])
+    small = cv2.resize(frame_rgb, (w // blocks, h // blocks), dst=small, interpolation=cv2.INTER_LINEAR)
 
     # 2. Upscale (Nearest Neighbor creates the blocks)
-    pixelated = cv2.resize(small, (w, h), interpolation=cv2.INTER_NEAREST)
+    pixelated = get_buffer("pixelate", frame_rgb.shape)
+    return cv2.resize(small, (w, h), dst=pixelated, interpolation=cv2.INTER_NEAREST)
 
-    # 3. Blend
-    mask_3c = np.repeat(mask, 3, axis=2)
-    out = (frame_rgb * mask_3c) + (pixelated * (1.0 - mask_3c))
 
-    return out.astype(np.uint8)
\ No newline at end of file
+def pixelation_footprint(frame_shape, blocks=20):
+    # Every block only samples its own pixels, so a block-aligned region is exact.
+    # The block grid only lines up when `blocks` divides the frame.
+    h, w = frame_shape[:2]
+    if w % blocks or h % blocks:
+        return None
+    return 0, 0, blocks, False
@@ -0,0 +1,205 @@
+from contextlib import nullcontext
+
+import cv2
+import numpy as np
+
+from processing.segmenter import PersonSegmenter, guided_upsample
+from processing.background_assets import BackgroundAssetManager
+from processing.blur import BlurEngine
+from processing.buffer_pool import BufferPool
+from processing.cameraman import SmartCameraman
+from processing.effect_graph import compile_chain
+
+
+class FrameProcessor:
+    """
+    The segment -> effect -> cameraman chain for a single RGB frame.
+    Shared by the live feed and the headless batch mode.
+    """
+
+    def __init__(self, segmenter=None, cameraman=None, use_cameraman=True, backgrounds=None, tracer=None):
+        self.segmenter = segmenter if segmenter is not None else PersonSegmenter()
+        self.cameraman = cameraman if cameraman is not None else SmartCameraman()
+        self.backgrounds = backgrounds if backgrounds is not None else BackgroundAssetManager()
+        self.blur_engine = BlurEngine()
+        self.use_cameraman = use_cameraman
+        # Run the effect only on the region the cameraman keeps (same output)
+        self.crop_first = True
+        # Optional utils.perf_trace.PerfTracer, records segment/effect/cameraman times
+        self.tracer = tracer
+        # Effect outputs leave the worker (display, recorder, photo), so they rotate
+        # through a few reused buffers instead of being allocated per frame
+        self.buffers = BufferPool()
+        self.output_slots = 4
+        # Cameraman rect of the last composite(), in that frame's coordinates
+        self.last_rect = None
+
+        self.selected_pattern = None
+        self.effect_mode = "none"
+        self.effect_chain = compile_chain(self.effect_mode)
+
+    def set_effect_mode(self, effect_mode):
+        # "blur", "glitch", ... or a stack like "blur+glitch", compiled once here
+        self.effect_chain = compile_chain(effect_mode)
+        self.effect_mode = effect_mode
+
+    def set_selected_pattern(self, selected_pattern):
+        # Name of a pattern registered in self.backgrounds (or None)
+        self.selected_pattern = selected_pattern
+
+    def effect_context(self, frame_shape, roi=None):
+        # Per-frame inputs the effects read
+        return {
+            "motion_score": self.segmenter.get_motion_score(),
+            "blur_engine": self.blur_engine,
+            "backgrounds": self.backgrounds,
+            "pattern": self.selected_pattern,
+            "frame_size": (frame_shape[1], frame_shape[0]),
+            "roi": roi,
+        }
+
+    def apply_effect(self, rgb_frame, mask, roi=None, buffer_name=None):
+        # roi: (x0, y0, x1, y1) to process only that part of the frame.
+        # buffer_name: pooled output buffer, by default the next effect_out slot
+        context = self.effect_context(rgb_frame.shape, roi)
+        if roi is not None:
+            x0, y0, x1, y1 = roi
+            rgb_frame = rgb_frame[y0:y1, x0:x1]
+            mask = mask[y0:y1, x0:x1]
+
+        if buffer_name is None:
+            buffer_name = self.buffers.ring_name("effect_out", self.output_slots)
+        out = self.buffers.get(buffer_name, rgb_frame.shape)
+        return self.effect_chain.apply(rgb_frame, mask, context, out)
+
+    def effect_footprint(self, frame_shape):
+        # (margin_x, margin_y, align, wraps_x) of the current chain, None = full frame only
+        return self.effect_chain.footprint(frame_shape, self.effect_context(frame_shape))
+
+    def effect_roi(self, frame_shape, rect):
+        """
+        The part of the frame the effect has to cover so that `rect` comes out
+        exactly as if the whole frame had been processed: rect grown by the
+        effect's reach and snapped to its sampling grid. None = whole frame.
+        """
+        if rect is None:
+            return None
+        footprint = self.effect_footprint(frame_shape)
+        if footprint is None:
+            return None
+
+        h, w = frame_shape[:2]
+        margin_x, margin_y, align, wraps_x = footprint
+        x, y, cw, ch = rect
+
+        x0, x1 = x - margin_x, x + cw + margin_x
+        y0, y1 = y - margin_y, y + ch + margin_y
+        if wraps_x and (x0 < 0 or x1 > w):
+            # The effect wraps around the edge, only whole rows are exact
+            x0, x1 = 0, w
+
+        x0 = max(0, x0 // align * align)
+        y0 = max(0, y0 // align * align)
+        x1 = min(w, -(-x1 // align) * align)
+        y1 = min(h, -(-y1 // align) * align)
+
+        if (x0, y0, x1, y1) == (0, 0, w, h):
+            return None
+        return x0, y0, x1, y1
+
+    def _stage(self, frame_id, name):
+        if self.tracer is None or frame_id is None:
+            return nullcontext()
+        return self.tracer.stage(frame_id, name)
+
+    def process_uncropped(self, rgb_frame, frame_id=None):
+        """
+        Segment + effect, and the cameraman's crop rectangle without applying it.
+        Returns (processed_frame, mask, rect), rect is None without a crop.
+        The live view resamples the crop straight to the widget size instead.
+
+        The crop rectangle only depends on the mask, so with crop_first the
+        effect runs on that rectangle (plus the effect's margin) alone; then
+        processed_frame is that region and rect is relative to it.
+        """
+        with self._stage(frame_id, "segment"):
+            mask = self.segmenter.get_mask(rgb_frame)
+
+        return self.composite(rgb_frame, mask, frame_id)
+
+    def composite(self, rgb_frame, mask, frame_id=None):
+        """
+        process_uncropped() for a mask that is already computed (e.g. by a
+        segmentation worker process). Same return value.
+        """
+        rect = None
+        if self.use_cameraman:
+            with self._stage(frame_id, "cameraman"):
+                rect = self.cameraman.compute_rect(rgb_frame.shape, mask)
+        self.last_rect = rect
+
+        processed_frame, rect = self.render(rgb_frame, mask, rect, frame_id)
+        return processed_frame, mask, rect
+
+    def render(self, rgb_frame, mask, rect, frame_id=None, buffer_name=None):
+        """
+        The effect for a cameraman rect that is already known, the cameraman
+        itself is not updated. Returns (processed_frame, rect) like composite().
+        """
+        roi = self.effect_roi(rgb_frame.shape, rect) if self.crop_first else None
+
+        with self._stage(frame_id, "effect"):
+            processed_frame = self.apply_effect(rgb_frame, mask, roi, buffer_name)
+
+        if roi is not None:
+            x, y, cw, ch = rect
+            rect = (x - roi[0], y - roi[1], cw, ch)
+
+        return processed_frame, rect
+
+    def upsample_mask(self, mask, preview_frame, full_frame):
+        # Mask of the scaled-down preview_frame at full_frame's size, edges refined on the full frame
+        h, w = preview_frame.shape[:2]
+        preview_gray = cv2.cvtColor(preview_frame, cv2.COLOR_RGB2GRAY,
+                                    dst=self.buffers.get("preview_gray", (h, w)))
+        out = self.buffers.get(self.buffers.ring_name("full_mask", self.output_slots), full_frame.shape[:2])
+        return guided_upsample(mask, preview_gray, full_frame, buffers=self.buffers, out=out)
+
+    def render_full_resolution(self, full_frame, preview_frame, mask, rect, frame_id=None, out=None):
+        """
+        Photo/recording output for a frame the live view processed as a
+        scaled-down preview_frame: the preview's mask is upsampled as the seed
+        and the effect and cameraman crop (preview rect, scaled) run on the
+        full frame. Returns (frame at full_frame's size, full-size mask).
+
+        The frame is written into out when given. Otherwise it is a buffer of
+        this thread's pool, valid until the next call. The effect_out ring is
+        left to the live frames either way.
+        """
+        full_mask = self.upsample_mask(mask, preview_frame, full_frame)
+
+        h, w = full_frame.shape[:2]
+        if rect is not None:
+            sx, sy = w / preview_frame.shape[1], h / preview_frame.shape[0]
+            x, y, cw, ch = rect
+            x0, y0 = int(round(x * sx)), int(round(y * sy))
+            rect = (x0, y0, min(w - x0, int(round(cw * sx))), min(h - y0, int(round(ch * sy))))
+
+        processed_frame, rect = self.render(full_frame, full_mask, rect, frame_id, "full_effect_out")
+        frame = self.crop(processed_frame, rect, (w, h), out)
+        if out is not None and frame is not out:
+            np.copyto(out, frame)
+            frame = out
+        return frame, full_mask
+
+    def crop(self, processed_frame, rect, size, out=None):
+        # Cameraman output at size (w, h): the full frame size for photos/recordings/batch,
+        # the widget size for the live view
+        if rect is None and (processed_frame.shape[1], processed_frame.shape[0]) == tuple(size):
+            return processed_frame
+        return self.cameraman.crop(processed_frame, rect, size, out)
+
+    def process(self, rgb_frame, frame_id=None):
+        h, w = rgb_frame.shape[:2]
+        processed_frame, mask, rect = self.process_uncropped(rgb_frame, frame_id)
+        return self.crop(processed_frame, rect, (w, h)), mask
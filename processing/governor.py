@@ -0,0 +1,117 @@
+import numpy as np
+
+# Level 0 is the normal configuration, every further step trades quality for time.
+# processing_scale: PersonSegmenter mask resolution
+# skin_recovery: run the YCrCb skin stage at all
+# blur_quality: BlurEngine quality level
+# capture_size: camera resolution to request (None = the camera's native size)
+QUALITY_LADDER = [
+    {"name": "full", "processing_scale": 1.0, "skin_recovery": True, "blur_quality": "medium", "capture_size": None},
+    {"name": "seg_half", "processing_scale": 0.5, "skin_recovery": True, "blur_quality": "medium",
+     "capture_size": None},
+    {"name": "no_skin", "processing_scale": 0.5, "skin_recovery": False, "blur_quality": "low", "capture_size": None},
+    {"name": "seg_quarter", "processing_scale": 0.25, "skin_recovery": False, "blur_quality": "low",
+     "capture_size": None},
+    {"name": "low_capture", "processing_scale": 0.25, "skin_recovery": False, "blur_quality": "low",
+     "capture_size": (640, 360)},
+]
+
+
+class QualityGovernor:
+    """
+    Holds a target frame rate by walking QUALITY_LADDER.
+
+    Frame processing times are collected in windows of `window` frames. A window
+    misses when its p90 is over the frame budget, and has headroom when the p90
+    is under `headroom` x budget. Quality drops after `degrade_after` missed
+    windows in a row and comes back after `restore_after` windows with headroom
+    in a row. The gap between the two thresholds, the consecutive-window counts
+    and a one-window cooldown after every change keep it from oscillating.
+    """
+
+    def __init__(self, target_fps=30, ladder=None, window=30, degrade_after=2, restore_after=5, headroom=0.7,
+                 apply_callback=None):
+        self.ladder = ladder if ladder is not None else QUALITY_LADDER
+        self.window = window
+        self.degrade_after = degrade_after
+        self.restore_after = restore_after
+        self.headroom = headroom
+        self.apply_callback = apply_callback
+
+        self.set_target_fps(target_fps)
+
+        self.level = 0
+        self.samples = []
+        self.missed_windows = 0
+        self.headroom_windows = 0
+        self.cooldown = 0
+        self.last_p90_ms = 0.0
+
+    def set_target_fps(self, target_fps):
+        self.target_fps = target_fps
+        self.budget_ms = 1000.0 / target_fps
+
+    def get_level(self):
+        return self.level
+
+    def get_level_name(self):
+        return self.ladder[self.level]["name"]
+
+    def get_settings(self):
+        return dict(self.ladder[self.level])
+
+    def get_state(self):
+        return {
+            "level": self.level,
+            "name": self.get_level_name(),
+            "target_fps": self.target_fps,
+            "budget_ms": self.budget_ms,
+            "last_p90_ms": self.last_p90_ms,
+            "settings": self.get_settings(),
+        }
+
+    def set_level(self, level):
+        level = min(max(0, level), len(self.ladder) - 1)
+        if level == self.level:
+            return False
+        self.level = level
+        self.missed_windows = 0
+        self.headroom_windows = 0
+        self.cooldown = 1
+        if self.apply_callback is not None:
+            self.apply_callback(self.get_settings())
+        return True
+
+    def record(self, frame_time_s):
+        """
+        Feeds one frame's processing time. Returns True when the level changed.
+        """
+        self.samples.append(frame_time_s * 1000.0)
+        if len(self.samples) < self.window:
+            return False
+
+        p90 = float(np.percentile(self.samples, 90))
+        self.samples = []
+        self.last_p90_ms = p90
+
+        # The first window after a change still has frames from the old level
+        if self.cooldown > 0:
+            self.cooldown -= 1
+            return False
+
+        if p90 > self.budget_ms:
+            self.missed_windows += 1
+            self.headroom_windows = 0
+            if self.missed_windows >= self.degrade_after:
+                return self.set_level(self.level + 1)
+        elif p90 < self.budget_ms * self.headroom:
+            self.headroom_windows += 1
+            self.missed_windows = 0
+            if self.headroom_windows >= self.restore_after:
+                return self.set_level(self.level - 1)
+        else:
+            # Inside the hysteresis band: hold the current level
+            self.missed_windows = 0
+            self.headroom_windows = 0
+
+        return False
@@ -0,0 +1,293 @@
+import importlib.util
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+class SegmentationResult:
+    def __init__(self, segmentation_mask):
+        # float32 person confidence (0.0-1.0) at the input frame size
+        self.segmentation_mask = segmentation_mask
+
+
+class SegmentationBackend:
+    """
+    Produces the raw person confidence map PersonSegmenter builds on.
+    Same shape as MediaPipe's API: process(frame_rgb).segmentation_mask.
+    """
+
+    name = "base"
+
+    def process(self, frame_rgb):
+        raise NotImplementedError
+
+    def is_ready(self):
+        return True
+
+    def close(self):
+        pass
+
+
+class MediaPipeBackend(SegmentationBackend):
+    """
+    MediaPipe selfie segmentation. model_selection=0 is the general model
+    (256x256 input), model_selection=1 the faster landscape model (144x256).
+    """
+
+    def __init__(self, model_selection=1):
+        import mediapipe as mp
+
+        self.name = "mediapipe_landscape" if model_selection == 1 else "mediapipe_general"
+        self.model = mp.solutions.selfie_segmentation.SelfieSegmentation(model_selection=model_selection)
+
+    def process(self, frame_rgb):
+        return SegmentationResult(self.model.process(frame_rgb).segmentation_mask)
+
+    def close(self):
+        self.model.close()
+
+
+def find_bundled_model(file_name):
+    # The .tflite files ship inside the mediapipe package, locate them without importing it
+    spec = importlib.util.find_spec("mediapipe")
+    if spec is None or not spec.submodule_search_locations:
+        return None
+    path = os.path.join(spec.submodule_search_locations[0], "modules", "selfie_segmentation", file_name)
+    return path if os.path.exists(path) else None
+
+
+class TFLiteBackend(SegmentationBackend):
+    """
+    Runs a selfie segmentation .tflite model directly with a TFLite interpreter,
+    which lets us choose the number of inference threads.
+    Defaults to the landscape model bundled with mediapipe.
+    """
+
+    name = "tflite"
+
+    def __init__(self, model_path=None, num_threads=2):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+
+        if model_path is None:
+            model_path = find_bundled_model("selfie_segmentation_landscape.tflite")
+        if model_path is None:
+            raise FileNotFoundError("No selfie segmentation .tflite model found")
+
+        self.interpreter = Interpreter(model_path=model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self.input_detail = self.interpreter.get_input_details()[0]
+        self.output_detail = self.interpreter.get_output_details()[0]
+        _, self.input_h, self.input_w, _ = self.input_detail["shape"]
+
+    def process(self, frame_rgb):
+        h, w = frame_rgb.shape[:2]
+        model_input = cv2.resize(frame_rgb, (int(self.input_w), int(self.input_h)), interpolation=cv2.INTER_AREA)
+        model_input = (model_input.astype(np.float32) / 255.0)[np.newaxis]
+
+        self.interpreter.set_tensor(self.input_detail["index"], model_input)
+        self.interpreter.invoke()
+        output = self.interpreter.get_tensor(self.output_detail["index"])[0]
+
+        # Single sigmoid channel, or background/person logits
+        if output.shape[-1] == 1:
+            confidence = output[:, :, 0]
+        else:
+            exp = np.exp(output - output.max(axis=-1, keepdims=True))
+            confidence = exp[:, :, 1] / exp.sum(axis=-1)
+
+        return SegmentationResult(cv2.resize(confidence.astype(np.float32), (w, h), interpolation=cv2.INTER_LINEAR))
+
+
+class ClassicalBackend(SegmentationBackend):
+    """
+    Cheap fallback for weak CPUs: background modeling (MOG2 or KNN) on a small
+    copy of the frame. Needs the person to move now and then to stay separated
+    from the learned background, but costs a few milliseconds.
+    """
+
+    def __init__(self, method="MOG2", work_width=320, history=300):
+        self.name = f"classical_{method.lower()}"
+        if method.upper() == "KNN":
+            self.subtractor = cv2.createBackgroundSubtractorKNN(history=history, detectShadows=False)
+        else:
+            self.subtractor = cv2.createBackgroundSubtractorMOG2(history=history, detectShadows=False)
+        self.work_width = work_width
+        self.kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (7, 7))
+
+    def process(self, frame_rgb):
+        h, w = frame_rgb.shape[:2]
+        work_w = min(w, self.work_width)
+        work_h = max(1, int(round(h * work_w / w)))
+        small = cv2.resize(frame_rgb, (work_w, work_h), interpolation=cv2.INTER_AREA)
+
+        foreground = self.subtractor.apply(small)
+        foreground = cv2.morphologyEx(foreground, cv2.MORPH_OPEN, self.kernel)
+        foreground = cv2.morphologyEx(foreground, cv2.MORPH_CLOSE, self.kernel, iterations=2)
+
+        confidence = cv2.resize(foreground, (w, h), interpolation=cv2.INTER_LINEAR).astype(np.float32) / 255.0
+        return SegmentationResult(confidence)
+
+
+# Best quality first, the probe walks this order
+# Options go to the constructor, so an unknown one raises TypeError instead of being dropped
+BACKENDS = {
+    "mediapipe_general": lambda **kwargs: MediaPipeBackend(model_selection=0, **kwargs),
+    "mediapipe_landscape": lambda **kwargs: MediaPipeBackend(model_selection=1, **kwargs),
+    "tflite": lambda **kwargs: TFLiteBackend(**kwargs),
+    "classical_mog2": lambda **kwargs: ClassicalBackend("MOG2", **kwargs),
+    "classical_knn": lambda **kwargs: ClassicalBackend("KNN", **kwargs),
+}
+
+DEFAULT_BACKEND = "mediapipe_landscape"
+
+
+def create_backend(name, **kwargs):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown segmentation backend '{name}', expected one of {', '.join(BACKENDS)}")
+    return BACKENDS[name](**kwargs)
+
+
+class LazyBackend(SegmentationBackend):
+    """
+    Creates another backend on a background thread and runs one warm-up frame
+    through it, so importing mediapipe and building the graph does not hold up
+    the window. process() blocks until the model is ready, callers that must
+    not block check is_ready() first.
+
+    If the backend cannot be created, falls back to `fallback`.
+    """
+
+    def __init__(self, name=None, fallback="classical_mog2", warmup_size=(256, 144), on_ready=None, **kwargs):
+        self.backend_name = name or DEFAULT_BACKEND
+        self.fallback = fallback
+        self.warmup_size = warmup_size
+        self.on_ready = on_ready
+        self.kwargs = kwargs
+
+        self.backend = None
+        self.ready = threading.Event()
+        self.thread = None
+        # Seconds from start() to a warmed-up model
+        self.load_time = None
+
+    @property
+    def name(self):
+        return self.backend.name if self.backend is not None else self.backend_name
+
+    def start(self):
+        self.thread = threading.Thread(target=self._load, name="model_warmup", daemon=True)
+        self.thread.start()
+        return self
+
+    def _load(self):
+        start = time.perf_counter()
+        w, h = self.warmup_size
+        warmup_frame = np.zeros((h, w, 3), dtype=np.uint8)
+        try:
+            backend = create_backend(self.backend_name, **self.kwargs)
+            backend.process(warmup_frame)
+        except Exception as e:
+            print(f"[ERROR] Backend {self.backend_name} failed to load: {e}, falling back to {self.fallback}")
+            try:
+                backend = create_backend(self.fallback)
+            except Exception as e:
+                # Never ready: the live view keeps showing the unprocessed camera
+                print(f"[ERROR] Fallback backend {self.fallback} failed to load: {e}")
+                return
+
+        self.backend = backend
+        self.load_time = time.perf_counter() - start
+        self.ready.set()
+        print(f"[INFO] Segmentation model {backend.name} ready in {self.load_time * 1000.0:.0f} ms")
+        if self.on_ready is not None:
+            self.on_ready(self)
+
+    def is_ready(self):
+        return self.ready.is_set()
+
+    def process(self, frame_rgb):
+        if self.thread is None:
+            self.start()
+        self.ready.wait()
+        return self.backend.process(frame_rgb)
+
+    def close(self):
+        if self.backend is not None:
+            self.backend.close()
+
+
+def _probe_frames(size, count=4):
+    w, h = size
+    rng = np.random.default_rng(0)
+    frames = []
+    for index in range(count):
+        small = rng.integers(0, 255, size=(h // 16 + 1, w // 16 + 1, 3), dtype=np.uint8)
+        frame = cv2.resize(small, (w, h), interpolation=cv2.INTER_LINEAR)
+        cv2.ellipse(frame, (w // 2 + 5 * index, int(h * 0.65)), (w // 6, h // 3), 0, 0, 360, (205, 150, 125), -1)
+        frames.append(frame)
+    return frames
+
+
+def probe_backends(frame_budget_ms, candidates=None, frame_size=(640, 480), iterations=10, frames=None):
+    """
+    Times every candidate backend on this machine and picks the first one (in
+    quality order) whose median time fits frame_budget_ms. Falls back to the
+    fastest backend if none fits.
+
+    Returns (chosen_name, timings) where timings maps name -> median ms, or
+    None when the backend is not available here.
+    """
+    candidates = candidates or list(BACKENDS)
+    frames = frames or _probe_frames(frame_size)
+    timings = {}
+
+    for name in candidates:
+        try:
+            backend = create_backend(name)
+        except Exception as e:
+            print(f"[INFO] Backend {name} not available: {e}")
+            timings[name] = None
+            continue
+
+        try:
+            backend.process(frames[0])  # warm up (graph init, allocations)
+            samples = []
+            for index in range(iterations):
+                start = time.perf_counter()
+                backend.process(frames[index % len(frames)])
+                samples.append((time.perf_counter() - start) * 1000.0)
+            timings[name] = float(np.median(samples))
+        except Exception as e:
+            print(f"[ERROR] Backend {name} failed during probe: {e}")
+            timings[name] = None
+        finally:
+            backend.close()
+
+    for name in candidates:
+        if timings.get(name) is not None and timings[name] <= frame_budget_ms:
+            return name, timings
+
+    available = [name for name in candidates if timings.get(name) is not None]
+    if not available:
+        raise RuntimeError("No segmentation backend is available")
+    return min(available, key=lambda name: timings[name]), timings
+
+
+def resolve_backend(name, frame_budget_ms=20.0):
+    """
+    Turns a --backend value into a backend name, running the probe for "auto".
+    """
+    if name != "auto":
+        return name
+    chosen, timings = probe_backends(frame_budget_ms)
+    for candidate, ms in timings.items():
+        status = "n/a" if ms is None else f"{ms:.1f} ms"
+        print(f"[INFO] Backend {candidate:<20} {status}")
+    print(f"[INFO] Using {chosen} (budget {frame_budget_ms:.0f} ms)")
+    return chosen
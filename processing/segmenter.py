@@ -1,12 +1,71 @@
-import mediapipe as mp
 import cv2
 import numpy as np
 
+from processing.buffer_pool import BufferPool
+from processing.seg_backends import DEFAULT_BACKEND, create_backend
+from processing.skin import LOWER_SKIN, UPPER_SKIN
+
+
+def guided_upsample(small_mask, small_gray, frame_rgb, radius=1, eps=1e-3, buffers=None, out=None):
+    """
+    Scales a low-res mask up to frame_rgb's size with its edges snapped to the
+    image: small_gray is the low-res gray frame the mask was computed on,
+    radius is in low-res pixels. Returns a soft uint8 mask (0-255).
+    """
+    # Fast guided filter (He & Sun): the linear coefficients are solved at the
+    # processing resolution with the low-res gray frame as guide, then
+    # upsampled and applied to the full-resolution gray frame. Mask edges snap
+    # to image edges while only two resizes and a multiply-add run at full size.
+    h, w = frame_rgb.shape[:2]
+    if buffers is None:
+        buffers = BufferPool()
+    if out is None:
+        out = np.empty((h, w), dtype=np.uint8)
+
+    small_shape = small_mask.shape
+    guide_small = np.divide(small_gray, np.float32(255.0), out=buffers.get("gf_guide", small_shape, np.float32))
+    src_small = np.divide(small_mask, np.float32(255.0), out=buffers.get("gf_src", small_shape, np.float32))
+    ksize = (2 * radius + 1, 2 * radius + 1)
+
+    def box(src, name):
+        return cv2.boxFilter(src, -1, ksize, dst=buffers.get(name, small_shape, np.float32))
+
+    product = buffers.get("gf_product", small_shape, np.float32)
+    mean_i = box(guide_small, "gf_mean_i")
+    mean_p = box(src_small, "gf_mean_p")
+    corr_ip = box(np.multiply(guide_small, src_small, out=product), "gf_corr_ip")
+    corr_ii = box(np.multiply(guide_small, guide_small, out=product), "gf_corr_ii")
+
+    # var_i = corr_ii - mean_i^2, cov_ip = corr_ip - mean_i * mean_p (in place)
+    var_i = np.subtract(corr_ii, np.multiply(mean_i, mean_i, out=product), out=corr_ii)
+    cov_ip = np.subtract(corr_ip, np.multiply(mean_i, mean_p, out=product), out=corr_ip)
+
+    # a = cov_ip / (var_i + eps), b = mean_p - a * mean_i
+    a = np.divide(cov_ip, np.add(var_i, eps, out=var_i), out=cov_ip)
+    b = np.subtract(mean_p, np.multiply(a, mean_i, out=product), out=mean_p)
+
+    mean_a = buffers.get("gf_full_a", (h, w), np.float32)
+    mean_b = buffers.get("gf_full_b", (h, w), np.float32)
+    mean_a = cv2.resize(box(a, "gf_box_a"), (w, h), dst=mean_a, interpolation=cv2.INTER_LINEAR)
+    mean_b = cv2.resize(box(b, "gf_box_b"), (w, h), dst=mean_b, interpolation=cv2.INTER_LINEAR)
+
+    guide_full = cv2.cvtColor(frame_rgb, cv2.COLOR_RGB2GRAY, dst=buffers.get("gf_gray_full", (h, w)))
+    # q = a * I + b, with I in 0..255 and the result scaled to 0..255
+    refined = cv2.multiply(guide_full, mean_a, dst=mean_a, dtype=cv2.CV_32F)
+    cv2.scaleAdd(mean_b, 255.0, refined, dst=refined)
+    np.maximum(refined, 0, out=refined)
+    return cv2.convertScaleAbs(refined, dst=out)
+
 
 class PersonSegmenter:
-    def __init__(self):
-        self.mp_selfie = mp.solutions.selfie_segmentation
-        self.segmenter = self.mp_selfie.SelfieSegmentation(model_selection=1)
+    def __init__(self, processing_scale=1.0, refine="bilinear", keyframe_mode=False, backend=None):
+        # backend: a name from seg_backends.BACKENDS or any object with
+        # process(frame_rgb).segmentation_mask (benchmarks pass a stub)
+        if backend is None:
+            backend = DEFAULT_BACKEND
+        if isinstance(backend, str):
+            backend = create_backend(backend)
+        self.segmenter = backend
 
         self.prev_gray = None
         self.prev_mask = None
@@ -15,89 +74,331 @@ class PersonSegmenter:
         # --- TUNING ---
         self.base_alpha = 0.2
 
+        # --- RESOLUTION ---
+        # The whole mask is computed at processing_scale (e.g. 0.5 or 0.25) and
+        # refined back to full resolution. refine: "bilinear" or "guided"; guided
+        # costs more and was not ahead on edge error in compare-scales
+        self.refine = refine
+        # Guided filter radius (in low-res pixels) and regularization
+        self.guided_radius = 1
+        self.guided_eps = 1e-3
+
+        # --- KEYFRAMES ---
+        # When enabled, MediaPipe only runs on keyframes and the body mask is
+        # warped forward with optical flow in between.
+        self.keyframe_mode = keyframe_mode
+        # Static scene: full inference at least every Nth frame
+        self.keyframe_interval = 5
+        # Moving scene: full inference on every frame above this motion score
+        self.keyframe_motion_threshold = 0.02
+        # Full inference as soon as the warped frame stops matching (0.0-1.0)
+        self.propagation_error_threshold = 0.04
+        # Optical flow runs on a small copy of the frame
+        self.flow_width = 160
+
+        # Skin recovery can be switched off to save time (QualityGovernor does)
+        self.skin_recovery = True
+
+        # Every intermediate mask lives in these reused buffers. State kept for
+        # the next frame (gray, smoothed mask, body mask, output) alternates
+        # between two buffers picked by frame_parity.
+        self.buffers = BufferPool()
+        self.frame_parity = 0
+
+        self.set_processing_scale(processing_scale)
+
+    def is_ready(self):
+        # False while a LazyBackend is still loading the model (stubs have no is_ready)
+        is_ready = getattr(self.segmenter, "is_ready", None)
+        return is_ready() if is_ready is not None else True
+
+    def set_processing_scale(self, processing_scale):
+        self.processing_scale = min(1.0, max(0.05, processing_scale))
+
+        # Temporal state was computed at the old resolution
+        self.prev_gray = None
+        self.prev_mask = None
+        self.prev_body_mask = None
+        self.frames_since_keyframe = 0
+        self.propagation_error = 0.0
+        self.keyframe_count = 0
+        self.propagated_count = 0
+        self.flow_grids = {}
+        self.skin_buffer = None
+
         # --- KERNELS ---
+        # Sizes are in full-resolution pixels and shrink with the processing scale
         # Standard noise cleanup
-        self.kernel_small = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+        self.kernel_small = self._scaled_kernel(3)
 
         # Connection kernels (The "Glue")
-        self.kernel_connect = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (9, 9))
+        self.kernel_connect = self._scaled_kernel(9)
         # Massive glue for high motion (Fixes slicing)
-        self.kernel_heavy_connect = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (19, 19))
+        self.kernel_heavy_connect = self._scaled_kernel(19)
 
         # Search area kernels (The "Reach")
-        self.kernel_search_static = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (21, 21))
-        self.kernel_search_moving = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (51, 51))
+        self.kernel_search_static = self._scaled_kernel(21)
+        self.kernel_search_moving = self._scaled_kernel(51)
 
-    def _get_skin_mask(self, frame_rgb, is_moving):
+    def _scaled_kernel(self, size):
+        size = max(1, int(round(size * self.processing_scale))) | 1
+        return cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (size, size))
+
+    def _get_skin_mask(self, frame_rgb, is_moving, search_area=None):
         """
         Adapts skin detection based on movement.
+        Only the padded bounding box of search_area is processed, the rest of the
+        returned mask is 0.
         """
+        h, w = frame_rgb.shape[:2]
+
+        if search_area is None:
+            x0, y0, x1, y1 = 0, 0, w, h
+        else:
+            bx, by, bw, bh = cv2.boundingRect(search_area)
+            if bw == 0 or bh == 0:
+                return self._get_skin_buffer(h, w)
+
+            # Pad by the reach of the morphology below so pixels inside the search
+            # area come out exactly as if the whole frame had been processed
+            pad = self._skin_morph_reach(is_moving)
+            x0, y0 = max(0, bx - pad), max(0, by - pad)
+            x1, y1 = min(w, bx + bw + pad), min(h, by + bh + pad)
+
         # 1. Color Segmentation (YCrCb)
-        frame_ycrcb = cv2.cvtColor(frame_rgb, cv2.COLOR_RGB2YCrCb)
+        roi_h, roi_w = y1 - y0, x1 - x0
+        frame_ycrcb = self.buffers.get("ycrcb", (roi_h, roi_w, 3))
+        frame_ycrcb = cv2.cvtColor(frame_rgb[y0:y1, x0:x1], cv2.COLOR_RGB2YCrCb, dst=frame_ycrcb)
 
-        # Standard Skin Range
-        lower_skin = np.array([0, 133, 77], dtype=np.uint8)
-        upper_skin = np.array([255, 173, 127], dtype=np.uint8)
-        skin_mask = cv2.inRange(frame_ycrcb, lower_skin, upper_skin)
+        skin_mask = self.buffers.get("skin", (roi_h, roi_w))
+        skin_mask = cv2.inRange(frame_ycrcb, LOWER_SKIN, UPPER_SKIN, dst=skin_mask)
 
-        # 2. Cleanup
-        skin_mask = cv2.morphologyEx(skin_mask, cv2.MORPH_OPEN, self.kernel_small)
+        # 2. Cleanup (morphology runs in place)
+        skin_mask = cv2.morphologyEx(skin_mask, cv2.MORPH_OPEN, self.kernel_small, dst=skin_mask)
 
         # 3. --- DYNAMIC REPAIR (The Fix) ---
         if is_moving:
             # MOVEMENT MODE: Aggressive Repair
             # 1. "Close" huge gaps. Motion blur creates holes; this fills them.
-            skin_mask = cv2.morphologyEx(skin_mask, cv2.MORPH_CLOSE, self.kernel_heavy_connect)
+            skin_mask = cv2.morphologyEx(skin_mask, cv2.MORPH_CLOSE, self.kernel_heavy_connect, dst=skin_mask)
 
             # 2. Dilate. Motion blur makes the hand look thin/transparent.
             # We add pixels back to restore volume.
-            skin_mask = cv2.dilate(skin_mask, self.kernel_connect, iterations=1)
+            skin_mask = cv2.dilate(skin_mask, self.kernel_connect, dst=skin_mask, iterations=1)
         else:
             # STATIC MODE: Gentle Repair
             # Just connect fingers, don't blob too much
-            skin_mask = cv2.morphologyEx(skin_mask, cv2.MORPH_CLOSE, self.kernel_connect)
-            skin_mask = cv2.dilate(skin_mask, self.kernel_small, iterations=1)
+            skin_mask = cv2.morphologyEx(skin_mask, cv2.MORPH_CLOSE, self.kernel_connect, dst=skin_mask)
+            skin_mask = cv2.dilate(skin_mask, self.kernel_small, dst=skin_mask, iterations=1)
+
+        if (x0, y0, x1, y1) == (0, 0, w, h):
+            # uint8 0/255, same scale as the rest of the mask path
+            return skin_mask
+
+        # Paste the ROI into the reusable full-size mask
+        full_mask = self._get_skin_buffer(h, w)
+        full_mask[y0:y1, x0:x1] = skin_mask
+        return full_mask
+
+    def _get_skin_buffer(self, h, w):
+        # Reused every frame, only the ROI is non-zero
+        if self.skin_buffer is None or self.skin_buffer.shape != (h, w):
+            self.skin_buffer = np.zeros((h, w), dtype=np.uint8)
+        else:
+            self.skin_buffer.fill(0)
+        return self.skin_buffer
+
+    def _skin_morph_reach(self, is_moving):
+        # Sum of the kernel radii of every erode/dilate pass in _get_skin_mask
+        def radius(kernel):
+            return kernel.shape[0] // 2
 
-        return skin_mask.astype(np.float32) / 255.0
+        reach = 2 * radius(self.kernel_small)  # open
+        if is_moving:
+            reach += 2 * radius(self.kernel_heavy_connect) + radius(self.kernel_connect)
+        else:
+            reach += 2 * radius(self.kernel_connect) + radius(self.kernel_small)
+        return reach
 
     def get_mask(self, frame_rgb):
-        # 1. MediaPipe Body (The "Core")
+        """
+        Returns a single-channel uint8 mask (0 = background, 255 = person)
+        at the resolution of frame_rgb. Below processing_scale 1.0 with
+        refine="guided" it has soft edges (values in between); threshold at
+        127 where a hard mask is needed.
+
+        The mask is a reused buffer: it stays valid through the next call and
+        is overwritten by the one after. Copy it to keep it longer.
+        """
+        h, w = frame_rgb.shape[:2]
+        if self.prev_gray is not None and self.prev_gray.shape != self._mask_shape(h, w):
+            # Capture resolution changed, the temporal state no longer lines up
+            self.set_processing_scale(self.processing_scale)
+
+        if self.processing_scale >= 1.0:
+            return self._compute_mask(frame_rgb)
+
+        small_size = (max(1, int(w * self.processing_scale)), max(1, int(h * self.processing_scale)))
+        small_rgb = self.buffers.get("small_rgb", (small_size[1], small_size[0], 3))
+        small_rgb = cv2.resize(frame_rgb, small_size, dst=small_rgb, interpolation=cv2.INTER_AREA)
+
+        small_mask = self._compute_mask(small_rgb)
+        return self._upsample_mask(small_mask, frame_rgb)
+
+    def _mask_shape(self, h, w):
+        # Shape of the working masks for an h x w frame
+        if self.processing_scale >= 1.0:
+            return h, w
+        return max(1, int(h * self.processing_scale)), max(1, int(w * self.processing_scale))
+
+    def _upsample_mask(self, small_mask, frame_rgb):
+        h, w = frame_rgb.shape[:2]
+        buffers = self.buffers
+        output = buffers.get(f"mask_full{self.frame_parity}", (h, w))
+
+        if self.refine != "guided":
+            upsampled = cv2.resize(small_mask, (w, h), dst=output, interpolation=cv2.INTER_LINEAR)
+            _, upsampled = cv2.threshold(upsampled, 127, 255, cv2.THRESH_BINARY, dst=upsampled)
+            return upsampled
+
+        return guided_upsample(small_mask, self.prev_gray, frame_rgb, self.guided_radius, self.guided_eps, buffers,
+                               output)
+
+    def get_backend_name(self):
+        return getattr(self.segmenter, "name", type(self.segmenter).__name__)
+
+    def _run_model(self, frame_rgb, out=None):
         mp_result = self.segmenter.process(frame_rgb)
-        mp_mask = mp_result.segmentation_mask.astype(np.float32)
+        # Float confidence (0.0-1.0) -> uint8 (0-255), the only float step left
+        return cv2.convertScaleAbs(mp_result.segmentation_mask, dst=out, alpha=255.0)
+
+    def _get_flow_grid(self, width, height):
+        # Pixel coordinate grids for cv2.remap, one per resolution
+        grid = self.flow_grids.get((width, height))
+        if grid is None:
+            grid = np.meshgrid(np.arange(width, dtype=np.float32), np.arange(height, dtype=np.float32))
+            self.flow_grids[(width, height)] = grid
+        return grid
+
+    def _propagate_body_mask(self, frame_gray):
+        """
+        Warps the previous body mask onto the current frame with dense optical flow.
+        Returns (warped_mask, error) where error is how badly the warped previous
+        frame matches the current one (0.0-1.0).
+        """
+        h, w = frame_gray.shape[:2]
+        flow_w = min(w, self.flow_width)
+        flow_h = max(1, int(round(h * flow_w / w)))
 
-        # 2. Motion Analysis
-        frame_gray = cv2.cvtColor(frame_rgb, cv2.COLOR_RGB2GRAY)
+        cur_small = cv2.resize(frame_gray, (flow_w, flow_h), interpolation=cv2.INTER_AREA)
+        prev_small = cv2.resize(self.prev_gray, (flow_w, flow_h), interpolation=cv2.INTER_AREA)
+
+        # Backward flow (current -> previous) so every current pixel knows where to sample from
+        flow = cv2.calcOpticalFlowFarneback(cur_small, prev_small, None, 0.5, 2, 9, 2, 5, 1.1, 0)
+
+        # Propagation error: warp the previous frame the same way and compare
+        xs, ys = self._get_flow_grid(flow_w, flow_h)
+        warped_prev = cv2.remap(prev_small, xs + flow[..., 0], ys + flow[..., 1],
+                                cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+        error = float(cv2.absdiff(warped_prev, cur_small).mean()) / 255.0
+
+        # Scale the flow up to mask resolution and warp the mask
+        flow_full = self.buffers.get("flow_full", (h, w, 2), np.float32)
+        flow_full = cv2.resize(flow, (w, h), dst=flow_full, interpolation=cv2.INTER_LINEAR)
+        flow_full *= w / flow_w
+        xs_full, ys_full = self._get_flow_grid(w, h)
+        map_x = np.add(xs_full, flow_full[..., 0], out=self.buffers.get("map_x", (h, w), np.float32))
+        map_y = np.add(ys_full, flow_full[..., 1], out=self.buffers.get("map_y", (h, w), np.float32))
+        warped_mask = cv2.remap(self.prev_body_mask, map_x, map_y, cv2.INTER_LINEAR,
+                                dst=self.buffers.get(f"body{self.frame_parity}", (h, w)),
+                                borderMode=cv2.BORDER_REPLICATE)
+        return warped_mask, error
+
+    def _get_body_mask(self, frame_rgb, frame_gray):
+        # Keyframe decision: static scenes reuse the last mask, motion forces inference
+        run_model = (
+            not self.keyframe_mode
+            or self.prev_body_mask is None
+            or self.prev_gray is None
+            or self.frames_since_keyframe + 1 >= self.keyframe_interval
+            or self.motion_score > self.keyframe_motion_threshold
+        )
+
+        body_mask = None
+        if not run_model:
+            body_mask, self.propagation_error = self._propagate_body_mask(frame_gray)
+            if self.propagation_error > self.propagation_error_threshold:
+                body_mask = None
+
+        if body_mask is None:
+            h, w = frame_gray.shape[:2]
+            body_mask = self._run_model(frame_rgb, self.buffers.get(f"body{self.frame_parity}", (h, w)))
+            self.frames_since_keyframe = 0
+            self.keyframe_count += 1
+        else:
+            self.frames_since_keyframe += 1
+            self.propagated_count += 1
+
+        self.prev_body_mask = body_mask
+        return body_mask
+
+    def get_keyframe_stats(self):
+        return {
+            "keyframes": self.keyframe_count,
+            "propagated": self.propagated_count,
+            "frames_since_keyframe": self.frames_since_keyframe,
+            "propagation_error": self.propagation_error,
+        }
+
+    def _compute_mask(self, frame_rgb):
+        h, w = frame_rgb.shape[:2]
+        buffers = self.buffers
+        # This frame's gray/masks go to the other half of the double buffers
+        self.frame_parity ^= 1
+        parity = self.frame_parity
+
+        # 1. Motion Analysis
+        frame_gray = cv2.cvtColor(frame_rgb, cv2.COLOR_RGB2GRAY, dst=buffers.get(f"gray{parity}", (h, w)))
         if self.prev_gray is not None:
-            diff = cv2.absdiff(frame_gray, self.prev_gray)
+            diff = cv2.absdiff(frame_gray, self.prev_gray, dst=buffers.get("diff", (h, w)))
             self.motion_score = np.sum(diff) / (diff.size * 255)
         else:
             self.motion_score = 0.0
 
+        # 2. MediaPipe Body (The "Core"), or the warped keyframe mask
+        mp_mask = self._get_body_mask(frame_rgb, frame_gray)
+
         # Thresholds:
         # > 0.02 means "Moving" (Use aggressive skin glue)
         # > 0.05 means "Fast" (Drop temporal smoothing)
         is_moving = self.motion_score > 0.02
 
         # 3. Intelligent Skin Recovery
-        skin_mask = self._get_skin_mask(frame_rgb, is_moving)
+        if self.skin_recovery:
+            # A. Create Seed from Body (confidence > 0.5)
+            _, seed_mask = cv2.threshold(mp_mask, 127, 1, cv2.THRESH_BINARY, dst=buffers.get("seed", (h, w)))
 
-        # A. Create Seed from Body
-        _, seed_mask = cv2.threshold(mp_mask, 0.5, 1.0, cv2.THRESH_BINARY)
-        seed_mask = seed_mask.astype(np.uint8)
+            # B. Dynamic Search Area
+            # If moving, expand the search area massively (51x51 kernel)
+            # because the hand might be far from where MediaPipe thinks the body is.
+            search_area = buffers.get("search", (h, w))
+            if is_moving:
+                search_area = cv2.dilate(seed_mask, self.kernel_search_moving, dst=search_area, iterations=3)
+            else:
+                search_area = cv2.dilate(seed_mask, self.kernel_search_static, dst=search_area, iterations=3)
 
-        # B. Dynamic Search Area
-        # If moving, expand the search area massively (51x51 kernel)
-        # because the hand might be far from where MediaPipe thinks the body is.
-        if is_moving:
-            search_area = cv2.dilate(seed_mask, self.kernel_search_moving, iterations=3)
-        else:
-            search_area = cv2.dilate(seed_mask, self.kernel_search_static, iterations=3)
+            # Skin detection only runs around the search area
+            skin_mask = self._get_skin_mask(frame_rgb, is_moving, search_area)
 
-        # C. Filter Skin
-        valid_skin = cv2.bitwise_and(skin_mask, skin_mask, mask=search_area)
+            # C. Filter Skin
+            valid_skin = buffers.get("valid_skin", (h, w))
+            valid_skin.fill(0)
+            valid_skin = cv2.bitwise_and(skin_mask, skin_mask, dst=valid_skin, mask=search_area)
 
-        # D. Combine
-        combined_mask = np.maximum(mp_mask, valid_skin)
+            # D. Combine
+            combined_mask = cv2.max(mp_mask, valid_skin, dst=buffers.get("combined", (h, w)))
+        else:
+            combined_mask = mp_mask
 
         # 4. Temporal Smoothing
         current_alpha = self.base_alpha
@@ -105,18 +406,21 @@ class PersonSegmenter:
         if self.motion_score > 0.05:
             current_alpha = 0.0
 
+        final_mask = buffers.get(f"smooth{parity}", (h, w))
         if self.prev_mask is not None:
-            final_mask = (combined_mask * (1.0 - current_alpha)) + (self.prev_mask * current_alpha)
+            final_mask = cv2.addWeighted(combined_mask, 1.0 - current_alpha, self.prev_mask, current_alpha, 0,
+                                         dst=final_mask)
         else:
-            final_mask = combined_mask
+            np.copyto(final_mask, combined_mask)
 
         # 5. Output
-        _, output_binary = cv2.threshold(final_mask, 0.5, 1.0, cv2.THRESH_BINARY)
+        _, output_binary = cv2.threshold(final_mask, 127, 255, cv2.THRESH_BINARY,
+                                         dst=buffers.get(f"mask{parity}", (h, w)))
 
         self.prev_gray = frame_gray
         self.prev_mask = final_mask
 
-        return np.expand_dims(output_binary, axis=-1)
+        return output_binary
 
     def get_motion_score(self):
         return self.motion_score
\ No newline at end of file
@@ -0,0 +1,12 @@
+import cv2
+import numpy as np
+
+# Standard Skin Range (YCrCb)
+LOWER_SKIN = np.array([0, 133, 77], dtype=np.uint8)
+UPPER_SKIN = np.array([255, 173, 127], dtype=np.uint8)
+
+
+def skin_rule(frame_rgb, dst=None, ycrcb=None):
+    # The fixed YCrCb rule, 0/255
+    ycrcb = cv2.cvtColor(frame_rgb, cv2.COLOR_RGB2YCrCb, dst=ycrcb)
+    return cv2.inRange(ycrcb, LOWER_SKIN, UPPER_SKIN, dst=dst)
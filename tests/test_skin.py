@@ -0,0 +1,27 @@
+import unittest
+
+import numpy as np
+
+from benchmarks.synthetic import make_frame, make_skin_mask
+from processing.skin import skin_rule
+
+
+class SkinRuleTest(unittest.TestCase):
+    def test_rule_covers_synthetic_skin(self):
+        for resolution, index in (("480p", 0), ("720p", 7), ("480p", 200)):
+            skin = make_skin_mask(resolution, index) > 0
+            rule = skin_rule(make_frame(resolution, index)) > 0
+            self.assertTrue(rule[skin].all())
+            self.assertLess(rule[~skin].mean(), 0.5)
+
+    def test_rule_reuses_buffers(self):
+        frame = make_frame("480p", 3)
+        dst = np.empty(frame.shape[:2], dtype=np.uint8)
+        ycrcb = np.empty_like(frame)
+        result = skin_rule(frame, dst=dst, ycrcb=ycrcb)
+        self.assertIs(result, dst)
+        np.testing.assert_array_equal(result, skin_rule(frame))
+
+
+if __name__ == "__main__":
+    unittest.main()
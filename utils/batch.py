@@ -0,0 +1,221 @@
+import math
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from processing.effect_graph import EFFECTS
+
+
+def parse_effect_spec(spec):
+    """
+    Effect spec used on the command line: "none", "blur", "glitch", "pixelate"
+    or "pattern:<image path>", or several joined with "+" to stack them
+    ("blur+glitch", "pattern:beach.jpg+pixelate").
+    Returns (effect_mode, pattern_path), effect_mode being e.g. "blur+glitch".
+    """
+    modes = []
+    pattern_path = None
+    for part in spec.split("+"):
+        mode, _, argument = part.partition(":")
+        mode = mode.strip().lower()
+
+        if mode != "none" and mode not in EFFECTS:
+            raise ValueError(f"Unknown effect '{mode}', expected one of none, {', '.join(EFFECTS)}")
+        if mode == "pattern":
+            if not argument:
+                raise ValueError("Pattern effect needs an image: pattern:<path>")
+            if not os.path.exists(argument):
+                raise ValueError(f"Pattern image '{argument}' does not exist")
+            pattern_path = argument
+        if mode not in modes:
+            modes.append(mode)
+
+    if len(modes) > 1 and "none" in modes:
+        modes.remove("none")
+    return "+".join(modes), pattern_path
+
+
+def build_processor(effect_spec, use_cameraman=True, backend=None, segmenter=None, keyframe_mode=False):
+    # Imported here so the spec parsing above stays usable without mediapipe
+    from processing.frame_processor import FrameProcessor
+
+    mode, pattern_path = parse_effect_spec(effect_spec)
+    if segmenter is None:
+        from processing.segmenter import PersonSegmenter
+
+        segmenter = PersonSegmenter(backend=backend, keyframe_mode=keyframe_mode)
+    processor = FrameProcessor(segmenter=segmenter, use_cameraman=use_cameraman)
+    processor.set_effect_mode(mode)
+    if pattern_path:
+        processor.backgrounds.register(pattern_path, pattern_path)
+        processor.set_selected_pattern(pattern_path)
+    return processor
+
+
+def plan_chunks(frame_count, workers, chunk_frames=None, overlap=15):
+    """
+    Splits [0, frame_count) into consecutive (start, end) ranges.
+    """
+    if frame_count <= 0:
+        return [(0, None)]
+
+    if chunk_frames is None:
+        chunk_frames = math.ceil(frame_count / max(1, workers))
+    # Chunks much shorter than the warm-up would spend most of their time warming up
+    chunk_frames = max(chunk_frames, 4 * overlap, 1)
+
+    return [(start, min(start + chunk_frames, frame_count)) for start in range(0, frame_count, chunk_frames)]
+
+
+def init_worker():
+    # The pool already runs one process per core, OpenCV's own thread pool in
+    # every worker would only compete with the other workers for those cores
+    cv2.setNumThreads(1)
+
+
+def process_chunk(input_path, start, end, overlap, effect_spec, use_cameraman, chunk_path, backend=None,
+                  keyframe_mode=False):
+    """
+    Worker entry point. Runs in its own process with its own segmenter.
+
+    The segmenter and the cameraman carry temporal state (previous mask, motion,
+    smoothed crop), so the chunk starts `overlap` frames early and throws those
+    frames away once the state is warmed up.
+    """
+    processor = build_processor(effect_spec, use_cameraman, backend, keyframe_mode=keyframe_mode)
+
+    cap = cv2.VideoCapture(input_path)
+    warm_start = max(0, start - overlap)
+    if warm_start > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, warm_start)
+
+    writer = None
+    frames_written = 0
+    index = warm_start
+
+    while end is None or index < end:
+        ret, frame = cap.read()
+        if not ret:
+            break
+
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        processed_frame, _ = processor.process(rgb_frame)
+
+        if index >= start:
+            if writer is None:
+                height, width = processed_frame.shape[:2]
+                # Intermediate chunks are lossless (HuffYUV), so the output is only compressed once, when stitching
+                writer = cv2.VideoWriter(chunk_path, cv2.VideoWriter_fourcc(*"HFYU"), 30, (width, height))
+            writer.write(cv2.cvtColor(processed_frame, cv2.COLOR_RGB2BGR))
+            frames_written += 1
+
+        index += 1
+
+    cap.release()
+    if writer is not None:
+        writer.release()
+
+    return chunk_path, frames_written
+
+
+def stitch_chunks(chunk_paths, output_path, fps):
+    writer = None
+    frames_written = 0
+
+    for chunk_path in chunk_paths:
+        cap = cv2.VideoCapture(chunk_path)
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if writer is None:
+                height, width = frame.shape[:2]
+                writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+            writer.write(frame)
+            frames_written += 1
+        cap.release()
+
+    if writer is not None:
+        writer.release()
+
+    return frames_written
+
+
+def get_video_info(input_path):
+    cap = cv2.VideoCapture(input_path)
+    if not cap.isOpened():
+        return None
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    cap.release()
+    return frame_count, fps
+
+
+def default_output_path(input_path, output_dir=None):
+    base, _ = os.path.splitext(os.path.basename(input_path))
+    directory = output_dir if output_dir else os.path.dirname(os.path.abspath(input_path))
+    return os.path.join(directory, f"{base}_processed.mp4")
+
+
+def run_batch(input_paths, effect_spec, output_dir=None, workers=None, chunk_frames=None, overlap=15,
+              use_cameraman=True, backend=None, keyframe_mode=False):
+    """
+    Processes every input video with a shared process pool and writes
+    <name>_processed.mp4 next to the input (or into output_dir).
+    """
+    # Fail early on a bad spec instead of inside every worker
+    parse_effect_spec(effect_spec)
+
+    workers = workers or os.cpu_count() or 1
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    temp_dir = tempfile.mkdtemp(prefix="batch_chunks_")
+    results = []
+    batch_start = time.time()
+
+    # Spawn: mediapipe keeps native threads around that do not survive a fork
+    context = multiprocessing.get_context("spawn")
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker) as executor:
+            jobs = []
+            for file_index, input_path in enumerate(input_paths):
+                info = get_video_info(input_path)
+                if info is None:
+                    print(f"[ERROR] Could not open {input_path}")
+                    continue
+
+                frame_count, fps = info
+                chunks = plan_chunks(frame_count, workers, chunk_frames, overlap)
+                futures = []
+                for chunk_index, (start, end) in enumerate(chunks):
+                    chunk_path = os.path.join(temp_dir, f"{file_index:03}_{chunk_index:05}.avi")
+                    futures.append(executor.submit(
+                        process_chunk, input_path, start, end, overlap, effect_spec, use_cameraman, chunk_path,
+                        backend, keyframe_mode
+                    ))
+                jobs.append((input_path, fps, futures))
+                print(f"[INFO] {input_path}: {frame_count} frames in {len(chunks)} chunks")
+
+            for input_path, fps, futures in jobs:
+                # Collect in submission order so the output is stitched in order
+                chunk_paths = [future.result()[0] for future in futures]
+                output_path = default_output_path(input_path, output_dir)
+                frames = stitch_chunks([p for p in chunk_paths if os.path.exists(p)], output_path, fps)
+                results.append((input_path, output_path, frames))
+                print(f"[INFO] Wrote {output_path} ({frames} frames)")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    elapsed = time.time() - batch_start
+    total_frames = sum(frames for _, _, frames in results)
+    if elapsed > 0:
+        print(f"[INFO] {total_frames} frames in {elapsed:.1f}s ({total_frames / elapsed:.1f} fps, {workers} workers)")
+
+    return results
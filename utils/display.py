@@ -0,0 +1,70 @@
+import numpy as np
+from PIL import Image, ImageTk
+
+
+class DisplayRenderer:
+    """
+    Puts RGB frames into a Tk label through a single reused PhotoImage.
+
+    Frames arrive already resampled to the widget size (the cameraman crop is
+    scaled straight to it), so showing one is a pixel copy into the existing
+    Tk image. Nothing is rendered while the widget is hidden or while its size
+    is still changing (startup, window resize).
+    """
+
+    def __init__(self, label, get_size=None, settle_ticks=2):
+        self.label = label
+        self.get_size = get_size or (lambda: (label.winfo_width(), label.winfo_height()))
+        self.settle_ticks = settle_ticks
+
+        self.photo = None
+        # Settled widget size, read by the processing worker (None = don't render)
+        self.size = None
+        self.pending_size = None
+        self.stable_ticks = 0
+        self.skipped = 0
+
+    def poll(self):
+        """
+        Tk thread, once per tick. Returns True when frames should be rendered.
+        """
+        if not self.label.winfo_viewable():
+            self.size = None
+            return False
+
+        size = tuple(self.get_size())
+        if size[0] <= 1 or size[1] <= 1:
+            self.size = None
+            return False
+
+        if size != self.pending_size:
+            self.pending_size = size
+            self.stable_ticks = 0
+            # The last shown image stays up until the new size settles
+            self.size = None
+            return False
+        if self.stable_ticks < self.settle_ticks:
+            self.stable_ticks += 1
+            return False
+
+        self.size = size
+        return True
+
+    def show(self, frame):
+        """
+        Tk thread. Copies an HxWx3 uint8 RGB frame into the Tk image.
+        Frames rendered for an outdated widget size are dropped.
+        """
+        h, w = frame.shape[:2]
+        if self.size is None or (w, h) != self.size:
+            self.skipped += 1
+            return False
+
+        if self.photo is None or (self.photo.width(), self.photo.height()) != (w, h):
+            self.photo = ImageTk.PhotoImage("RGB", (w, h))
+            self.label.configure(image=self.photo)
+
+        frame = np.ascontiguousarray(frame)
+        # frombuffer wraps the array without copying, paste() writes the Tk image in place
+        self.photo.paste(Image.frombuffer("RGB", (w, h), frame, "raw", "RGB", 0, 1))
+        return True
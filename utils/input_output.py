@@ -1,24 +1,16 @@
 import os
 from PIL import Image
 from tkinter import filedialog
-import cv2
+from utils.thumbnails import ThumbnailCache
 
-def load_icon_images(directory_path, size=(260,100)):
-    images = []
-    if not os.path.exists(directory_path):
-        print("[ERROR] Directory does not exist")
-        return images
-
-    for file in os.listdir(directory_path):
-        if file.lower().endswith(".jpg"):
-            img_path = os.path.join(directory_path, file)
-            try:
-                img = Image.open(img_path).resize(size)
-                images.append((os.path.splitext(file)[0], img))
-            except Exception as e:
-                print("[ERROR] File not exist")
-
-    return images
+def iter_icon_images(files, size=(260,100), cache=None):
+    # (name, PIL thumbnail) per (name, path) in files, through the on-disk cache
+    cache = cache or ThumbnailCache(size=size)
+    for name, img_path in files:
+        try:
+            yield name, cache.get(img_path)
+        except Exception as e:
+            print(f"[ERROR] Could not load thumbnail {img_path}: {e}")
 
 def save_image(image):
     file_path = filedialog.asksaveasfilename(
@@ -29,20 +21,41 @@ def save_image(image):
         img = Image.fromarray(image)
         img.save(file_path)
 
-def save_video(video, fps = 30):
+def save_video(recording):
+    if os.path.isdir(recording.path):
+        # Raw frames + masks, re-rendered later with `main.py rerender`
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".capture",
+            filetypes=[("Raw + mask capture", "*.capture"), ("All files", "*.*")]
+        )
+    else:
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".mp4",
+            filetypes=[("MP4 files", "*.mp4"), ("All files", "*.*")]
+        )
+
+    if file_path:
+        # The recorder already encoded the frames, just move the file into place
+        recording.save(file_path)
+        return True
+    return False
+
+def save_replay(live_feed, seconds=30):
+    # Returns the running ReplayExport, or None when cancelled
     file_path = filedialog.asksaveasfilename(
         defaultextension=".mp4",
+        initialfile="replay.mp4",
         filetypes=[("MP4 files", "*.mp4"), ("All files", "*.*")]
     )
-
     if file_path:
-        height, width, _ = video[0].shape
+        return live_feed.save_replay(file_path, seconds)
+    return None
 
-        out = cv2.VideoWriter(file_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
-
-        for frame in video:
-            # Convert RGB -> BGR before writing
-            bgr_frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-            out.write(bgr_frame)
-
-        out.release()
+def save_trace(live_feed):
+    file_path = filedialog.asksaveasfilename(
+        defaultextension=".json",
+        initialfile="trace.json",
+        filetypes=[("Chrome trace", "*.json"), ("All files", "*.*")]
+    )
+    if file_path:
+        live_feed.export_trace(file_path)
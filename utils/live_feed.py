@@ -1,13 +1,27 @@
+import time
+from collections import deque
+from concurrent.futures import Future
+
 import cv2
-import customtkinter as ctk
-from PIL import Image
-from processing.segmenter import PersonSegmenter
-from processing.background_apply import apply_blur_background, apply_pattern_background
+import numpy as np
 from processing.cameraman import SmartCameraman
-from processing.effects import apply_glitch, apply_pixelation
+from processing.buffer_pool import BufferPool
+from processing.frame_processor import FrameProcessor
+from processing.governor import QualityGovernor
+from processing.seg_backends import LazyBackend
+from processing.segmenter import PersonSegmenter
+from utils.display import DisplayRenderer
+from utils.mask_capture import MaskCaptureWriter
+from utils.perf_trace import PerfTracer
+from utils.pipeline import FramePipeline
+from utils.recorder import VideoRecorder
+from utils.replay import ReplayBuffer
+from utils.seg_worker import ProcessSegmenter
 
 class LiveFeed:
-    def __init__(self, root, cap, video_label, get_frame_size_callback):
+    def __init__(self, root, cap, video_label, get_frame_size_callback, backgrounds=None, segmenter_backend=None,
+                 target_fps=30, replay_seconds=30, replay_budget_mb=256, started=None, segmentation_process=False,
+                 preview_width=None, keyframe_mode=False):
         self.root = root
         self.cap = cap
         self.video_label = video_label
@@ -15,87 +29,379 @@ class LiveFeed:
 
         self.is_paused = False
         self.is_recording = False
-        self.recorded_frames = []
+        self.recorder = None
+        # Record raw frames + masks instead of the rendered video, to re-render later
+        self.capture_raw = False
         self.after_id = None
-        self.last_processed_frame = None
+        # (uncropped frame, cameraman rect, capture size), cropped at full resolution only when asked for
+        self.last_frame = None
+
+        # Dual resolution: the camera runs at its full size and the live view
+        # processes a copy scaled down to preview_width; photos and recordings are
+        # rendered at full size from the preview's mask. None = frames as captured
+        self.preview_width_setting = preview_width
+        self.preview_width = preview_width
+        # Futures of request_full_frame(), answered by the worker with its next frame
+        self.full_frame_requests = deque()
+
+        # Display tick only polls for finished frames, the heavy work runs in the pipeline
+        self.display_interval_ms = 15
+        # One reused Tk image; its settled size is what the worker renders to
+        self.display = DisplayRenderer(video_label, get_size=get_frame_size_callback)
+        # Display frames rotate through reused buffers: the display queue holds 2,
+        # the Tk thread copies one out, the worker writes the next
+        self.buffers = BufferPool()
+
+        # Per-stage timings for the last frames, optional FPS/latency overlay,
+        # startup milestones measured from `started` (process start)
+        self.tracer = PerfTracer(started=started)
+        self.startup_reported = False
+        self.show_overlay = False
+        self.overlay_text = ""
+        self.overlay_updated = 0.0
+        # Set when no segmentation model could be loaded, shown over the live view
+        self.model_error = None
+
+        # The model loads and warms up on its own thread (or in a worker process,
+        # pipelined one frame ahead), the camera shows unprocessed until then
+        self.pipelined = segmentation_process
+        if segmentation_process:
+            segmenter = ProcessSegmenter(backend=segmenter_backend, on_ready=self._on_model_ready,
+                                         on_error=self._on_model_error, keyframe_mode=keyframe_mode).start()
+        else:
+            if segmenter_backend is None or isinstance(segmenter_backend, str):
+                segmenter_backend = LazyBackend(segmenter_backend, on_ready=self._on_model_ready).start()
+            segmenter = PersonSegmenter(backend=segmenter_backend, keyframe_mode=keyframe_mode)
+
+        self.processor = FrameProcessor(
+            segmenter=segmenter,
+            # Cheap projection tracker with a constant-velocity predictor, less crop lag
+            cameraman=SmartCameraman(tracking="moments"),
+            backgrounds=backgrounds,
+            tracer=self.tracer,
+        )
+
+        self.pipeline = FramePipeline(self.cap, self.process_frame, tracer=self.tracer)
+
+        # Always-on instant replay of the last seconds, JPEG-compressed off the worker (0 = off)
+        self.replay = None
+        if replay_seconds > 0 and replay_budget_mb > 0:
+            self.replay = ReplayBuffer(seconds=replay_seconds, fps=target_fps, memory_budget_mb=replay_budget_mb)
+            self.replay.start()
+
+        # Steps quality down when frames take longer than the target allows
+        self.governor = QualityGovernor(target_fps=target_fps, apply_callback=self._apply_quality)
 
-        self.segmenter = PersonSegmenter()
-        self.cameraman = SmartCameraman()
-        self.selected_pattern = None
-        self.effect_mode = "none"
+        self.pipeline.start()
 
         self.update_video()
 
     def set_effect_mode(self, effect_mode):
-        self.effect_mode = effect_mode
+        self.processor.set_effect_mode(effect_mode)
 
     def set_selected_pattern(self, selected_pattern):
-        self.selected_pattern = selected_pattern
+        self.processor.set_selected_pattern(selected_pattern)
+
+    def set_target_fps(self, target_fps):
+        self.governor.set_target_fps(target_fps)
+
+    def get_quality_level(self):
+        return self.governor.get_state()
+
+    def _on_model_ready(self, backend):
+        # Model warm-up thread
+        self.tracer.mark_startup("model_ready")
+
+    def _on_model_error(self, backend, error):
+        # Processing worker, from the segmenter's is_ready()
+        self.model_error = error
+
+    def _report_startup(self):
+        milestones = ", ".join(f"{name} {ms:.0f} ms" for name, ms in self.tracer.startup_ms().items())
+        print(f"[INFO] Startup: {milestones}")
+        self.startup_reported = True
+
+    def _apply_quality(self, settings):
+        # Called by the governor on the processing worker, between two frames
+        segmenter = self.processor.segmenter
+        if segmenter.processing_scale != settings["processing_scale"]:
+            segmenter.set_processing_scale(settings["processing_scale"])
+        segmenter.skin_recovery = settings["skin_recovery"]
+        self.processor.blur_engine.set_quality(settings["blur_quality"])
+        capture_size = settings["capture_size"]
+        if self.preview_width_setting is None:
+            self.pipeline.set_capture_size(capture_size)
+        else:
+            # The camera stays at full size for photos and recordings, only the preview shrinks
+            self.preview_width = self.preview_width_setting
+            if capture_size is not None:
+                self.preview_width = min(self.preview_width, capture_size[0])
+
+        self.tracer.count("quality_changes")
+        print(f"[INFO] Quality level {self.governor.get_level()} ({settings['name']})")
 
     def get_last_processed_frame(self):
-        return self.last_processed_frame
+        # Full-resolution cameraman output of the newest frame (photos)
+        last_frame = self.last_frame
+        if last_frame is None:
+            return None
+        return self.processor.crop(*last_frame)
+
+    def request_full_frame(self):
+        """
+        Photo at the camera's full size: the worker renders its next frame at
+        full resolution. Returns a Future with the RGB frame (it stays pending
+        while the feed is paused or the model is loading). The frame is a pooled
+        buffer, overwritten by the photo after next: copy it to keep more.
+        """
+        request = Future()
+        self.full_frame_requests.append(request)
+        return request
+
+    def show_last_frame(self):
+        # Tk thread: the newest frame, cropped straight to the widget size
+        last_frame = self.last_frame
+        if last_frame is not None and self.display.poll():
+            processed_frame, rect, _ = last_frame
+            self.display.show(self.processor.crop(processed_frame, rect, self.display.size))
+
+    def show_still(self, frame):
+        # Tk thread: an already cropped frame (e.g. the last recorded one)
+        if self.display.poll():
+            self.display.show(self.processor.crop(frame, None, self.display.size))
+
+    def set_capture_raw(self, capture_raw):
+        # Takes effect at the next start_recording()
+        self.capture_raw = capture_raw
 
     def start_recording(self):
+        self.recorder = MaskCaptureWriter() if self.capture_raw else VideoRecorder()
+        self.recorder.start()
         self.is_recording = True
-        self.recorded_frames = []
 
     def stop_recording(self):
+        # Returns a Recording that is already encoded on disk
         self.is_recording = False
-        return self.recorded_frames.copy()
+        if self.recorder is None:
+            return None
+        recording = self.recorder.stop()
+        if isinstance(self.recorder, MaskCaptureWriter):
+            # Nothing rendered was recorded, preview the live view's last frame
+            recording.last_frame = self.get_last_processed_frame()
+        self.recorder = None
+        return recording
+
+    def save_replay(self, file_path, seconds=30):
+        # Returns a ReplayExport writing on its own thread, the live feed keeps running
+        if self.replay is None:
+            return None
+        return self.replay.save(file_path, seconds)
+
+    def get_replay_stats(self):
+        return self.replay.get_stats() if self.replay is not None else None
+
+    def _add_replay_frame(self, processed_frame, rect, full_size):
+        timestamp = time.time()
+        slot, buffer = self.replay.acquire((full_size[1], full_size[0], 3), timestamp)
+        if slot is None:
+            return
+        frame = self.processor.crop(processed_frame, rect, full_size, buffer)
+        if frame is not buffer:
+            # Nothing to resample, crop() handed back the frame itself
+            np.copyto(buffer, frame)
+        self.replay.commit(slot, timestamp)
 
     def pause(self):
         self.is_paused = True
+        self.pipeline.pause()
 
     def resume(self):
         self.is_paused = False
+        self.pipeline.resume()
+
+    def stop(self):
+        if self.after_id:
+            self.video_label.after_cancel(self.after_id)
+            self.after_id = None
+        self.pipeline.stop()
+        self.pipeline.release()
+        if self.pipelined:
+            self.processor.segmenter.stop()
+        if self.replay is not None:
+            self.replay.stop()
+        if self.is_recording:
+            self.stop_recording().discard()
 
     def get_frame_size(self):
         return self.get_frame_size_callback()
 
+    def get_queue_depths(self):
+        return self.pipeline.get_queue_depths()
+
+    def get_pipeline_stats(self):
+        return self.pipeline.get_stats()
+
+    def toggle_overlay(self):
+        self.show_overlay = not self.show_overlay
+
+    def get_perf_summary(self):
+        summary = self.tracer.summary()
+        summary["pipeline"] = self.pipeline.get_stats()
+        summary["quality"] = self.governor.get_state()
+        summary["replay"] = self.get_replay_stats()
+        return summary
+
+    def export_trace(self, file_path):
+        return self.tracer.export_chrome_trace(file_path, metadata={"pipeline": self.pipeline.get_stats()})
+
+    def _draw_overlay(self, frame):
+        # Refresh the numbers twice a second, percentiles over the ring are not free
+        now = time.perf_counter()
+        if now - self.overlay_updated > 0.5:
+            depths = self.pipeline.get_queue_depths()
+            self.overlay_text = (f"{self.tracer.overlay_text()}\n"
+                                 f"queues capture {depths['capture']} display {depths['display']}  "
+                                 f"quality {self.governor.get_level_name()}")
+            self.overlay_updated = now
+
+        cv2.rectangle(frame, (5, 5), (420, 42), (0, 0, 0), -1)
+        for index, line in enumerate(self.overlay_text.split("\n")):
+            cv2.putText(frame, line, (10, 20 + 16 * index), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 255, 0), 1,
+                        cv2.LINE_AA)
+
+    def _draw_model_error(self, frame):
+        # Effects are off without a model, say so instead of showing the plain camera
+        h = frame.shape[0]
+        cv2.rectangle(frame, (5, h - 27), (frame.shape[1] - 5, h - 5), (0, 0, 0), -1)
+        cv2.putText(frame, f"Segmentation unavailable: {self.model_error}"[:100], (10, h - 12),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 80, 80), 1, cv2.LINE_AA)
+
     def is_lf_recording(self):
         return self.is_recording
 
-    def update_video(self):
-        if not self.is_paused:
-            ret, frame = self.cap.read()
-            if ret:
-                frame = cv2.flip(frame, 1)
+    def _preview_frame(self, full_frame):
+        # The frame the live view processes: full_frame itself, or a copy scaled to preview_width
+        h, w = full_frame.shape[:2]
+        if self.preview_width is None or w <= self.preview_width:
+            return full_frame
+        size = (self.preview_width, max(1, int(round(h * self.preview_width / w))))
+        out = self.buffers.get(self.buffers.ring_name("preview"), (size[1], size[0], 3))
+        return cv2.resize(full_frame, size, dst=out, interpolation=cv2.INTER_AREA)
 
-                rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    def _render_output(self, full_frame, rgb_frame, mask, processed_frame, rect, frame_id, out=None):
+        # Photo/recording frame at the camera's full size, and its mask. Written into out
+        # when given (a buffer the caller owns), otherwise it may be a reused buffer
+        if full_frame is rgb_frame:
+            full_size = (rgb_frame.shape[1], rgb_frame.shape[0])
+            frame = self.processor.crop(processed_frame, rect, full_size, out)
+        else:
+            with self.tracer.stage(frame_id, "full_res"):
+                frame, mask = self.processor.render_full_resolution(full_frame, rgb_frame, mask,
+                                                                    self.processor.last_rect, out=out)
+        if out is not None and frame is not out:
+            # Nothing to resample, crop() handed back the effect buffer itself
+            np.copyto(out, frame)
+            frame = out
+        return frame, mask
 
-                mask = self.segmenter.get_mask(rgb_frame)
+    def process_raw_frame(self, rgb_frame, frame_id=None):
+        # Worker, while the model is still loading: the camera as is, no effect or crop
+        full_size = (rgb_frame.shape[1], rgb_frame.shape[0])
+        self.last_frame = (rgb_frame, None, full_size)
 
-                if self.effect_mode == "blur":
-                    motion_score = self.segmenter.get_motion_score()
-                    processed_frame = apply_blur_background(rgb_frame, mask, motion_score)
+        size = self.display.size
+        if size is None:
+            return None
+        with self.tracer.stage(frame_id, "render"):
+            out = self.buffers.get(self.buffers.ring_name("display"), (size[1], size[0], 3))
+            display_frame = self.processor.crop(rgb_frame, None, size, out)
+        return display_frame, frame_id
 
-                elif self.effect_mode == "pattern" and self.selected_pattern is not None:
-                    processed_frame = apply_pattern_background(rgb_frame, mask, self.selected_pattern)
+    def process_frame(self, rgb_frame, frame_id=None):
+        # Runs on the processing worker thread
+        if not self.processor.segmenter.is_ready():
+            return self.process_raw_frame(rgb_frame, frame_id)
 
-                    # NEW MODES
-                elif self.effect_mode == "glitch":
-                    processed_frame = apply_glitch(rgb_frame, mask)
-                elif self.effect_mode == "pixelate":
-                    processed_frame = apply_pixelation(rgb_frame, mask)
+        start = time.perf_counter()
+        full_frame = rgb_frame
+        rgb_frame = self._preview_frame(full_frame)
+        if self.pipelined:
+            # The worker takes this frame, the previous one comes back to be composited
+            result = self.processor.segmenter.segment_async(rgb_frame, frame_id, keep=(rgb_frame, full_frame))
+            if result is None:
+                return None
+            (rgb_frame, full_frame), frame_id, mask = result
+            self.tracer.record_stage(frame_id, "segment_wait", start, time.perf_counter())
+            processed_frame, mask, rect = self.processor.composite(rgb_frame, mask, frame_id)
+        else:
+            processed_frame, mask, rect = self.processor.process_uncropped(rgb_frame, frame_id)
+        self.tracer.mark_startup("first_processed_frame")
+        full_size = (rgb_frame.shape[1], rgb_frame.shape[0])
+        self.last_frame = (processed_frame, rect, full_size)
 
-                else:
-                    processed_frame = rgb_frame
+        recorder = self.recorder
+        if self.is_recording and isinstance(recorder, MaskCaptureWriter):
+            full_mask = mask
+            if full_frame is not rgb_frame:
+                full_mask = self.processor.upsample_mask(mask, rgb_frame, full_frame)
+            recorder.add_frame(full_frame, full_mask, self.processor.segmenter.get_motion_score())
+        elif self.is_recording and recorder is not None:
+            # Rendered straight into one of the recorder's slots, the encoder frees it once converted
+            slot, frame = recorder.acquire(full_frame.shape)
+            if slot is not None:
+                self._render_output(full_frame, rgb_frame, mask, processed_frame, rect, frame_id, frame)
+                recorder.commit(slot)
 
-                processed_frame = self.cameraman.process(processed_frame, mask)
-                self.last_processed_frame = processed_frame.copy()
+        if self.full_frame_requests:
+            # The GUI holds one photo at a time, so two pooled buffers take turns
+            photo = self.buffers.get(self.buffers.ring_name("photo", 2), full_frame.shape)
+            self._render_output(full_frame, rgb_frame, mask, processed_frame, rect, frame_id, photo)
+            while self.full_frame_requests:
+                self.full_frame_requests.popleft().set_result(photo)
 
-                img = Image.fromarray(processed_frame)
+        if self.replay is not None:
+            with self.tracer.stage(frame_id, "replay"):
+                self._add_replay_frame(processed_frame, rect, full_size)
 
-                w, h = self.get_frame_size()
-                img = img.resize((w, h))
+        # Widget hidden or being resized: nothing to render
+        size = self.display.size
+        if size is None:
+            self.governor.record(time.perf_counter() - start)
+            return None
+
+        # Cameraman crop and widget scaling in a single resample, off the Tk thread
+        with self.tracer.stage(frame_id, "render"):
+            out = self.buffers.get(self.buffers.ring_name("display"), (size[1], size[0], 3))
+            display_frame = self.processor.crop(processed_frame, rect, size, out)
+
+            if self.show_overlay or self.model_error is not None:
+                if np.may_share_memory(display_frame, processed_frame):
+                    display_frame = display_frame.copy()
+            if self.show_overlay:
+                self._draw_overlay(display_frame)
+            if self.model_error is not None:
+                self._draw_model_error(display_frame)
+
+        self.governor.record(time.perf_counter() - start)
+        return display_frame, frame_id
+
+    def update_video(self):
+        display_active = self.display.poll()
 
-                imgtk = ctk.CTkImage(light_image=img, dark_image=img, size=(w, h))
-                self.video_label.configure(image=imgtk)
-                self.video_label.imgtk = imgtk
+        if not self.is_paused and display_active:
+            result = self.pipeline.get_latest_result()
+            if result is not None:
+                display_frame, frame_id = result
 
-                if self.is_recording:
-                    self.recorded_frames.append(processed_frame)
+                with self.tracer.stage(frame_id, "display"):
+                    shown = self.display.show(display_frame)
+                if shown and frame_id is not None:
+                    self.tracer.mark_displayed(frame_id)
+                if shown:
+                    self.tracer.mark_startup("first_frame")
+                    if not self.startup_reported and "first_processed_frame" in self.tracer.startup:
+                        self._report_startup()
 
         if self.after_id:
             self.video_label.after_cancel(self.after_id)
-        self.after_id = self.video_label.after(30, self.update_video)
\ No newline at end of file
+        self.after_id = self.video_label.after(self.display_interval_ms, self.update_video)
@@ -0,0 +1,267 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from utils.pipeline import DropOldestQueue
+from utils.recorder import Recording
+
+# A capture is a directory:
+#   frames.avi   raw frames, MJPG so every frame is a keyframe and seeking is exact
+#   masks.rle    run-length encoded uint8 masks, one record per frame
+#   index.npy    one INDEX_DTYPE row per frame, memory-mapped on read
+#   meta.json    size, fps, format version
+CAPTURE_VERSION = 1
+INDEX_DTYPE = np.dtype([("offset", "<i8"), ("runs", "<i4"), ("timestamp", "<f8"), ("motion_score", "<f4")])
+
+
+def encode_mask_rle(mask):
+    """
+    Lossless run-length encoding of a uint8 mask. A hard mask is long runs of
+    0 and 255, ~100x smaller than raw; a guided mask (the full-size mask of a
+    scaled preview, or refine="guided") has a soft edge of short runs and
+    only gets ~4x smaller.
+    Returns (lengths uint32, values uint8).
+    """
+    flat = mask.ravel()
+    starts = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    starts = np.concatenate(([0], starts))
+    lengths = np.diff(np.append(starts, flat.size)).astype(np.uint32)
+    return lengths, flat[starts]
+
+
+def decode_mask_rle(lengths, values, shape):
+    return np.repeat(values, lengths).reshape(shape)
+
+
+class MaskCaptureWriter:
+    """
+    Records raw frames plus their masks, so any effect or cameraman setting can
+    be rendered later without segmenting again (see rerender_capture).
+
+    add_frame() copies the frame and mask into a drop-oldest queue, a
+    background thread encodes. Frames keep their timestamps, dropped ones are just missing.
+    """
+
+    def __init__(self, fps=30, queue_size=8, jpeg_quality=95):
+        self.fps = fps
+        self.jpeg_quality = jpeg_quality
+
+        self.queue = DropOldestQueue(queue_size)
+        self.is_running = False
+        self.thread = None
+
+        self.path = None
+        self.writer = None
+        self.mask_file = None
+        self.frame_size = None
+        self.index = []
+        self.offset = 0
+        self.error = None
+
+    def start(self):
+        self.path = tempfile.mkdtemp(prefix="capture_", suffix=".capture")
+        self.mask_file = open(os.path.join(self.path, "masks.rle"), "wb")
+
+        self.is_running = True
+        self.thread = threading.Thread(target=self._encode_loop, name="mask_capture", daemon=True)
+        self.thread.start()
+
+    def add_frame(self, frame, mask, motion_score=0.0, timestamp=None):
+        # Processing thread. Both arrays are reused buffers upstream, so they are copied
+        if not self.is_running:
+            return
+        if timestamp is None:
+            timestamp = time.time()
+        self.queue.put((timestamp, frame.copy(), mask.copy(), motion_score))
+
+    def stop(self):
+        self.is_running = False
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        if self.writer:
+            self.writer.release()
+            self.writer = None
+        if self.mask_file:
+            self.mask_file.close()
+            self.mask_file = None
+
+        np.save(os.path.join(self.path, "index.npy"), np.array(self.index, dtype=INDEX_DTYPE))
+        width, height = self.frame_size or (0, 0)
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump({"version": CAPTURE_VERSION, "width": width, "height": height, "fps": self.fps}, f)
+
+        return Recording(self.path, len(self.index), self.fps, None, self.error, self.queue.dropped)
+
+    def _open_writer(self, frame):
+        height, width = frame.shape[:2]
+        self.frame_size = (width, height)
+        path = os.path.join(self.path, "frames.avi")
+        self.writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), self.fps, self.frame_size)
+        if not self.writer.isOpened():
+            self.error = f"Could not open an MJPG video writer for {width}x{height}"
+            print(f"[ERROR] {self.error}, stopping the capture")
+            return False
+        self.writer.set(cv2.VIDEOWRITER_PROP_QUALITY, self.jpeg_quality)
+        return True
+
+    def _encode_loop(self):
+        while self.is_running or self.queue.qsize() > 0:
+            item = self.queue.get(timeout=0.1)
+            if item is None:
+                continue
+
+            timestamp, frame, mask, motion_score = item
+            if self.writer is None and not self._open_writer(frame):
+                # No frame would reach the stream, so the index would point past its end
+                self.is_running = False
+                break
+
+            # Capture size changes (quality governor) are scaled back to the first size
+            if (frame.shape[1], frame.shape[0]) != self.frame_size:
+                frame = cv2.resize(frame, self.frame_size)
+            if (mask.shape[1], mask.shape[0]) != self.frame_size:
+                mask = cv2.resize(mask, self.frame_size, interpolation=cv2.INTER_LINEAR)
+
+            self.writer.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+
+            lengths, values = encode_mask_rle(mask)
+            runs = len(values)
+            # lengths first and padded to 4 bytes, so the uint32 view stays aligned
+            padding = -(5 * runs) % 4
+            self.mask_file.write(lengths.tobytes())
+            self.mask_file.write(values.tobytes())
+            self.mask_file.write(b"\0" * padding)
+            self.index.append((self.offset, runs, timestamp, motion_score))
+            self.offset += 5 * runs + padding
+
+
+class MaskCaptureReader:
+    """
+    Random access to a capture: masks come straight out of the memory-mapped
+    sidecar, frames are seeked in the MJPG stream.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != CAPTURE_VERSION:
+            raise ValueError(f"Unsupported capture version {self.meta.get('version')} in {path}")
+
+        self.size = (self.meta["width"], self.meta["height"])
+        self.fps = self.meta["fps"]
+        self.index = np.load(os.path.join(path, "index.npy"), mmap_mode="r")
+        masks_path = os.path.join(path, "masks.rle")
+        # memmap refuses empty files
+        self.masks = np.memmap(masks_path, dtype=np.uint8, mode="r") if os.path.getsize(masks_path) else None
+
+        self.cap = cv2.VideoCapture(os.path.join(path, "frames.avi"))
+        self.position = 0
+
+    @property
+    def frame_count(self):
+        return len(self.index)
+
+    def get_timestamp(self, index):
+        return float(self.index[index]["timestamp"])
+
+    def get_motion_score(self, index):
+        return float(self.index[index]["motion_score"])
+
+    def get_mask(self, index):
+        record = self.index[index]
+        offset, runs = int(record["offset"]), int(record["runs"])
+        lengths = self.masks[offset:offset + 4 * runs].view(np.uint32)
+        values = self.masks[offset + 4 * runs:offset + 5 * runs]
+        return decode_mask_rle(lengths, values, (self.size[1], self.size[0]))
+
+    def read_frame(self, index):
+        # RGB frame; sequential reads skip the seek
+        if index != self.position:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+        ret, frame = self.cap.read()
+        if not ret:
+            return None
+        self.position = index + 1
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+    def close(self):
+        self.cap.release()
+        self.masks = None
+
+
+class RecordedSegmenter:
+    """
+    Stands in for PersonSegmenter in a FrameProcessor: get_mask() returns the
+    stored mask of the current capture frame instead of running the model.
+    """
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.position = 0
+
+    def seek(self, index):
+        self.position = index
+
+    def get_mask(self, frame_rgb=None):
+        return self.reader.get_mask(self.position)
+
+    def get_motion_score(self):
+        return self.reader.get_motion_score(self.position)
+
+
+def rerender_capture(capture_path, effect_spec, output_path, use_cameraman=True, start=0, end=None, warmup=15):
+    """
+    Renders frames [start, end) of a capture with any effect to a video file,
+    at compositing speed: the masks come from the sidecar. The cameraman is
+    warmed up on the `warmup` masks before start, which costs no frame decoding.
+    """
+    from utils.batch import build_processor
+
+    reader = MaskCaptureReader(capture_path)
+    end = reader.frame_count if end is None else min(end, reader.frame_count)
+    if start >= end:
+        print(f"[ERROR] No frames in range {start}-{end} ({reader.frame_count} in {capture_path})")
+        reader.close()
+        return 0
+
+    segmenter = RecordedSegmenter(reader)
+    processor = build_processor(effect_spec, use_cameraman, segmenter=segmenter)
+
+    if use_cameraman:
+        for index in range(max(0, start - warmup), start):
+            segmenter.seek(index)
+            processor.cameraman.compute_rect((reader.size[1], reader.size[0], 3), segmenter.get_mask())
+
+    writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*"mp4v"), reader.fps, reader.size)
+    frames_written = 0
+    render_start = time.time()
+    start_time = reader.get_timestamp(start)
+
+    try:
+        for index in range(start, end):
+            frame = reader.read_frame(index)
+            if frame is None:
+                break
+            segmenter.seek(index)
+            processed_frame, _ = processor.process(frame)
+            bgr_frame = cv2.cvtColor(processed_frame, cv2.COLOR_RGB2BGR)
+
+            # Constant frame rate from the capture timestamps, like VideoRecorder
+            slot = int(round((reader.get_timestamp(index) - start_time) * reader.fps))
+            while frames_written <= slot:
+                writer.write(bgr_frame)
+                frames_written += 1
+    finally:
+        writer.release()
+        reader.close()
+
+    elapsed = time.time() - render_start
+    print(f"[INFO] Wrote {output_path} ({end - start} frames in {elapsed:.1f}s)")
+    return frames_written
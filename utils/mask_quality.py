@@ -0,0 +1,90 @@
+import time
+
+import cv2
+import numpy as np
+
+
+def mask_iou(mask_a, mask_b):
+    a = mask_a > 127
+    b = mask_b > 127
+    union = np.count_nonzero(a | b)
+    if union == 0:
+        return 1.0
+    return np.count_nonzero(a & b) / union
+
+
+def edge_error(mask, reference, band=5):
+    """
+    Fraction of mismatching pixels inside a band around the reference edge,
+    where resolution loss shows up first. Both masks are thresholded, so soft
+    edges are judged by where they cross 50%.
+    """
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * band + 1, 2 * band + 1))
+    edge_band = cv2.morphologyEx(reference, cv2.MORPH_GRADIENT, kernel) > 0
+    if not np.any(edge_band):
+        return 0.0
+    mismatch = (mask > 127) != (reference > 127)
+    return float(np.count_nonzero(mismatch & edge_band)) / np.count_nonzero(edge_band)
+
+
+def load_frames(source, max_frames=120):
+    # source: video path or camera index
+    cap = cv2.VideoCapture(int(source) if str(source).isdigit() else source)
+    frames = []
+    while len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    cap.release()
+    return frames
+
+
+def compare_processing_scales(frames, scales=(1.0, 0.5, 0.25), refine_modes=("bilinear", "guided"),
+                              segmenter_factory=None):
+    """
+    Runs the same frames through PersonSegmenter at every processing scale and
+    compares latency and mask quality against the full-resolution masks.
+    Returns one dict per (scale, refine) pair.
+    """
+    if segmenter_factory is None:
+        from processing.segmenter import PersonSegmenter
+        segmenter_factory = PersonSegmenter
+
+    def run(scale, refine):
+        segmenter = segmenter_factory(processing_scale=scale, refine=refine)
+        masks = []
+        start = time.perf_counter()
+        for frame in frames:
+            # get_mask hands back a reused buffer
+            masks.append(segmenter.get_mask(frame).copy())
+        elapsed = time.perf_counter() - start
+        return masks, elapsed * 1000.0 / max(1, len(frames))
+
+    reference, reference_ms = run(1.0, refine_modes[0])
+
+    rows = []
+    for scale in scales:
+        for refine in refine_modes:
+            if scale >= 1.0:
+                masks, ms = reference, reference_ms
+            else:
+                masks, ms = run(scale, refine)
+            rows.append({
+                "scale": scale,
+                "refine": refine if scale < 1.0 else "-",
+                "ms_per_frame": ms,
+                "speedup": reference_ms / ms if ms > 0 else 0.0,
+                "iou": float(np.mean([mask_iou(m, r) for m, r in zip(masks, reference)])),
+                "edge_error": float(np.mean([edge_error(m, r) for m, r in zip(masks, reference)])),
+            })
+            if scale >= 1.0:
+                break
+    return rows
+
+
+def print_comparison(rows):
+    print(f"{'scale':>6} {'refine':>9} {'ms/frame':>9} {'speedup':>8} {'IoU':>7} {'edge err':>9}")
+    for row in rows:
+        print(f"{row['scale']:>6.2f} {row['refine']:>9} {row['ms_per_frame']:>9.2f} "
+              f"{row['speedup']:>7.2f}x {row['iou']:>7.4f} {row['edge_error']:>9.4f}")
@@ -0,0 +1,211 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+# Histogram bins for stage durations, log-spaced from 0.1 ms to 1 s
+HISTOGRAM_BINS_MS = np.logspace(-1, 3, 41)
+
+
+class PerfTracer:
+    """
+    Per-frame timing for the live pipeline.
+
+    Every frame gets an id when it is captured. Stages record their start time
+    and duration against that id in fixed-size ring buffers (the last
+    `capacity` frames), so memory never grows and the histograms/percentiles
+    always describe the recent window. The whole window can be exported as a
+    Chrome trace (chrome://tracing, Perfetto).
+    """
+
+    def __init__(self, capacity=900, started=None):
+        self.capacity = capacity
+        self.next_frame_id = 0
+        self.lock = threading.Lock()
+
+        self.frame_ids = np.full(capacity, -1, dtype=np.int64)
+        self.capture_times = np.zeros(capacity, dtype=np.float64)
+        self.display_times = np.full(capacity, np.nan, dtype=np.float64)
+
+        # stage name -> (start times, durations in seconds, thread names)
+        self.stages = {}
+        self.counters = {}
+
+        # Wall clock anchor so perf_counter values can be exported as absolute time
+        self.origin = time.perf_counter()
+
+        # Startup milestones (window shown, camera open, model ready, ...) as
+        # perf_counter times, measured from `started` (process start when given)
+        self.started = started if started is not None else self.origin
+        self.startup = {}
+
+    def now(self):
+        return time.perf_counter()
+
+    def begin_frame(self, capture_time=None):
+        with self.lock:
+            frame_id = self.next_frame_id
+            self.next_frame_id += 1
+
+        slot = frame_id % self.capacity
+        self.frame_ids[slot] = frame_id
+        self.capture_times[slot] = capture_time if capture_time is not None else self.now()
+        self.display_times[slot] = np.nan
+        for starts, durations, threads in self.stages.values():
+            starts[slot] = np.nan
+            durations[slot] = np.nan
+        return frame_id
+
+    def _stage_buffers(self, name):
+        buffers = self.stages.get(name)
+        if buffers is None:
+            with self.lock:
+                buffers = self.stages.get(name)
+                if buffers is None:
+                    buffers = (
+                        np.full(self.capacity, np.nan, dtype=np.float64),
+                        np.full(self.capacity, np.nan, dtype=np.float64),
+                        [""] * self.capacity,
+                    )
+                    self.stages[name] = buffers
+        return buffers
+
+    def record_stage(self, frame_id, name, start, end):
+        if frame_id is None:
+            return
+        slot = frame_id % self.capacity
+        if self.frame_ids[slot] != frame_id:
+            return  # frame already overwritten by a newer one
+        starts, durations, threads = self._stage_buffers(name)
+        starts[slot] = start
+        durations[slot] = end - start
+        threads[slot] = threading.current_thread().name
+
+    @contextmanager
+    def stage(self, frame_id, name):
+        start = self.now()
+        try:
+            yield
+        finally:
+            self.record_stage(frame_id, name, start, self.now())
+
+    def mark_displayed(self, frame_id, display_time=None):
+        slot = frame_id % self.capacity
+        if self.frame_ids[slot] == frame_id:
+            self.display_times[slot] = display_time if display_time is not None else self.now()
+
+    def mark_startup(self, name, t=None):
+        # First occurrence only, returns the time since start in ms
+        if name not in self.startup:
+            self.startup[name] = t if t is not None else self.now()
+        return (self.startup[name] - self.started) * 1000.0
+
+    def startup_ms(self):
+        return {name: (t - self.started) * 1000.0 for name, t in sorted(self.startup.items(), key=lambda item: item[1])}
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def _valid(self, values):
+        return values[~np.isnan(values)]
+
+    def stage_durations_ms(self, name):
+        if name not in self.stages:
+            return np.zeros(0)
+        return self._valid(self.stages[name][1]) * 1000.0
+
+    def latencies_ms(self):
+        return self._valid(self.display_times - self.capture_times) * 1000.0
+
+    def histogram(self, name):
+        """
+        Rolling histogram of a stage over the ring window: (bin_edges_ms, counts).
+        """
+        counts, edges = np.histogram(self.stage_durations_ms(name), bins=HISTOGRAM_BINS_MS)
+        return edges, counts
+
+    def fps(self):
+        displayed = self._valid(self.display_times)
+        if displayed.size < 2:
+            return 0.0
+        span = displayed.max() - displayed.min()
+        return (displayed.size - 1) / span if span > 0 else 0.0
+
+    @staticmethod
+    def _describe(values):
+        if values.size == 0:
+            return {"count": 0, "mean_ms": 0.0, "p50_ms": 0.0, "p99_ms": 0.0}
+        return {
+            "count": int(values.size),
+            "mean_ms": float(values.mean()),
+            "p50_ms": float(np.percentile(values, 50)),
+            "p99_ms": float(np.percentile(values, 99)),
+        }
+
+    def summary(self):
+        return {
+            "fps": self.fps(),
+            "latency": self._describe(self.latencies_ms()),
+            "stages": {name: self._describe(self.stage_durations_ms(name)) for name in list(self.stages)},
+            "counters": dict(self.counters),
+            "startup_ms": self.startup_ms(),
+        }
+
+    def overlay_text(self):
+        summary = self.summary()
+        latency = summary["latency"]
+        return f"{summary['fps']:.1f} FPS  latency {latency['p50_ms']:.0f}/{latency['p99_ms']:.0f} ms (p50/p99)"
+
+    def export_chrome_trace(self, file_path, metadata=None):
+        """
+        Writes the ring window in the Chrome trace event format.
+        """
+        pid = os.getpid()
+        events = []
+        thread_ids = {}
+
+        def tid(thread_name):
+            if thread_name not in thread_ids:
+                thread_ids[thread_name] = len(thread_ids) + 1
+                events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": thread_ids[thread_name],
+                               "args": {"name": thread_name}})
+            return thread_ids[thread_name]
+
+        def us(t):
+            return (t - self.origin) * 1e6
+
+        for slot in range(self.capacity):
+            frame_id = int(self.frame_ids[slot])
+            if frame_id < 0:
+                continue
+
+            for name, (starts, durations, threads) in list(self.stages.items()):
+                if np.isnan(durations[slot]):
+                    continue
+                events.append({
+                    "name": name, "cat": "stage", "ph": "X", "pid": pid, "tid": tid(threads[slot] or "main"),
+                    "ts": us(starts[slot]), "dur": durations[slot] * 1e6, "args": {"frame": frame_id},
+                })
+
+            if not np.isnan(self.display_times[slot]):
+                # capture -> display as an async span per frame
+                events.append({"name": "frame", "cat": "latency", "ph": "b", "id": frame_id, "pid": pid,
+                               "tid": tid("latency"), "ts": us(self.capture_times[slot])})
+                events.append({"name": "frame", "cat": "latency", "ph": "e", "id": frame_id, "pid": pid,
+                               "tid": tid("latency"), "ts": us(self.display_times[slot])})
+
+        for name, t in list(self.startup.items()):
+            events.append({"name": f"startup:{name}", "cat": "startup", "ph": "i", "s": "g", "pid": pid,
+                           "tid": tid("startup"), "ts": us(t)})
+
+        trace = {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {"summary": self.summary(), **(metadata or {})},
+        }
+        with open(file_path, "w") as f:
+            json.dump(trace, f)
+        return file_path
@@ -0,0 +1,232 @@
+import threading
+import time
+from collections import deque
+
+import cv2
+
+from processing.buffer_pool import BufferPool
+
+
+class DropOldestQueue:
+    """
+    Bounded queue between two pipeline stages.
+    When full, the oldest item is thrown away so the consumer always sees fresh frames.
+    """
+
+    def __init__(self, maxsize=2):
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._items = deque()
+        self._cond = threading.Condition()
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        # Blocks until an item is available, returns None on timeout
+        with self._cond:
+            if not self._items:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            return self._items.popleft()
+
+    def get_latest(self):
+        # Non-blocking: returns the newest item and discards the older ones
+        with self._cond:
+            if not self._items:
+                return None
+            self.dropped += len(self._items) - 1
+            item = self._items.pop()
+            self._items.clear()
+            return item
+
+    def clear(self):
+        with self._cond:
+            self._items.clear()
+
+    def qsize(self):
+        with self._cond:
+            return len(self._items)
+
+
+def open_camera(index=0, size=None):
+    """
+    size: (width, height) to ask the camera for; the driver picks the nearest
+    mode it has. None keeps the driver default.
+    """
+    cap = cv2.VideoCapture(index)
+    if size is not None and cap.isOpened():
+        # Most USB cameras only deliver their large modes at full frame rate as MJPG
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*"MJPG"))
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, size[0])
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, size[1])
+    return cap
+
+
+class FramePipeline:
+    """
+    Capture -> process -> display hand-off.
+
+    The capture thread reads the camera, the processing worker runs the
+    segmentation/effect chain and the Tk thread only picks up the newest result.
+    """
+
+    def __init__(self, cap, process_callback, queue_size=2, tracer=None):
+        # cap: a VideoCapture, or a function returning one. A function is called on
+        # the capture thread, so a slow camera open does not hold up the window
+        if callable(cap):
+            self.open_capture, self.cap = cap, None
+        else:
+            self.open_capture, self.cap = None, cap
+        self.process_callback = process_callback
+        self.tracer = tracer
+
+        self.capture_queue = DropOldestQueue(queue_size)
+        self.display_queue = DropOldestQueue(queue_size)
+
+        self.is_running = False
+        self.is_paused = False
+        self.threads = []
+
+        # Resolution changes are applied by the capture thread itself,
+        # VideoCapture must not be touched from two threads at once
+        self.capture_size_request = None
+        self.capture_size_pending = False
+        self.native_capture_size = None
+
+        # Captured frames rotate through reused buffers: 2 queued, 1 being processed,
+        # 1 waiting in a pipelined segmenter, 1 kept by the consumer as its last frame,
+        # 1 being written
+        self.buffers = BufferPool()
+        self.frame_slots = queue_size + 4
+        self.read_buffer = None
+
+        # Counters used by get_stats()
+        self.captured_count = 0
+        self.processed_count = 0
+
+    def start(self):
+        if self.is_running:
+            return
+        self.is_running = True
+        self.threads = [
+            threading.Thread(target=self._capture_loop, name="capture", daemon=True),
+            threading.Thread(target=self._process_loop, name="process", daemon=True),
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self.is_running = False
+        for thread in self.threads:
+            thread.join(timeout=1.0)
+        self.threads = []
+
+    def pause(self):
+        self.is_paused = True
+        self.capture_queue.clear()
+        self.display_queue.clear()
+
+    def resume(self):
+        self.is_paused = False
+
+    def set_capture_size(self, size):
+        # size: (width, height), or None to go back to the camera's native size
+        self.capture_size_request = size
+        self.capture_size_pending = True
+
+    def _apply_capture_size(self):
+        self.capture_size_pending = False
+        if self.native_capture_size is None:
+            self.native_capture_size = (int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                                        int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+
+        w, h = self.capture_size_request or self.native_capture_size
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, w)
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, h)
+
+    def _open_capture(self):
+        self.cap = self.open_capture()
+        if self.tracer is not None:
+            ms = self.tracer.mark_startup("camera_open")
+            print(f"[INFO] Camera open after {ms:.0f} ms")
+
+    def release(self):
+        # After stop(): the capture thread no longer reads
+        if self.cap is not None and self.cap.isOpened():
+            self.cap.release()
+
+    def _capture_loop(self):
+        if self.cap is None:
+            self._open_capture()
+
+        while self.is_running:
+            if self.capture_size_pending:
+                self._apply_capture_size()
+
+            read_start = time.perf_counter()
+            ret, frame = self.cap.read(self.read_buffer)
+            if not ret:
+                time.sleep(0.01)
+                continue
+            self.read_buffer = frame
+
+            # Keep draining the camera while paused so we never resume on a stale frame
+            if self.is_paused:
+                continue
+
+            capture_time = time.perf_counter()
+            frame = cv2.flip(frame, 1, dst=self.buffers.get("flipped", frame.shape))
+            rgb_frame = self.buffers.get(self.buffers.ring_name("rgb", self.frame_slots), frame.shape)
+            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=rgb_frame)
+            self.captured_count += 1
+
+            frame_id = None
+            if self.tracer is not None:
+                frame_id = self.tracer.begin_frame(capture_time)
+                self.tracer.record_stage(frame_id, "capture", read_start, time.perf_counter())
+
+            self.capture_queue.put((frame_id, capture_time, rgb_frame))
+
+    def _process_loop(self):
+        while self.is_running:
+            item = self.capture_queue.get(timeout=0.1)
+            if item is None or self.is_paused:
+                continue
+
+            frame_id, _, rgb_frame = item
+            try:
+                result = self.process_callback(rgb_frame, frame_id)
+            except Exception as e:
+                print(f"[ERROR] Frame processing failed: {e}")
+                continue
+
+            if result is not None:
+                self.processed_count += 1
+                self.display_queue.put(result)
+
+    def get_latest_result(self):
+        return self.display_queue.get_latest()
+
+    def get_queue_depths(self):
+        return {
+            "capture": self.capture_queue.qsize(),
+            "display": self.display_queue.qsize(),
+        }
+
+    def get_stats(self):
+        return {
+            "queue_depths": self.get_queue_depths(),
+            "dropped": {
+                "capture": self.capture_queue.dropped,
+                "display": self.display_queue.dropped,
+            },
+            "captured": self.captured_count,
+            "processed": self.processed_count,
+        }
@@ -0,0 +1,165 @@
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+class Recording:
+    """
+    A finished recording sitting in a temporary container file.
+
+    error is set (and frame_count 0) when nothing could be written.
+    dropped_frames counts frames the encoder fell behind on; the constant
+    frame rate fills their slots by repeating the previous frame.
+    """
+
+    def __init__(self, path, frame_count, fps, last_frame, error=None, dropped_frames=0):
+        self.path = path
+        self.frame_count = frame_count
+        self.fps = fps
+        self.last_frame = last_frame
+        self.error = error
+        self.dropped_frames = dropped_frames
+
+    def save(self, file_path):
+        # Already encoded, so saving is just a move
+        shutil.move(self.path, file_path)
+        self.path = file_path
+
+    def discard(self):
+        # A raw + mask capture is a directory (utils.mask_capture)
+        if self.path and os.path.isdir(self.path):
+            shutil.rmtree(self.path, ignore_errors=True)
+        elif self.path and os.path.exists(self.path):
+            os.remove(self.path)
+        self.path = None
+
+
+class VideoRecorder:
+    """
+    Streams frames into a temporary video file from a background encoder thread.
+
+    The processing worker renders each frame straight into one of a few
+    preallocated slots (acquire/commit, like ReplayBuffer), and the encoder
+    frees the slot as soon as it has converted the frame. When the encoder
+    falls behind, no slot is free and the frame is dropped. Frames are written
+    at a constant nominal fps using their timestamps: when the pipeline is
+    slower than the nominal rate the last frame is repeated, when it is faster
+    frames are skipped.
+    """
+
+    def __init__(self, fps=30, slots=8, fourcc="mp4v", suffix=".mp4"):
+        self.fps = fps
+        self.fourcc = fourcc
+        self.suffix = suffix
+
+        # Frame slots handed between the worker and the encoder thread
+        self.slots = [None] * slots
+        self.free_slots = queue.Queue()
+        for index in range(slots):
+            self.free_slots.put(index)
+        self.pending = queue.Queue()
+        self.dropped = 0
+        self.is_running = False
+        self.thread = None
+
+        self.path = None
+        self.writer = None
+        self.frame_size = None
+        self.start_time = None
+        self.frame_count = 0
+        # Encoder's own BGR copy of the newest frame, the slot goes back right away
+        self.bgr = None
+        self.last_frame = None
+        self.error = None
+
+    def start(self):
+        fd, self.path = tempfile.mkstemp(prefix="recording_", suffix=self.suffix)
+        os.close(fd)
+
+        self.is_running = True
+        self.thread = threading.Thread(target=self._encode_loop, name="recorder", daemon=True)
+        self.thread.start()
+
+    def acquire(self, shape):
+        """
+        Processing thread, never blocks. Returns (slot, buffer) to render an
+        HxWx3 RGB frame into, or (None, None) when the frame is not recorded
+        (stopped, or the encoder still holds every slot).
+        """
+        if not self.is_running:
+            return None, None
+        try:
+            slot = self.free_slots.get_nowait()
+        except queue.Empty:
+            self.dropped += 1
+            return None, None
+
+        buffer = self.slots[slot]
+        if buffer is None or buffer.shape != tuple(shape):
+            buffer = np.empty(shape, dtype=np.uint8)
+            self.slots[slot] = buffer
+        return slot, buffer
+
+    def commit(self, slot, timestamp=None):
+        # The slot's buffer is filled, hand it to the encoder
+        if timestamp is None:
+            timestamp = time.time()
+        self.pending.put((slot, timestamp))
+
+    def stop(self):
+        self.is_running = False
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        if self.writer:
+            self.writer.release()
+            self.writer = None
+        if self.frame_count:
+            self.last_frame = cv2.cvtColor(self.bgr, cv2.COLOR_BGR2RGB)
+
+        return Recording(self.path, self.frame_count, self.fps, self.last_frame, self.error, self.dropped)
+
+    def _open_writer(self, frame):
+        height, width = frame.shape[:2]
+        self.frame_size = (width, height)
+        self.writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*self.fourcc), self.fps, self.frame_size)
+        if not self.writer.isOpened():
+            self.error = f"Could not open a {self.fourcc} video writer for {width}x{height}"
+            print(f"[ERROR] {self.error}, stopping the recording")
+            return False
+        return True
+
+    def _encode_loop(self):
+        # Keep going after stop() until the pending frames are flushed
+        while self.is_running or self.pending.qsize() > 0:
+            try:
+                slot, timestamp = self.pending.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            frame = self.slots[slot]
+            if self.writer is None:
+                if not self._open_writer(frame):
+                    # Nothing reaches the file, acquire() refuses the rest
+                    self.is_running = False
+                    break
+                self.start_time = timestamp
+
+            if (frame.shape[1], frame.shape[0]) != self.frame_size:
+                frame = cv2.resize(frame, self.frame_size)
+
+            # Convert RGB -> BGR before writing, then the slot is free for the worker
+            self.bgr = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR, dst=self.bgr)
+            self.free_slots.put(slot)
+
+            # Constant frame rate: fill every slot up to this frame's timestamp
+            frame_slot = int(round((timestamp - self.start_time) * self.fps))
+            while self.frame_count <= frame_slot:
+                self.writer.write(self.bgr)
+                self.frame_count += 1
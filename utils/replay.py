@@ -0,0 +1,230 @@
+import queue
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+
+class ReplayBuffer:
+    """
+    Always-on instant replay: the last `seconds` of processed frames, kept as
+    JPEG (or PNG) in memory.
+
+    The processing worker copies a frame into one of a few preallocated slots
+    (acquire/commit) and an encoder thread compresses it, so neither the worker
+    nor the Tk thread ever encodes. When the encoder falls behind, no slot is
+    free and the frame is simply not kept. Frames older than `seconds` or over
+    `memory_budget_mb` are dropped from the front, so the stored clip can be
+    shorter than `seconds` at high resolutions.
+    """
+
+    def __init__(self, seconds=30, fps=30, memory_budget_mb=256, codec=".jpg", quality=85, slots=3):
+        self.seconds = seconds
+        self.fps = fps
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self.codec = codec
+        if codec == ".png":
+            self.encode_params = [cv2.IMWRITE_PNG_COMPRESSION, 3]
+        else:
+            self.encode_params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+
+        # (timestamp, encoded frame)
+        self.frames = deque()
+        self.stored_bytes = 0
+        self.lock = threading.Lock()
+
+        # Copy slots handed between the worker and the encoder thread
+        self.slots = [None] * slots
+        self.free_slots = queue.Queue()
+        for index in range(slots):
+            self.free_slots.put(index)
+        self.pending = queue.Queue()
+
+        self.last_accepted = None
+        self.dropped = 0
+        self.encoded = 0
+        self.raw_bytes = 0
+        self.encode_time = 0.0
+
+        self.is_running = False
+        self.thread = None
+
+    def start(self):
+        self.is_running = True
+        self.thread = threading.Thread(target=self._encode_loop, name="replay", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.is_running = False
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def acquire(self, shape, timestamp):
+        """
+        Processing worker. Returns (slot, buffer) to write an HxWx3 RGB frame
+        into, or (None, None) when this frame is not kept (over the replay fps,
+        or the encoder is still busy with every slot). Never blocks.
+        """
+        if not self.is_running:
+            return None, None
+        if self.last_accepted is not None and timestamp - self.last_accepted < 0.9 / self.fps:
+            return None, None
+
+        try:
+            slot = self.free_slots.get_nowait()
+        except queue.Empty:
+            self.dropped += 1
+            return None, None
+
+        buffer = self.slots[slot]
+        if buffer is None or buffer.shape != tuple(shape):
+            buffer = np.empty(shape, dtype=np.uint8)
+            self.slots[slot] = buffer
+        self.last_accepted = timestamp
+        return slot, buffer
+
+    def commit(self, slot, timestamp):
+        # The slot's buffer is filled, hand it to the encoder
+        self.pending.put((slot, timestamp))
+
+    def _encode_loop(self):
+        bgr = None
+        while self.is_running:
+            try:
+                slot, timestamp = self.pending.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            start = time.perf_counter()
+            frame = self.slots[slot]
+            if bgr is None or bgr.shape != frame.shape:
+                bgr = np.empty_like(frame)
+            cv2.cvtColor(frame, cv2.COLOR_RGB2BGR, dst=bgr)
+            self.free_slots.put(slot)
+
+            ok, encoded = cv2.imencode(self.codec, bgr, self.encode_params)
+            if not ok:
+                print("[ERROR] Could not encode replay frame")
+                continue
+
+            with self.lock:
+                self.frames.append((timestamp, encoded))
+                self.stored_bytes += encoded.nbytes
+                self._trim(timestamp)
+
+            self.encoded += 1
+            self.raw_bytes += frame.nbytes
+            self.encode_time += time.perf_counter() - start
+
+    def _trim(self, newest):
+        # Lock held
+        while self.frames and (newest - self.frames[0][0] > self.seconds or self.stored_bytes > self.memory_budget):
+            _, encoded = self.frames.popleft()
+            self.stored_bytes -= encoded.nbytes
+
+    def clear(self):
+        with self.lock:
+            self.frames.clear()
+            self.stored_bytes = 0
+
+    def get_stats(self):
+        with self.lock:
+            count = len(self.frames)
+            stored = self.stored_bytes
+            duration = self.frames[-1][0] - self.frames[0][0] if count > 1 else 0.0
+
+        raw_per_frame = self.raw_bytes / self.encoded if self.encoded else 0.0
+        return {
+            "frames": count,
+            "seconds": duration,
+            "stored_bytes": stored,
+            "budget_bytes": self.memory_budget,
+            # Raw size of the same frames over their compressed size
+            "compression_ratio": raw_per_frame * count / stored if stored else 0.0,
+            "encode_ms": 1000.0 * self.encode_time / self.encoded if self.encoded else 0.0,
+            "dropped": self.dropped,
+        }
+
+    def snapshot(self, seconds=None):
+        # The newest `seconds` of encoded frames; the arrays are never modified, no copy needed
+        with self.lock:
+            frames = list(self.frames)
+        if seconds is not None and frames:
+            newest = frames[-1][0]
+            frames = [item for item in frames if newest - item[0] <= seconds]
+        return frames
+
+    def save(self, file_path, seconds=30, fourcc="mp4v"):
+        """
+        Writes the newest `seconds` to a video file on a background thread and
+        returns a ReplayExport right away; the live feed keeps running.
+        """
+        export = ReplayExport(file_path, self.snapshot(seconds), self.fps, fourcc)
+        export.start()
+        return export
+
+
+class ReplayExport:
+    """
+    Decodes a replay snapshot into a video file at a constant frame rate,
+    the same way VideoRecorder does: frames are repeated to fill the gaps.
+    """
+
+    def __init__(self, file_path, frames, fps, fourcc="mp4v"):
+        self.file_path = file_path
+        self.frames = frames
+        self.fps = fps
+        self.fourcc = fourcc
+        self.frame_count = 0
+        self.error = None
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._write, name="replay_export", daemon=True)
+        self.thread.start()
+
+    def is_done(self):
+        return self.thread is not None and not self.thread.is_alive()
+
+    def wait(self):
+        if self.thread:
+            self.thread.join()
+        return self.error is None
+
+    def _write(self):
+        if not self.frames:
+            self.error = "Replay buffer is empty"
+            print(f"[ERROR] {self.error}")
+            return
+
+        writer = None
+        frame_size = None
+        start_time = self.frames[0][0]
+        try:
+            for timestamp, encoded in self.frames:
+                frame = cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+                if writer is None:
+                    frame_size = (frame.shape[1], frame.shape[0])
+                    writer = cv2.VideoWriter(self.file_path, cv2.VideoWriter_fourcc(*self.fourcc), self.fps,
+                                             frame_size)
+                    if not writer.isOpened():
+                        self.error = "Could not open video writer"
+                        print(f"[ERROR] {self.error}")
+                        return
+
+                # The capture size can change mid-clip (quality governor)
+                if (frame.shape[1], frame.shape[0]) != frame_size:
+                    frame = cv2.resize(frame, frame_size)
+
+                slot = int(round((timestamp - start_time) * self.fps))
+                while self.frame_count <= slot:
+                    writer.write(frame)
+                    self.frame_count += 1
+        finally:
+            if writer is not None:
+                writer.release()
+            # Let the encoded frames go as soon as the file is written
+            self.frames = []
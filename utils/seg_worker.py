@@ -0,0 +1,325 @@
+import multiprocessing
+import time
+from collections import deque
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class FrameRing:
+    """
+    `slots` x (RGB frame, mask) in one shared memory block, sized for frames of
+    up to max_pixels. Both processes map the same memory, arrays never go
+    through a pipe.
+    """
+
+    def __init__(self, slots, max_pixels, name=None):
+        self.slots = slots
+        self.max_pixels = max_pixels
+        # 3 bytes of frame + 1 byte of mask per pixel
+        self.slot_bytes = 4 * max_pixels
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=slots * self.slot_bytes)
+        self.name = self.shm.name
+
+    def frame(self, slot, h, w):
+        return np.ndarray((h, w, 3), dtype=np.uint8, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+
+    def mask(self, slot, h, w):
+        offset = slot * self.slot_bytes + 3 * self.max_pixels
+        return np.ndarray((h, w), dtype=np.uint8, buffer=self.shm.buf, offset=offset)
+
+    def close(self, unlink=False):
+        try:
+            self.shm.close()
+        except BufferError:
+            pass  # A mask view is still referenced somewhere; unmapped once it is gone
+        if unlink:
+            self.shm.unlink()
+
+
+def _worker_main(conn, ring_name, slots, max_pixels, backend, segmenter_kwargs, options):
+    # Worker process: segments the ring slots it is told about, in order
+    from processing.segmenter import PersonSegmenter
+
+    ring = FrameRing(slots, max_pixels, name=ring_name)
+    try:
+        segmenter = PersonSegmenter(backend=backend, **segmenter_kwargs)
+        _apply_options(segmenter, options)
+        # Model warm-up (graph init, allocations) before reporting ready
+        segmenter.segmenter.process(np.zeros((144, 256, 3), dtype=np.uint8))
+    except Exception as e:
+        conn.send(("error", str(e)))
+        ring.close()
+        return
+    conn.send(("ready",))
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break  # Parent went away
+
+        if message[0] == "frame":
+            _, slot, h, w, frame_id = message
+            mask = segmenter.get_mask(ring.frame(slot, h, w))
+            np.copyto(ring.mask(slot, h, w), mask)
+            conn.send(("mask", slot, frame_id, segmenter.get_motion_score()))
+        elif message[0] == "options":
+            _apply_options(segmenter, message[1])
+        elif message[0] == "stop":
+            break
+
+    del segmenter
+    ring.close()
+
+
+def _apply_options(segmenter, options):
+    for name, value in options.items():
+        if name == "processing_scale":
+            segmenter.set_processing_scale(value)
+        else:
+            setattr(segmenter, name, value)
+
+
+class ProcessSegmenter:
+    """
+    PersonSegmenter running in a worker process, so inference and the mask
+    morphology never hold this interpreter's GIL (and the Tk loop stays smooth).
+
+    Frames are copied into a shared memory ring and masks come back in the same
+    slot; the pipe only carries small (slot, size, frame id) tuples. Used either
+    like a PersonSegmenter (get_mask, blocking) or pipelined with
+    segment_async(): frame N is sent before frame N-1's mask is picked up, so
+    the worker segments N while the caller composites N-1.
+
+    The worker is restarted when it dies or stops answering; frames in flight
+    are lost and is_ready() is False until the new model is warmed up. If the
+    model cannot be created, the worker is restarted once with `fallback` (as
+    LazyBackend does); when that fails too, on_error gets the message and
+    get_mask keeps returning the all-person mask.
+    """
+
+    def __init__(self, backend=None, slots=3, max_size=(1920, 1080), reply_timeout=5.0, on_ready=None,
+                 fallback="classical_mog2", on_error=None, **segmenter_kwargs):
+        # backend must be a backend name here, it is created in the worker
+        self.backend = backend
+        self.fallback = fallback
+        self.on_error = on_error
+        self.slots = slots
+        self.max_pixels = max_size[0] * max_size[1]
+        self.reply_timeout = reply_timeout
+        self.on_ready = on_ready
+        self.segmenter_kwargs = segmenter_kwargs
+
+        # Mirrors of the PersonSegmenter settings LiveFeed changes, resent after a restart
+        self.options = {
+            "processing_scale": segmenter_kwargs.pop("processing_scale", 1.0),
+            "skin_recovery": True,
+        }
+
+        self.context = multiprocessing.get_context("spawn")
+        self.process = None
+        self.conn = None
+        self.ring = None
+
+        self.ready = False
+        self.error = None
+        self.restarts = 0
+        self.motion_score = 0.0
+        self.fallback_mask = None
+
+        # (slot, frame_id, h, w, keep) in submission order, the worker answers in order
+        self.in_flight = deque()
+        self.free_slots = []
+        # Slot whose mask the caller is still using, freed on the next submit
+        self.held_slot = None
+
+    # --- PersonSegmenter interface ---
+
+    @property
+    def processing_scale(self):
+        return self.options["processing_scale"]
+
+    def set_processing_scale(self, processing_scale):
+        self._set_option("processing_scale", processing_scale)
+
+    @property
+    def skin_recovery(self):
+        return self.options["skin_recovery"]
+
+    @skin_recovery.setter
+    def skin_recovery(self, skin_recovery):
+        self._set_option("skin_recovery", skin_recovery)
+
+    def get_motion_score(self):
+        # Of the frame whose mask was returned last
+        return self.motion_score
+
+    def get_mask(self, frame_rgb):
+        """
+        Blocking: segments frame_rgb in the worker. The mask is a view into
+        shared memory, valid until the next call. While the worker is
+        (re)starting the mask is all person, i.e. no effect.
+        """
+        if self.is_ready() and self.submit(frame_rgb):
+            result = self.collect()
+            if result is not None:
+                return result[2]
+
+        h, w = frame_rgb.shape[:2]
+        if self.fallback_mask is None or self.fallback_mask.shape != (h, w):
+            self.fallback_mask = np.full((h, w), 255, dtype=np.uint8)
+        return self.fallback_mask
+
+    def is_ready(self):
+        # Status messages first: a worker that failed to load has exited after sending its error
+        try:
+            while not self.ready and self.conn is not None and self.conn.poll():
+                self._handle(self.conn.recv())
+        except (EOFError, OSError):
+            pass
+        if self.process is not None and not self.process.is_alive() and self.error is None:
+            self._restart(f"exited with code {self.process.exitcode}")
+        return self.ready
+
+    # --- Worker management ---
+
+    def start(self):
+        self.ring = FrameRing(self.slots, self.max_pixels)
+        self.conn, child_conn = self.context.Pipe()
+        self.process = self.context.Process(
+            target=_worker_main, name="segmentation_worker", daemon=True,
+            args=(child_conn, self.ring.name, self.slots, self.max_pixels, self.backend, self.segmenter_kwargs,
+                  dict(self.options)),
+        )
+        self.process.start()
+        child_conn.close()
+
+        self.ready = False
+        self.in_flight.clear()
+        self.free_slots = list(range(self.slots))
+        self.held_slot = None
+        return self
+
+    def stop(self):
+        if self.process is None:
+            return
+        try:
+            self.conn.send(("stop",))
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=2.0)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.conn.close()
+        self.ring.close(unlink=True)
+        self.process = None
+        self.ready = False
+
+    def _restart(self, reason, max_pixels=None):
+        print(f"[ERROR] Segmentation worker {reason}, restarting")
+        self.restarts += 1
+        self.stop()
+        if max_pixels is not None:
+            self.max_pixels = max_pixels
+        self.start()
+
+    def _set_option(self, name, value):
+        self.options[name] = value
+        if self.conn is not None and self.process is not None and self.process.is_alive():
+            self.conn.send(("options", {name: value}))
+
+    def _handle(self, message):
+        # Returns the message when it is a mask, handles status messages
+        if message[0] == "ready":
+            self.ready = True
+            print(f"[INFO] Segmentation worker ready (pid {self.process.pid})")
+            if self.on_ready is not None:
+                self.on_ready(self)
+        elif message[0] == "error":
+            if self.fallback is not None and self.backend != self.fallback:
+                print(f"[ERROR] Segmentation worker could not start {self.backend}: {message[1]}, "
+                      f"falling back to {self.fallback}")
+                self.backend = self.fallback
+                self.stop()
+                self.start()
+                return None
+            self.error = message[1]
+            print(f"[ERROR] Segmentation worker could not start: {self.error}")
+            if self.on_error is not None:
+                self.on_error(self, self.error)
+        elif message[0] == "mask":
+            return message
+        return None
+
+    # --- Frames ---
+
+    def submit(self, frame_rgb, frame_id=None, keep=None):
+        """
+        Copies the frame into a free slot and sends it to the worker. Returns
+        False when every slot is busy. `keep` comes back with the mask.
+        """
+        if self.held_slot is not None:
+            self.free_slots.append(self.held_slot)
+            self.held_slot = None
+
+        h, w = frame_rgb.shape[:2]
+        if h * w > self.max_pixels:
+            self._restart(f"ring too small for {w}x{h}", max_pixels=h * w)
+            return False
+        if not self.free_slots:
+            return False
+
+        slot = self.free_slots.pop()
+        np.copyto(self.ring.frame(slot, h, w), frame_rgb)
+        try:
+            self.conn.send(("frame", slot, h, w, frame_id))
+        except (BrokenPipeError, OSError):
+            self._restart("pipe closed")
+            return False
+        self.in_flight.append((slot, frame_id, h, w, keep))
+        return True
+
+    def collect(self, timeout=None):
+        """
+        Waits for the oldest frame in flight. Returns (keep, frame_id, mask),
+        or None when nothing is in flight or the worker had to be restarted.
+        """
+        if not self.in_flight:
+            return None
+
+        deadline = time.perf_counter() + (timeout if timeout is not None else self.reply_timeout)
+        message = None
+        while message is None:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining <= 0 or not self.conn.poll(remaining):
+                    self._restart("stopped answering")
+                    return None
+                message = self._handle(self.conn.recv())
+            except (EOFError, OSError):
+                self._restart("died")
+                return None
+
+        _, slot, frame_id, motion_score = message
+        expected_slot, expected_id, h, w, keep = self.in_flight.popleft()
+        if slot != expected_slot:
+            self._restart("answered out of order")
+            return None
+
+        self.motion_score = motion_score
+        self.held_slot = slot
+        return keep, frame_id, self.ring.mask(slot, h, w)
+
+    def segment_async(self, frame_rgb, frame_id=None, depth=2, keep=None):
+        """
+        Pipelined segmentation: sends this frame and returns (keep, frame_id,
+        mask) of the frame `depth - 1` submissions back, None while the
+        pipeline fills. `keep` is frame_rgb of that older frame unless given.
+        """
+        if not self.submit(frame_rgb, frame_id, keep=frame_rgb if keep is None else keep):
+            return None
+        if len(self.in_flight) < depth:
+            return None
+        return self.collect()
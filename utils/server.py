@@ -0,0 +1,404 @@
+import json
+import os
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+
+from processing.buffer_pool import BufferPool
+from utils.batch import build_processor
+from utils.perf_trace import PerfTracer
+from utils.pipeline import DropOldestQueue
+
+
+def open_source(source):
+    # "0", "1", ... are camera indexes, anything else a file or stream URL
+    return cv2.VideoCapture(int(source)) if source.isdigit() else cv2.VideoCapture(source)
+
+
+class Stream:
+    """
+    One source with its own processor (segmenter, effect chain, cameraman).
+
+    The capture thread keeps only the newest frame (DropOldestQueue(1)), so a
+    stream the workers cannot keep up with drops frames instead of queueing
+    them. Outputs are published as JPEG only while someone is watching.
+    """
+
+    def __init__(self, name, source, processor, output_size=None, jpeg_quality=80, loop_files=True):
+        self.name = name
+        self.source = source
+        self.processor = processor
+        self.output_size = tuple(output_size) if output_size else None
+        self.encode_params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+        self.loop_files = loop_files
+        self.is_file = not source.isdigit() and os.path.exists(source)
+
+        self.tracer = PerfTracer()
+        processor.tracer = self.tracer
+
+        self.frames = DropOldestQueue(1)
+        # Guards `scheduled`: at most one frame per stream is with the workers,
+        # the segmenter and cameraman state must see frames in order
+        self.lock = threading.Lock()
+        self.scheduled = False
+
+        # Newest JPEG; clients wait on the condition for a newer frame_id
+        self.output = None
+        self.output_id = -1
+        self.output_cond = threading.Condition()
+        self.clients = 0
+
+        self.cap = None
+        self.thread = None
+        self.is_running = False
+        self.error = None
+        # Output buffers, per worker thread
+        self.buffers = BufferPool()
+        self.read_buffer = None
+        self.captured_count = 0
+        self.processed_count = 0
+        self.encoded_count = 0
+
+    def start(self, schedule):
+        self.is_running = True
+        self.thread = threading.Thread(target=self._capture_loop, args=(schedule,), name=f"capture_{self.name}",
+                                       daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        # The capture thread releases the source itself, a read can outlast the join
+        self.is_running = False
+        if self.thread:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+        with self.output_cond:
+            self.output_cond.notify_all()
+
+    def _capture_loop(self, schedule):
+        self.cap = open_source(self.source)
+        try:
+            if not self.cap.isOpened():
+                self.error = f"Could not open {self.source}"
+                print(f"[ERROR] Stream {self.name}: {self.error}")
+                return
+            self._read_frames(schedule)
+        finally:
+            self.cap.release()
+            # Clients waiting for a frame see the stream is gone
+            self.is_running = False
+            with self.output_cond:
+                self.output_cond.notify_all()
+
+    def _read_frames(self, schedule):
+        # Files are paced at their own frame rate, cameras deliver at theirs
+        interval = 1.0 / (self.cap.get(cv2.CAP_PROP_FPS) or 30) if self.is_file else 0.0
+        next_time = time.perf_counter()
+
+        while self.is_running:
+            ret, frame = self.cap.read(self.read_buffer)
+            if not ret:
+                if self.is_file and self.loop_files:
+                    self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    continue
+                time.sleep(0.01)
+                continue
+
+            self.read_buffer = frame
+
+            capture_time = time.perf_counter()
+            # A fresh array per frame: with shared workers there is no bound on how
+            # long a frame waits, so a reused ring slot could be overwritten under it
+            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            frame_id = self.tracer.begin_frame(capture_time)
+            self.captured_count += 1
+
+            self.frames.put((frame_id, rgb_frame))
+            with self.lock:
+                if not self.scheduled:
+                    self.scheduled = True
+                    schedule(self)
+
+            if interval:
+                next_time += interval
+                time.sleep(max(0.0, next_time - time.perf_counter()))
+                next_time = max(next_time, time.perf_counter() - interval)
+
+    def process_next(self):
+        """
+        Worker thread: processes the newest frame, publishes it, and returns True
+        when another frame arrived meanwhile (the stream goes back in the queue).
+        """
+        item = self.frames.get_latest()
+        if item is not None:
+            frame_id, rgb_frame = item
+            processed_frame, _, rect = self.processor.process_uncropped(rgb_frame, frame_id)
+            self.processed_count += 1
+
+            if self.clients > 0:
+                with self.tracer.stage(frame_id, "encode"):
+                    size = self.output_size or (rgb_frame.shape[1], rgb_frame.shape[0])
+                    out = self.buffers.get("output", (size[1], size[0], 3))
+                    output = self.processor.crop(processed_frame, rect, size, out)
+                    bgr = cv2.cvtColor(output, cv2.COLOR_RGB2BGR, dst=self.buffers.get("output_bgr", output.shape))
+                    ok, encoded = cv2.imencode(".jpg", bgr, self.encode_params)
+                if ok:
+                    self.encoded_count += 1
+                    self.publish(frame_id, encoded.tobytes())
+
+        with self.lock:
+            if self.frames.qsize() > 0:
+                return True
+            self.scheduled = False
+            return False
+
+    def publish(self, frame_id, jpeg):
+        with self.output_cond:
+            self.output = jpeg
+            self.output_id = frame_id
+            self.output_cond.notify_all()
+        self.tracer.mark_displayed(frame_id)
+
+    def wait_output(self, last_id, timeout=1.0):
+        # (frame_id, jpeg) newer than last_id, or None on timeout / stop
+        with self.output_cond:
+            if self.output_id <= last_id and self.is_running:
+                self.output_cond.wait(timeout)
+            if self.output_id <= last_id:
+                return None
+            return self.output_id, self.output
+
+    def add_client(self, amount):
+        with self.lock:
+            self.clients += amount
+
+    def get_stats(self):
+        summary = self.tracer.summary()
+        return {
+            "source": self.source,
+            "error": self.error,
+            "captured": self.captured_count,
+            "processed": self.processed_count,
+            "encoded": self.encoded_count,
+            "dropped": self.frames.dropped,
+            "clients": self.clients,
+            "fps": summary["fps"],
+            "latency": summary["latency"],
+            "stages": summary["stages"],
+        }
+
+
+class StreamServer:
+    """
+    Headless mode: several sources processed by one shared pool of worker
+    threads (OpenCV and the models release the GIL), served as MJPEG over a
+    localhost HTTP port:
+
+        /                       index page with every stream
+        /stream/<name>.mjpg     multipart MJPEG
+        /snapshot/<name>.jpg    newest frame
+        /stats                  per-stream counters and timings (JSON)
+
+    Streams with a frame waiting go through a FIFO, so the workers serve them
+    round-robin. A slow HTTP client only ever gets the newest frame.
+    """
+
+    def __init__(self, sources, effect_spec="blur", workers=None, host="127.0.0.1", port=8080,
+                 use_cameraman=True, backend=None, output_size=None, jpeg_quality=80, keyframe_mode=False):
+        self.streams = {}
+        for index, source in enumerate(sources):
+            name = f"cam{index}"
+            processor = build_processor(effect_spec, use_cameraman, backend, keyframe_mode=keyframe_mode)
+            self.streams[name] = Stream(name, source, processor, output_size, jpeg_quality)
+
+        self.workers = workers or min(len(self.streams), os.cpu_count() or 1)
+        self.ready = queue.Queue()
+        self.worker_threads = []
+        self.busy = 0
+        self.busy_lock = threading.Lock()
+        self.is_running = False
+
+        self.http = ThreadingHTTPServer((host, port), _make_handler(self))
+        self.http.daemon_threads = True
+        self.http_thread = None
+        self.started = None
+
+    @property
+    def url(self):
+        host, port = self.http.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.is_running = True
+        self.started = time.time()
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"worker{index}", daemon=True)
+            thread.start()
+            self.worker_threads.append(thread)
+        for stream in self.streams.values():
+            stream.start(self.ready.put)
+
+        self.http_thread = threading.Thread(target=self.http.serve_forever, name="http", daemon=True)
+        self.http_thread.start()
+        print(f"[INFO] Serving {len(self.streams)} streams with {self.workers} workers on {self.url}")
+        for name, stream in self.streams.items():
+            print(f"[INFO]   {self.url}/stream/{name}.mjpg  <- {stream.source}")
+
+    def stop(self):
+        self.is_running = False
+        self.http.shutdown()
+        self.http.server_close()
+        for stream in self.streams.values():
+            stream.stop()
+        for thread in self.worker_threads:
+            thread.join(timeout=1.0)
+        self.worker_threads = []
+
+    def serve_forever(self):
+        self.start()
+        try:
+            while True:
+                time.sleep(1.0)
+        except KeyboardInterrupt:
+            print("[INFO] Stopping")
+        finally:
+            self.stop()
+
+    def _worker_loop(self):
+        while self.is_running:
+            try:
+                stream = self.ready.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            with self.busy_lock:
+                self.busy += 1
+            try:
+                again = stream.process_next()
+            except Exception as e:
+                print(f"[ERROR] Stream {stream.name}: frame processing failed: {e}")
+                with stream.lock:
+                    again = stream.frames.qsize() > 0
+                    stream.scheduled = again
+            finally:
+                with self.busy_lock:
+                    self.busy -= 1
+
+            if again:
+                self.ready.put(stream)
+
+    def get_stats(self):
+        return {
+            "uptime_s": time.time() - self.started if self.started else 0.0,
+            "workers": self.workers,
+            "busy_workers": self.busy,
+            "ready_streams": self.ready.qsize(),
+            "streams": {name: stream.get_stats() for name, stream in self.streams.items()},
+        }
+
+
+def _make_handler(server):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass  # One line per MJPEG part would drown the console
+
+        def do_GET(self):
+            path = self.path.split("?")[0]
+            if path == "/":
+                self._send_index()
+            elif path == "/stats":
+                self._send(200, "application/json", json.dumps(server.get_stats(), indent=2).encode("utf-8"))
+            elif path.startswith("/stream/") and path.endswith(".mjpg"):
+                self._send_mjpeg(path[len("/stream/"):-len(".mjpg")])
+            elif path.startswith("/snapshot/") and path.endswith(".jpg"):
+                self._send_snapshot(path[len("/snapshot/"):-len(".jpg")])
+            else:
+                self._send(404, "text/plain", b"Not found")
+
+        def _send(self, status, content_type, body):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_index(self):
+            items = "".join(f'<h3>{name}: {stream.source}</h3><img src="/stream/{name}.mjpg">'
+                            for name, stream in server.streams.items())
+            body = f'<html><body>{items}<p><a href="/stats">stats</a></p></body></html>'
+            self._send(200, "text/html", body.encode("utf-8"))
+
+        def _watch(self, name):
+            stream = server.streams.get(name)
+            if stream is None:
+                self._send(404, "text/plain", b"Unknown stream")
+            elif stream.error is not None:
+                # The source never opened, there will be no frames
+                self._send(503, "text/plain", stream.error.encode("utf-8"))
+                return None
+            return stream
+
+        def _send_snapshot(self, name):
+            stream = self._watch(name)
+            if stream is None:
+                return
+            # The stored frame is stale when nobody was watching, wait for a new one
+            stream.add_client(1)
+            try:
+                result = stream.wait_output(stream.output_id, timeout=2.0)
+            finally:
+                stream.add_client(-1)
+            if result is None and stream.output is not None:
+                result = stream.output_id, stream.output
+            if result is None:
+                self._send(503, "text/plain", b"No frame yet")
+                return
+            self._send(200, "image/jpeg", result[1])
+
+        def _send_mjpeg(self, name):
+            stream = self._watch(name)
+            if stream is None:
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=frame")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+
+            stream.add_client(1)
+            last_id = -1
+            try:
+                while server.is_running and stream.is_running:
+                    result = stream.wait_output(last_id)
+                    if result is None:
+                        continue
+                    last_id, jpeg = result
+                    self.wfile.write(b"--frame\r\nContent-Type: image/jpeg\r\n")
+                    self.wfile.write(f"Content-Length: {len(jpeg)}\r\n\r\n".encode("ascii"))
+                    self.wfile.write(jpeg)
+                    self.wfile.write(b"\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # Client went away
+            finally:
+                stream.add_client(-1)
+
+    return Handler
+
+
+def run_server(sources, effect_spec="blur", workers=None, port=8080, use_cameraman=True, backend=None,
+               output_size=None, jpeg_quality=80, keyframe_mode=False):
+    # Fail early on a bad spec instead of inside every stream
+    from utils.batch import parse_effect_spec
+
+    parse_effect_spec(effect_spec)
+    try:
+        server = StreamServer(sources, effect_spec, workers, port=port, use_cameraman=use_cameraman,
+                              backend=backend, output_size=output_size, jpeg_quality=jpeg_quality,
+                              keyframe_mode=keyframe_mode)
+    except OSError as e:
+        print(f"[ERROR] Could not listen on port {port}: {e}")
+        return None
+    server.serve_forever()
+    return server
@@ -0,0 +1,52 @@
+import hashlib
+import os
+
+from PIL import Image
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "background-filter-app", "thumbnails")
+
+
+class ThumbnailCache:
+    """
+    Sidebar thumbnails stored on disk as small PNGs, keyed by the source path,
+    its mtime and size and the thumbnail size: editing or replacing an image
+    gives it a new key, so stale entries are never read (just left behind).
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, size=(260, 100)):
+        self.cache_dir = cache_dir
+        self.size = tuple(size)
+        self.hits = 0
+        self.misses = 0
+
+    def _cache_path(self, path):
+        stat = os.stat(path)
+        key = f"{os.path.abspath(path)}|{stat.st_mtime_ns}|{stat.st_size}|{self.size[0]}x{self.size[1]}"
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".png")
+
+    def get(self, path):
+        cache_path = self._cache_path(path)
+        if os.path.exists(cache_path):
+            try:
+                img = Image.open(cache_path)
+                img.load()
+                self.hits += 1
+                return img
+            except Exception:
+                pass  # Broken entry, rebuilt below
+
+        img = Image.open(path)
+        # JPEG decodes straight at 1/2, 1/4 or 1/8 scale when that is still larger than the thumbnail
+        img.draft("RGB", self.size)
+        img = img.convert("RGB").resize(self.size)
+        self.misses += 1
+
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Written next to the entry and renamed, a crash never leaves half a file
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            img.save(tmp_path, format="PNG")
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            print(f"[ERROR] Could not cache thumbnail for {path}: {e}")
+        return img